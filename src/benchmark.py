@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import traceback
+import subprocess
+from dataclasses import asdict
+
+import matplotlib
+matplotlib.use('Agg')
+
+import instrumentation
+
+# Per-stage timings of the pipeline on a synthetic corpus.
+#
+# A corpus is generated into a scratch directory laid out like the repo
+# (data/rli_public_set, data/onet, data/cache), the process works from that
+# directory, and each stage is timed through the same entry point the
+# pipeline runs: build_master_dataset, decompose_projects,
+# run_hardened_analysis and render_figures. A stage whose input stage failed
+# is skipped. Results go to a JSON file; --compare reports per-stage
+# slowdowns against an earlier result.
+
+BENCH_DIR = 'output/benchmarks'
+ONET_PATH = 'data/onet/ai_applicability_scores.csv'  # Read by the master stage, copied into the scratch directory
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, after=()):
+        """
+        Times func() as stage name; func returns the number of items it
+        processed (or None). A stage whose prerequisites in after failed or
+        were skipped is itself skipped and recorded as such.
+        """
+        blocked = [d for d in after if self.stages.get(d, {}).get('seconds') is None
+                   or 'error' in self.stages[d]]
+        if blocked:
+            entry = {'items': None, 'seconds': None, 'skipped': f"needs {', '.join(blocked)}"}
+            print(f"[bench] {name} skipped ({entry['skipped']})")
+            self.stages[name] = entry
+            return entry
+        print(f"[bench] {name} ...", flush=True)
+        entry = {'items': None}
+        t0 = time.perf_counter()
+        try:
+            entry['items'] = func()
+        except Exception as e:
+            entry['error'] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            print(f"[bench] {name} failed: {entry['error']}")
+        entry['seconds'] = time.perf_counter() - t0
+        if entry.get('items'):
+            entry['per_item_ms'] = 1000 * entry['seconds'] / entry['items']
+        self.stages[name] = entry
+        return entry
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(spec, n_draws=1000, n_boot=50, workers=1):
+    """
+    Generates a corpus under the current directory, runs every pipeline stage
+    through its entry point and returns the result dict.
+    """
+    # Imported after the caller has moved into the scratch directory
+    from synthetic_corpus import generate_corpus
+    from corpus_cache import walk_files
+    from columnar import SUBTASK_PATH, read_dataset
+    from process_master import build_master_dataset
+    from decomposition_layer_v2 import decompose_projects
+    from final_scientific_model_v2 import run_hardened_analysis
+    from figures import render_figures
+
+    timer = StageTimer()
+    root = os.path.join('data', 'rli_public_set')
+    meta = []
+
+    def generate():
+        meta.append(generate_corpus(root, spec))
+        return spec.n_tasks
+
+    def analysis():
+        run_hardened_analysis(n_iterations=n_draws, seed=0, fresh=True)
+        return n_draws
+
+    # Cold cache: the master stage decodes and tokenizes every deliverable
+    timer.run('generate', generate)
+    timer.run('master', lambda: len(build_master_dataset(workers=workers)), after=['generate'])
+    timer.run('decomposition', lambda: decompose_projects(workers=workers, resume=False), after=['master'])
+    timer.run('analysis', analysis, after=['decomposition'])
+    timer.run('figures', lambda: len(render_figures(workers=workers, kink_boot=n_boot)), after=['decomposition'])
+
+    corpus = {'tasks': spec.n_tasks}
+    if meta:
+        corpus['files'] = sum(len(walk_files(os.path.join(root, t, 'human_deliverable'))) for t in meta[0]['Task ID'])
+    if os.path.exists(SUBTASK_PATH):
+        included = read_dataset(SUBTASK_PATH, ['included'])['included']
+        corpus.update(requirements=len(included), included=int(included.sum()))
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'spec': asdict(spec),
+        'params': {'n_draws': n_draws, 'n_boot': n_boot, 'workers': workers},
+        'corpus': corpus,
+        'stages': timer.stages,
+    }
+
+
+def compare(result, baseline, threshold=1.2):
+    """Prints per-stage time ratios against a baseline result; returns the names of regressed stages."""
+    regressed = []
+    for name, entry in result['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or not entry['seconds'] or not base['seconds'] or 'error' in entry or 'error' in base:
+            continue
+        ratio = entry['seconds'] / base['seconds']
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print(f"{name:>14}: {base['seconds']:8.3f}s -> {entry['seconds']:8.3f}s  x{ratio:.2f}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    from synthetic_corpus import CorpusSpec
+
+    defaults = CorpusSpec()
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on a synthetic corpus.")
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument('--draws', type=int, default=1000, help="Bootstrap replicates")
+    parser.add_argument('--kink-boot', type=int, default=50, help="Bootstrap replicates for the kink CI")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for the parallel stages (0 = all cores)")
+    parser.add_argument('--workdir', default=None, help="Scratch directory (default: a temporary one)")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch directory")
+    parser.add_argument('--out', default=None, help="Result JSON path (default: output/benchmarks/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Baseline result JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.draws < 1:
+        parser.error("--draws must be at least 1")
+    # Paths are resolved before moving into the scratch directory
+    instrumentation.configure(args)
+
+    spec = CorpusSpec(**{k: getattr(args, k) for k in asdict(defaults)})
+    repo_dir = os.getcwd()
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='rli_bench_'))
+    os.makedirs(os.path.join(workdir, os.path.dirname(ONET_PATH)), exist_ok=True)
+    shutil.copy(ONET_PATH, os.path.join(workdir, ONET_PATH))
+    os.chdir(workdir)
+    try:
+        result = run_benchmark(spec, n_draws=args.draws, n_boot=args.kink_boot, workers=args.workers)
+    finally:
+        os.chdir(repo_dir)
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out or os.path.join(BENCH_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+    for name, entry in result['stages'].items():
+        if entry['seconds'] is None:
+            print(f"{name:>14}:  skipped ({entry['skipped']})")
+            continue
+        print(f"{name:>14}: {entry['seconds']:8.3f}s {entry.get('error', '')}")
+    print(f"Benchmark written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(result, json.load(f), args.threshold)
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
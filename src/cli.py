@@ -0,0 +1,95 @@
+import sys
+import time
+import argparse
+import importlib
+from collections import namedtuple
+
+import instrumentation
+
+# Single command-line entry point for every stage and tool.
+#
+# Nothing heavy is imported until a command actually runs: the stage module
+# (and with it pandas, statsmodels, matplotlib, ...) is loaded on dispatch,
+# and the time spent importing it is reported next to the run time.
+#
+#   python src/cli.py --help                 # list commands
+#   python src/cli.py decompose --workers 0
+#   python src/cli.py model --help
+
+Command = namedtuple('Command', ['module', 'func', 'takes_args', 'help'])
+
+COMMANDS = {
+    'ingest': Command('ingestion_rli', 'main', False, "Download the RLI public set and extract task metadata"),
+    'master': Command('process_master', 'main', True, "Build the master dataset (entropy, coupling, wages)"),
+    'decompose': Command('decomposition_layer_v2', 'main', True, "Decompose briefs into requirement-level subtasks"),
+    'model': Command('final_scientific_model_v2', 'main', True, "Heckman-corrected translog model with bootstrap"),
+    'figures': Command('figures', 'main', True, "Render every figure in parallel from one load of the data"),
+    'hardened_visuals': Command('generate_hardened_visuals', 'generate_hardened_visuals', False,
+                                "Frontier heatmap and structural-break plot"),
+    'selection_visual': Command('generate_selection_visual', 'generate_selection_cliff', False,
+                                "Selection-cliff plot"),
+    'sweep': Command('sweep', 'main', True, "Re-run features and the model over a parameter grid"),
+    'score': Command('scoring_service', 'main', True, "Warm scoring service for new briefs (JSON lines or HTTP)"),
+    'pipeline': Command('pipeline', 'main', True, "Run the stages that are out of date"),
+    'bench': Command('benchmark', 'main', True, "Time each stage on a synthetic corpus"),
+    'synth': Command('synthetic_corpus', 'main', True, "Generate a synthetic RLI-shaped corpus"),
+}
+
+# Libraries whose import dominates startup; reported when a command loads them
+HEAVY_MODULES = ('numpy', 'pandas', 'scipy', 'statsmodels', 'matplotlib', 'seaborn', 'sklearn', 'tiktoken')
+
+
+def _loaded_heavy():
+    return {m for m in HEAVY_MODULES if m in sys.modules}
+
+
+def run_command(name, argv, report=True):
+    """Imports the command's module, runs it and reports import and run times on stderr."""
+    command = COMMANDS[name]
+    loaded = _loaded_heavy()
+    t0 = time.perf_counter()
+    with instrumentation.span(f'import:{command.module}'):
+        module = importlib.import_module(command.module)
+    import_s = time.perf_counter() - t0
+    at_import = _loaded_heavy() - loaded
+
+    t1 = time.perf_counter()
+    prog = sys.argv[0]
+    # Usage messages of the stage's own parser read "cli.py <command>"
+    sys.argv[0] = f"{prog} {name}"
+    try:
+        if not command.takes_args:
+            # Argument-less stages still answer --help
+            argparse.ArgumentParser(description=command.help).parse_args(argv)
+        with instrumentation.span(f'run:{name}'):
+            func = getattr(module, command.func)
+            return func(argv) if command.takes_args else func()
+    finally:
+        sys.argv[0] = prog
+        if report:
+            run_s = time.perf_counter() - t1
+            at_run = _loaded_heavy() - loaded - at_import
+            msg = f"[cli] {name}: import {import_s:.2f}s"
+            if at_import:
+                msg += f" ({', '.join(sorted(at_import))})"
+            msg += f", run {run_s:.2f}s"
+            if at_run:
+                msg += f" (loaded on use: {', '.join(sorted(at_run))})"
+            print(msg, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Instruction-entropy pipeline.",
+        epilog='\n'.join(f"  {n:<18} {c.help}" for n, c in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not report import/run times")
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command', help="One of the commands below")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Arguments passed to the command")
+    args = parser.parse_args(argv)
+    run_command(args.command, args.args, report=not args.quiet)
+
+
+if __name__ == "__main__":
+    main()
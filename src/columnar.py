@@ -0,0 +1,582 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+# Columnar on-disk tables for the intermediate datasets.
+#
+# A table is a directory with schema.json and one raw .bin file per numeric
+# column, loaded back as read-only np.memmap (no parsing, no copy). String
+# columns are stored as concatenated UTF-8 bytes plus an int64 offsets file
+# (and a null mask when needed). Each table sits next to its CSV export
+# (data/x.csv -> data/x.cols/) and records the CSV's size and mtime; readers
+# fall back to the CSV when the two are out of sync.
+#
+# DatasetWriter produces the same pair incrementally: typed record batches
+# are appended to both under <table>.partial/, and commit() moves them into
+# place. Its position() is a checkpoint; a writer reopened from one discards
+# whatever was appended after it, so an interrupted run can resume.
+#
+# Stages that rebuild a dataset also leave a row-level change report next to
+# it (data/x.csv -> data/x.changes.csv) listing the rows added, modified or
+# removed relative to the previous version. Tables written with a key store
+# 64-bit fingerprints of each row's values, key and group (the first key
+# column) as hidden columns; the report compares them with the previous
+# table's memory-mapped fingerprints one group at a time, and reads values
+# only for the groups that changed, so it needs neither version in memory.
+
+SCHEMA_FILE = 'schema.json'
+FORMAT_VERSION = 1
+PARTIAL_SUFFIX = '.partial'
+PREVIOUS_SUFFIX = '.previous'  # A previous version converted from its CSV for the change report
+
+ROW_HASH = '_row_hash'      # Fingerprint of a row's value columns
+KEY_HASH = '_key_hash'      # Fingerprint of its key columns
+GROUP_HASH = '_group_hash'  # Fingerprint of its first key column; groups are diffed together
+HASH_COLUMNS = (ROW_HASH, KEY_HASH, GROUP_HASH)
+DIFF_BLOCK = 1 << 20        # Fingerprints scanned at a time when locating groups
+REPORT_FLUSH = 50000        # Change-report rows buffered before they are written
+
+MASTER_PATH = 'data/master_dataset.csv'
+SUBTASK_PATH = 'data/subtask_dataset_v2.csv'
+
+
+def included_mask(df):
+    """Subtasks with positive E, kappa and log wage: the model's estimation sample (df or dict of arrays)."""
+    e, k, w = (np.asarray(df[c]) for c in ('e_hardened', 'k_hardened', 'ln_wage_eq'))
+    return ((e > 0) & (k > 0) & (w > 0)).astype(np.int8)
+
+
+# Columns a reader may request even if a table does not store them
+DERIVED = {'included': (included_mask, ['e_hardened', 'k_hardened', 'ln_wage_eq'])}
+
+
+def table_dir(csv_path):
+    return os.path.splitext(csv_path)[0] + '.cols'
+
+
+def _safe(name, i):
+    return f"{i:03d}_" + ''.join(ch if ch.isalnum() else '_' for ch in name)
+
+
+def row_fingerprints(df, key):
+    """The HASH_COLUMNS of df's rows for the key columns key: {name: uint64 array}."""
+    from pandas.util import hash_pandas_object
+    return {
+        ROW_HASH: hash_pandas_object(df, index=False).to_numpy(),
+        KEY_HASH: hash_pandas_object(df[key], index=False).to_numpy(),
+        GROUP_HASH: hash_pandas_object(df[key[0]], index=False).to_numpy(),
+    }
+
+
+def write_table(df, path, source=None, fingerprint=None):
+    """
+    Writes df as a columnar table directory; source is the CSV whose stat is
+    recorded, fingerprint the {'key', 'columns'} its HASH_COLUMNS were computed from.
+    """
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for i, name in enumerate(df.columns):
+        s = df[name]
+        stem = _safe(str(name), i)
+        if s.dtype.kind in 'biuf':
+            arr = np.ascontiguousarray(s.to_numpy())
+            arr.tofile(os.path.join(path, stem + '.bin'))
+            columns.append({'name': name, 'kind': 'numeric', 'dtype': arr.dtype.str, 'file': stem + '.bin'})
+            continue
+        nulls = s.isna().to_numpy()
+        encoded = [b'' if null else str(v).encode('utf-8') for v, null in zip(s.tolist(), nulls)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        with open(os.path.join(path, stem + '.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+        offsets.tofile(os.path.join(path, stem + '.off'))
+        entry = {'name': name, 'kind': 'string', 'file': stem + '.bin', 'offsets': stem + '.off'}
+        if nulls.any():
+            nulls.astype(np.uint8).tofile(os.path.join(path, stem + '.null'))
+            entry['nulls'] = stem + '.null'
+        columns.append(entry)
+
+    _write_schema(path, len(df), columns, source, fingerprint=fingerprint)
+
+
+def _write_schema(path, n_rows, columns, source=None, source_file=None, fingerprint=None):
+    # source_file is where the CSV is now, when it differs from its final path
+    schema = {'version': FORMAT_VERSION, 'n_rows': n_rows, 'columns': columns}
+    if fingerprint is not None:
+        schema['fingerprint'] = fingerprint
+    if source is not None:
+        st = os.stat(source_file or source)
+        schema['source'] = {'path': source, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    tmp = os.path.join(path, SCHEMA_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(tmp, os.path.join(path, SCHEMA_FILE))
+
+
+class AppendFiles:
+    """
+    A directory of append-only files. sizes() is a resumable position:
+    reopening the directory with it truncates whatever was appended later.
+    """
+
+    def __init__(self, path, sizes=None):
+        self.path = path
+        self._files = {}
+        if sizes is None:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+            self._sizes = {}
+            return
+        for name, size in sizes.items():
+            full = os.path.join(path, name)
+            if not os.path.exists(full) or os.path.getsize(full) < size:
+                raise ValueError(f"{full} is shorter than its checkpoint")
+        for name in os.listdir(path):
+            if name in sizes:
+                os.truncate(os.path.join(path, name), sizes[name])
+            else:
+                os.remove(os.path.join(path, name))
+        self._sizes = dict(sizes)
+
+    def file(self, name):
+        if name not in self._files:
+            self._files[name] = open(os.path.join(self.path, name), 'ab')
+        return self._files[name]
+
+    def sizes(self):
+        return {**self._sizes, **{name: f.tell() for name, f in self._files.items()}}
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        self._sizes = self.sizes()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class DatasetWriter:
+    """
+    Streams record batches to a CSV export and its columnar table.
+    columns is [(name, dtype)] with dtype object for string columns; extra
+    maps names to functions of a batch stored only in the table (as in
+    write_dataset). With key (a list of key columns) the table also stores
+    row fingerprints and commit() writes the change report (see
+    write_changes). resume is a position() from an interrupted writer.
+    """
+    CSV_FILE = 'export.csv'
+
+    def __init__(self, csv_path, columns, extra=None, resume=None, key=None):
+        self.csv_path = csv_path
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.extra = extra or {}
+        self.key = key
+        self.changes = None
+        # (name, file stem, dtype) of every table column, named as write_table would
+        empty = {name: np.empty(0, dtype=dtype) for name, dtype in self.columns}
+        dtypes = self.columns + [(name, np.asarray(fn(empty)).dtype) for name, fn in self.extra.items()]
+        if key:
+            dtypes += [(name, np.dtype(np.uint64)) for name in HASH_COLUMNS]
+        self.layout = [(name, _safe(str(name), i), dtype) for i, (name, dtype) in enumerate(dtypes)]
+        if resume:
+            for _, stem, dtype in self.layout:
+                if dtype.kind in 'biuf' and resume['files'].get(stem + '.bin', 0) != resume['rows'] * dtype.itemsize:
+                    raise ValueError(f"Checkpoint does not match the layout of {csv_path}")
+        self.files = AppendFiles(table_dir(csv_path) + PARTIAL_SUFFIX, resume and resume['files'])
+        self.n_rows = resume['rows'] if resume else 0
+        if resume is None:
+            header = pd.DataFrame(columns=[name for name, _ in self.columns]).to_csv(index=False)
+            self.files.file(self.CSV_FILE).write(header.encode('utf-8'))
+            for _, stem, dtype in self.layout:
+                if dtype.kind not in 'biuf':
+                    self.files.file(stem + '.off').write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def write(self, batch):
+        """Appends a batch (a dict of equal-length column sequences)."""
+        arrays = {name: np.asarray(batch[name], dtype=dtype) for name, dtype in self.columns}
+        n = len(next(iter(arrays.values()))) if arrays else 0
+        if n == 0:
+            return
+        df = pd.DataFrame(arrays, copy=False)
+        self.files.file(self.CSV_FILE).write(df.to_csv(index=False, header=False).encode('utf-8'))
+        values = list(arrays.values()) + [np.asarray(fn(arrays)) for fn in self.extra.values()]
+        if self.key:
+            values += list(row_fingerprints(df, self.key).values())
+        for (_, stem, dtype), arr in zip(self.layout, values):
+            if dtype.kind in 'biuf':
+                self.files.file(stem + '.bin').write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+                continue
+            nulls = pd.isna(arr)
+            encoded = [b'' if null else str(v).encode('utf-8') for v, null in zip(arr.tolist(), nulls)]
+            blob = self.files.file(stem + '.bin')
+            offsets = blob.tell() + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+            blob.write(b''.join(encoded))
+            self.files.file(stem + '.off').write(offsets.tobytes())
+            self.files.file(stem + '.null').write(nulls.astype(np.uint8).tobytes())
+        self.n_rows += n
+
+    def position(self):
+        """Flushes and returns a checkpoint of everything written so far."""
+        self.files.flush()
+        return {'rows': self.n_rows, 'files': self.files.sizes()}
+
+    def commit(self):
+        """
+        Writes the schema and moves the CSV and table into place; returns the
+        row count. With a key, the change counts are left in self.changes.
+        """
+        for _, stem, dtype in self.layout:
+            # Columns of a run that wrote no rows still get their (empty) files
+            self.files.file(stem + '.bin')
+        self.files.close()
+        path = self.files.path
+        entries = []
+        for name, stem, dtype in self.layout:
+            if dtype.kind in 'biuf':
+                entries.append({'name': name, 'kind': 'numeric', 'dtype': dtype.str, 'file': stem + '.bin'})
+                continue
+            entry = {'name': name, 'kind': 'string', 'file': stem + '.bin', 'offsets': stem + '.off'}
+            null_file = os.path.join(path, stem + '.null')
+            if os.path.exists(null_file) and np.fromfile(null_file, dtype=np.uint8).any():
+                entry['nulls'] = stem + '.null'
+            elif os.path.exists(null_file):
+                os.remove(null_file)
+            entries.append(entry)
+        csv_file = os.path.join(path, self.CSV_FILE)
+        fingerprint = {'key': self.key, 'columns': [name for name, _ in self.columns]} if self.key else None
+        _write_schema(path, self.n_rows, entries, self.csv_path, source_file=csv_file, fingerprint=fingerprint)
+        if self.key:
+            self.changes = write_changes(self.csv_path, path, _previous_table(self.csv_path))
+        # Renames keep the CSV's size and mtime, so the table stays current
+        os.replace(csv_file, self.csv_path)
+        final = table_dir(self.csv_path)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(path, final)
+        return self.n_rows
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        return json.load(f)
+
+
+def _memmap(path, dtype, n):
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    # Plain read-only ndarray view of the mapping (still zero-copy)
+    return np.asarray(np.memmap(path, dtype=dtype, mode='r', shape=(n,)))
+
+
+def _load(path, entry, n):
+    if entry['kind'] == 'numeric':
+        return _memmap(os.path.join(path, entry['file']), np.dtype(entry['dtype']), n)
+    offsets = _memmap(os.path.join(path, entry['offsets']), np.int64, n + 1)
+    with open(os.path.join(path, entry['file']), 'rb') as f:
+        blob = f.read()
+    values = np.array([blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(n)], dtype=object)
+    if 'nulls' in entry:
+        values[_memmap(os.path.join(path, entry['nulls']), np.uint8, n).astype(bool)] = np.nan
+    return values
+
+
+def _load_range(path, entry, start, stop):
+    # Rows start:stop of one stored column, reading only their bytes
+    if stop <= start:
+        return np.empty(0, dtype=np.dtype(entry['dtype']) if entry['kind'] == 'numeric' else object)
+    if entry['kind'] == 'numeric':
+        return np.asarray(np.memmap(os.path.join(path, entry['file']), dtype=np.dtype(entry['dtype']), mode='r'))[start:stop]
+    offsets = np.fromfile(os.path.join(path, entry['offsets']), dtype=np.int64, count=stop - start + 1,
+                          offset=8 * start)
+    with open(os.path.join(path, entry['file']), 'rb') as f:
+        f.seek(offsets[0])
+        blob = f.read(offsets[-1] - offsets[0])
+    rel = offsets - offsets[0]
+    values = np.array([blob[rel[i]:rel[i + 1]].decode('utf-8') for i in range(stop - start)], dtype=object)
+    if 'nulls' in entry:
+        nulls = np.fromfile(os.path.join(path, entry['nulls']), dtype=np.uint8, count=stop - start, offset=start)
+        values[nulls.astype(bool)] = np.nan
+    return values
+
+
+def load_columns(path, names=None):
+    """Dict of column arrays; numeric columns are read-only memmaps (zero-copy)."""
+    schema = read_schema(path)
+    n = schema['n_rows']
+    entries = {c['name']: c for c in schema['columns']}
+    names = list(entries) if names is None else names
+    return {name: _load(path, entries[name], n) for name in names}
+
+
+def is_current(csv_path):
+    """True if the columnar table exists and was written together with the current CSV."""
+    path = table_dir(csv_path)
+    if not os.path.exists(os.path.join(path, SCHEMA_FILE)):
+        return False
+    source = read_schema(path).get('source')
+    if not os.path.exists(csv_path):
+        return True
+    if source is None:
+        return False
+    st = os.stat(csv_path)
+    return source['size'] == st.st_size and source['mtime_ns'] == st.st_mtime_ns
+
+
+def write_dataset(df, csv_path, extra=None, key=None):
+    """
+    Writes the CSV export and the columnar table. extra maps column names to
+    functions of df whose results are stored only in the columnar table
+    (e.g. the precomputed 'included' mask). With key (a list of key columns)
+    the table stores row fingerprints and the change report against the
+    previous version is written; returns its counts (see write_changes).
+    """
+    previous = _previous_table(csv_path) if key else None
+    df.to_csv(csv_path, index=False)
+    table = df
+    if extra:
+        table = df.assign(**{name: fn(df) for name, fn in extra.items()})
+    if not key:
+        write_table(table, table_dir(csv_path), source=csv_path)
+        return None
+    # Written aside first: the previous table is read while the report is made
+    path = table_dir(csv_path) + PARTIAL_SUFFIX
+    shutil.rmtree(path, ignore_errors=True)
+    write_table(table.assign(**row_fingerprints(df, key)), path, source=csv_path,
+                fingerprint={'key': key, 'columns': list(df.columns)})
+    changes = write_changes(csv_path, path, previous)
+    final = table_dir(csv_path)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(path, final)
+    return changes
+
+
+def read_dataset(csv_path, columns=None):
+    """
+    Loads the requested columns from the columnar table when it is current
+    (numeric columns zero-copy), otherwise from the CSV. Derived columns (see
+    DERIVED) are computed when the backend does not store them.
+    """
+    if is_current(csv_path):
+        path = table_dir(csv_path)
+        stored = [c['name'] for c in read_schema(path)['columns']]
+    else:
+        path = None
+        stored = list(pd.read_csv(csv_path, nrows=0).columns)
+    wanted = [c for c in stored if c not in HASH_COLUMNS] if columns is None else list(columns)
+    for c in wanted:
+        if c not in stored and c not in DERIVED:
+            raise KeyError(f"Column {c!r} not found in {csv_path}")
+    missing = [c for c in wanted if c not in stored]
+    load = [c for c in wanted if c in stored]
+    load += sorted({d for c in missing for d in DERIVED[c][1]} - set(load))
+
+    if path is not None:
+        arrays = load_columns(path, load)
+    else:
+        csv = pd.read_csv(csv_path, usecols=load)
+        arrays = {c: csv[c].to_numpy() for c in load}
+    for c in missing:
+        arrays[c] = DERIVED[c][0](arrays)
+    return pd.DataFrame({c: arrays[c] for c in wanted}, copy=False)
+
+
+def changes_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.changes.csv'
+
+
+def _previous_table(csv_path):
+    """
+    The table directory holding the current version of the dataset at
+    csv_path, or None. A CSV without a current table is first converted.
+    """
+    path = table_dir(csv_path)
+    if is_current(csv_path):
+        return path
+    if not os.path.exists(csv_path):
+        return None
+    converted = path + PREVIOUS_SUFFIX
+    shutil.rmtree(converted, ignore_errors=True)
+    write_table(pd.read_csv(csv_path, float_precision='round_trip'), converted)
+    return converted
+
+
+class _Table:
+    # Read access to a table directory for the change report
+    def __init__(self, path):
+        self.path = path
+        schema = read_schema(path)
+        self.n_rows = schema['n_rows']
+        self.entries = {c['name']: c for c in schema['columns']}
+        self.fingerprint = schema.get('fingerprint')
+
+    def rows(self, names, ranges):
+        """{name: values} of the rows in the (start, stop) ranges, in order (missing columns omitted)."""
+        return {name: np.concatenate([_load_range(self.path, self.entries[name], a, b) for a, b in ranges]
+                                     or [_load_range(self.path, self.entries[name], 0, 0)])
+                for name in names if name in self.entries}
+
+    def fingerprints(self, fingerprint):
+        """
+        {name: uint64 array} of the HASH_COLUMNS; computed from the values when
+        the table has none or they were made from other columns.
+        """
+        if self.fingerprint == fingerprint and all(name in self.entries for name in HASH_COLUMNS):
+            return load_columns(self.path, list(HASH_COLUMNS))
+        # Tables written before fingerprints existed (converted once, in memory)
+        names = [c for c in fingerprint['columns'] if c in self.entries]
+        df = pd.DataFrame(load_columns(self.path, names), copy=False)
+        if not set(fingerprint['key']) <= set(names):
+            return {name: np.zeros(self.n_rows, dtype=np.uint64) for name in HASH_COLUMNS}
+        return row_fingerprints(df, fingerprint['key'])
+
+
+def _group_runs(groups):
+    # (group, start, stop) of each run of equal values, scanning DIFF_BLOCK values at a time
+    runs = []
+    start = 0
+    for lo in range(0, len(groups), DIFF_BLOCK):
+        block = np.asarray(groups[lo:lo + DIFF_BLOCK + 1])
+        for cut in lo + 1 + np.flatnonzero(block[1:] != block[:-1]):
+            runs.append((int(groups[start]), start, int(cut)))
+            start = int(cut)
+    if len(groups):
+        runs.append((int(groups[start]), start, len(groups)))
+    return runs
+
+
+def _occurrences(keys):
+    # Repeated keys pair up in order: the i-th copy in old matches the i-th in new
+    return pd.Series(keys).groupby(keys, sort=False).cumcount().to_numpy()
+
+
+def _same(a, b):
+    a, b = pd.Series(a, dtype=object), pd.Series(b, dtype=object)
+    return (a.eq(b) | (a.isna() & b.isna())).to_numpy()
+
+
+class _ReportWriter:
+    def __init__(self, path, key):
+        self.key = key
+        self.counts = {'added': 0, 'modified': 0, 'removed': 0}
+        self._rows = []
+        self._file = open(path, 'w', newline='')
+        pd.DataFrame(columns=['row', 'old_row'] + key + ['change', 'columns']).to_csv(self._file, index=False)
+
+    def add(self, row, old_row, key_values, change, columns=''):
+        self._rows.append((row, old_row, *key_values, change, columns))
+        self.counts[change] += 1
+        if len(self._rows) >= REPORT_FLUSH:
+            self.flush()
+
+    def add_all(self, rows, old_rows, key_values, change):
+        """Adds one change for each of rows/old_rows (arrays or -1) with {key: values}."""
+        n = len(next(iter(key_values.values())))
+        if not n:
+            return
+        self.flush()
+        block = {'row': np.broadcast_to(rows, n), 'old_row': np.broadcast_to(old_rows, n)}
+        block.update({c: key_values[c] for c in self.key})
+        block.update({'change': change, 'columns': ''})
+        pd.DataFrame(block).to_csv(self._file, index=False, header=False)
+        self.counts[change] += n
+
+    def flush(self):
+        if self._rows:
+            pd.DataFrame(self._rows).to_csv(self._file, index=False, header=False)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def _diff_group(report, old, new, old_hashes, new_hashes, old_ranges, start, stop, fingerprint):
+    key = fingerprint['key']
+    old_rows = np.concatenate([np.arange(a, b) for a, b in old_ranges]) if old_ranges else np.empty(0, np.int64)
+    old_k, new_k = old_hashes[KEY_HASH][old_rows], np.asarray(new_hashes[KEY_HASH][start:stop])
+    old_r, new_r = old_hashes[ROW_HASH][old_rows], np.asarray(new_hashes[ROW_HASH][start:stop])
+    if np.array_equal(old_k, new_k) and np.array_equal(old_r, new_r):
+        return
+    if not len(old_k):
+        report.add_all(np.arange(start, stop), -1, new.rows(key, [(start, stop)]), 'added')
+        return
+    if start == stop:
+        report.add_all(-1, old_rows, old.rows(key, old_ranges), 'removed')
+        return
+    merged = pd.DataFrame({'k': old_k, 'o': _occurrences(old_k), 'old': np.arange(len(old_k))}).merge(
+        pd.DataFrame({'k': new_k, 'o': _occurrences(new_k), 'new': np.arange(len(new_k))}),
+        on=['k', 'o'], how='outer')
+    i_old = merged['old'].fillna(-1).astype(np.int64).to_numpy()
+    i_new = merged['new'].fillna(-1).astype(np.int64).to_numpy()
+    both = (i_old >= 0) & (i_new >= 0)
+    candidate = both.copy()
+    candidate[both] = old_r[i_old[both]] != new_r[i_new[both]]
+
+    columns = fingerprint['columns']
+    new_values = new.rows(columns, [(start, stop)])
+    old_values = old.rows(columns, old_ranges) if old_ranges else {}
+    changed = {}
+    rows = np.flatnonzero(candidate)
+    for c in columns:
+        if c in key:
+            continue
+        if c in old_values:
+            differ = ~_same(old_values[c][i_old[rows]], new_values[c][i_new[rows]])
+        else:
+            differ = np.ones(len(rows), dtype=bool)
+        for i in rows[differ]:
+            changed.setdefault(i, []).append(c)
+    for i in np.argsort(np.where(i_new >= 0, i_new, len(new_k) + i_old), kind='stable'):
+        if i_old[i] < 0:
+            report.add(start + i_new[i], -1, [new_values[c][i_new[i]] for c in key], 'added')
+        elif i_new[i] < 0:
+            report.add(-1, old_rows[i_old[i]], [old_values[c][i_old[i]] for c in key], 'removed')
+        elif i in changed:
+            report.add(start + i_new[i], old_rows[i_old[i]], [new_values[c][i_new[i]] for c in key], 'modified',
+                       ';'.join(changed[i]))
+
+
+def write_changes(csv_path, new_path, previous):
+    """
+    Writes the change report of the dataset at csv_path: new_path is the
+    table directory of the new version (with fingerprints), previous that of
+    the old one (see _previous_table; None means every row is 'added').
+    One row per difference: row (in new, -1 if removed), old_row (-1 if
+    added), the key columns, change ('added', 'modified' or 'removed') and
+    columns (the differing value columns, ';'-separated). Rows are in
+    new-table order; rows removed from a group follow the group, and groups
+    removed entirely come last. Returns the counts per change.
+    """
+    new = _Table(new_path)
+    fingerprint = new.fingerprint
+    new_hashes = load_columns(new_path, list(HASH_COLUMNS))
+    report = _ReportWriter(changes_path(csv_path), fingerprint['key'])
+    try:
+        if previous is None:
+            for a in range(0, new.n_rows, DIFF_BLOCK):
+                b = min(a + DIFF_BLOCK, new.n_rows)
+                report.add_all(np.arange(a, b), -1, new.rows(fingerprint['key'], [(a, b)]), 'added')
+            return report.counts
+        old = _Table(previous)
+        old_hashes = old.fingerprints(fingerprint)
+        old_groups = {}
+        for group, a, b in _group_runs(old_hashes[GROUP_HASH]):
+            old_groups.setdefault(group, []).append((a, b))
+        for group, a, b in _group_runs(new_hashes[GROUP_HASH]):
+            _diff_group(report, old, new, old_hashes, new_hashes, old_groups.pop(group, []), a, b, fingerprint)
+        # Groups that no longer exist
+        for ranges in sorted(old_groups.values()):
+            _diff_group(report, old, new, old_hashes, new_hashes, ranges, 0, 0, fingerprint)
+    finally:
+        report.close()
+        if previous is not None and previous.endswith(PREVIOUS_SUFFIX):
+            shutil.rmtree(previous, ignore_errors=True)
+    return report.counts
+
+
+def summarize_changes(counts, csv_path):
+    return (f"Changed rows: {counts['added']} added, {counts['modified']} modified, "
+            f"{counts['removed']} removed (see {changes_path(csv_path)})")
@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import zlib
+from collections import namedtuple
+
+import instrumentation
+import dataset_source
+from token_stream import StreamTokenCounter
+from deliverable_reader import BINARY, TEXT, MAX_TEXT_BYTES, sniff, content_digest, iter_text_chunks
+
+# Persistent, content-addressed cache of per-file deliverable features.
+# Every stage (ingestion, master dataset, decomposition) reads deliverables
+# through this module so that each file is decoded once per content version.
+# File bodies are read through deliverable_reader, which stubs binary assets.
+# Paths may point into an archive or HTTP mirror (see dataset_source).
+# Stages also memoize their own derived results here (see get_results), keyed
+# by a fingerprint of everything the result depends on, so unchanged tasks
+# and requirements are not recomputed. Every lookup or store stamps the rows
+# it touches; after a full run a stage prunes the rows of its kinds that the
+# run did not touch (see prune_results), so edits do not accumulate stale rows.
+CACHE_PATH = 'data/cache/corpus_cache.sqlite'
+
+# Largest read cap used by any stage (calculate_hardened_metrics reads 20000 chars)
+PREFIX_CHARS = 20000
+
+# Bump whenever the stored features change meaning so stale rows are dropped
+SCHEMA_VERSION = 2
+
+# Keys per query when looking up memoized results (below sqlite's variable limit)
+RESULT_BATCH = 500
+
+_FileRecord = namedtuple('FileRecord', [
+    'path', 'digest', 'size', 'prefix', 'lower', 'words', 'head', 'body_tokens', 'tail', 'mdl',
+    'kind', 'reason'
+])
+
+
+class FileRecord(_FileRecord):
+    """
+    Cached features of one deliverable file.
+    prefix/lower: first PREFIX_CHARS decoded characters (raw and lowercased).
+    words: whitespace word count of the full text.
+    head/body_tokens/tail: token count of the full text split at safe
+    tokenizer boundaries, so concatenations can be counted exactly.
+    mdl: zlib-compressed size of the prefix.
+    kind/reason: 'text' or 'binary', and why a file was stubbed or truncated.
+    """
+    __slots__ = ()
+
+    def text_head(self, n):
+        return self.prefix[:n]
+
+    def lower_head(self, n):
+        """Equivalent to f.read(n).lower() on the original file."""
+        # str.lower() only ever expands characters, so equal lengths mean aligned offsets
+        if len(self.lower) == len(self.prefix):
+            return self.lower[:n]
+        return self.prefix[:n].lower()
+
+
+def fingerprint(*parts):
+    """Stable hash of JSON-serializable parts (texts, settings, (path, digest) lists)."""
+    return hashlib.sha256(json.dumps(parts, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def walk_files(root):
+    """Lists every file under root in os.walk order (root may be inside an archive or mirror)."""
+    return dataset_source.walk_files(root)
+
+
+def _compute_features(path, sniffed):
+    if sniffed.kind == BINARY:
+        # Binary assets contribute no text; their bodies are never read
+        return ('', '', 0, '', 0, None, 0, sniffed.kind, sniffed.reason)
+    return _features_from_chunks(iter_text_chunks(path), sniffed.kind, sniffed.reason)
+
+
+def _features_from_chunks(chunks, kind, reason):
+    # Single streaming pass: the full file text is never held in memory
+    counter = StreamTokenCounter()
+    prefix = ""
+    words = 0
+    prev_ws = True
+    for chunk in chunks:
+        if len(prefix) < PREFIX_CHARS:
+            prefix += chunk[:PREFIX_CHARS - len(prefix)]
+        # str.split() word count, merging words cut by the chunk boundary
+        words += len(chunk.split())
+        if not prev_ws and not chunk[0].isspace():
+            words -= 1
+        prev_ws = chunk[-1].isspace()
+        counter.feed(chunk)
+    head, body_tokens, tail = counter.finish()
+    mdl = len(zlib.compress(prefix.encode('utf-8'))) if prefix else 0
+    return (prefix, prefix.lower(), words, head, body_tokens, tail, mdl, kind, reason)
+
+
+class CorpusCache:
+    """
+    On-disk feature cache keyed by (path, size, mtime) with content hashes;
+    archive members use their CRC or member mtime in place of the mtime.
+    Unchanged files are served without being opened; touched-but-identical
+    files are re-hashed but not re-decoded; identical content at different
+    paths shares a single feature row.
+    """
+
+    def __init__(self, path=CACHE_PATH, memo=None):
+        self.path = path
+        self._conn = None
+        self._memo = {} if memo is None else memo
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        # WAL lets pool workers read while another worker writes new entries
+        conn.execute('PRAGMA journal_mode=WAL')
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            conn.execute('DROP TABLE IF EXISTS files')
+            conn.execute('DROP TABLE IF EXISTS blobs')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            'digest TEXT PRIMARY KEY, prefix TEXT, lower TEXT, words INTEGER, '
+            'head TEXT, body_tokens INTEGER, tail TEXT, mdl INTEGER, kind TEXT, reason TEXT)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'kind TEXT, key TEXT, value TEXT, touched REAL, PRIMARY KEY (kind, key))'
+        )
+        if 'touched' not in [c[1] for c in conn.execute('PRAGMA table_info(results)')]:
+            # Results stored before rows were stamped; the next full run prunes them
+            conn.execute('ALTER TABLE results ADD COLUMN touched REAL DEFAULT 0')
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def get(self, path):
+        """Returns the FileRecord for path, or None if it cannot be read."""
+        try:
+            source = dataset_source.source_for(path)
+            st = source.stat(path)
+        except OSError:
+            return None
+        memo_key = (path, st.size, st.version)
+        if memo_key in self._memo:
+            instrumentation.count('cache_hits')
+            return self._memo[memo_key]
+
+        conn = self._connect()
+        abs_path = source.canonical(path)
+        row = conn.execute('SELECT size, mtime_ns, digest FROM files WHERE path = ?', (abs_path,)).fetchone()
+
+        sniffed = None
+        # mtime_ns holds the source's version stamp (the mtime for plain files)
+        if row and row[0] == st.size and row[1] == st.version:
+            digest = row[2]
+        else:
+            try:
+                sniffed = sniff(path)
+                digest = content_digest(path, sniffed)
+            except OSError:
+                return None
+            conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                         (abs_path, st.size, st.version, digest))
+
+        features = conn.execute(
+            'SELECT prefix, lower, words, head, body_tokens, tail, mdl, kind, reason FROM blobs WHERE digest = ?', (digest,)
+        ).fetchone()
+        if features is None:
+            self.misses += 1
+            instrumentation.count('cache_misses')
+            try:
+                features = _compute_features(path, sniffed or sniff(path))
+            except OSError:
+                return None
+            conn.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (digest,) + features)
+        else:
+            self.hits += 1
+            instrumentation.count('cache_hits')
+        conn.commit()
+
+        record = FileRecord(path, digest, st.size, *features)
+        self._memo[memo_key] = record
+        return record
+
+    def get_text(self, name, text):
+        """
+        FileRecord of an in-memory text deliverable (e.g. inline in a scoring
+        request) named name. Keyed by the digest of its UTF-8 bytes, so it
+        shares feature rows with identical files on disk.
+        """
+        data = text.encode('utf-8')
+        reason = ''
+        if len(data) > MAX_TEXT_BYTES:
+            # Same cap (and partial-character handling) as a file read
+            data = data[:MAX_TEXT_BYTES]
+            text = data.decode('utf-8', errors='ignore')
+            reason = 'truncated'
+        digest = hashlib.sha256(data).hexdigest()
+        if reason:
+            digest = hashlib.sha256(data + f'|{reason}'.encode()).hexdigest()
+        memo_key = (name, len(data), digest)
+        if memo_key in self._memo:
+            instrumentation.count('cache_hits')
+            return self._memo[memo_key]
+
+        conn = self._connect()
+        features = conn.execute(
+            'SELECT prefix, lower, words, head, body_tokens, tail, mdl, kind, reason FROM blobs WHERE digest = ?', (digest,)
+        ).fetchone()
+        if features is None:
+            self.misses += 1
+            instrumentation.count('cache_misses')
+            # Newlines translated as a text-mode read of the same bytes would
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            features = _features_from_chunks([text] if text else [], TEXT, reason)
+            conn.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (digest,) + features)
+            conn.commit()
+        else:
+            self.hits += 1
+            instrumentation.count('cache_hits')
+
+        record = FileRecord(name, digest, len(data), *features)
+        self._memo[memo_key] = record
+        return record
+
+    def get_many(self, paths):
+        """Returns records for every readable path, preserving order."""
+        records = []
+        for p in paths:
+            r = self.get(p)
+            if r is not None:
+                records.append(r)
+        return records
+
+    def get_results(self, kind, keys):
+        """Memoized results of kind for whichever fingerprints in keys are known: {key: value}."""
+        conn = self._connect()
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for i in range(0, len(keys), RESULT_BATCH):
+            batch = keys[i:i + RESULT_BATCH]
+            marks = ','.join('?' * len(batch))
+            for key, value in conn.execute(
+                f'SELECT key, value FROM results WHERE kind = ? AND key IN ({marks})', [kind] + batch
+            ):
+                found[key] = json.loads(value)
+        self.touch_results(kind, found)
+        instrumentation.count(f'{kind}_reused', len(found))
+        return found
+
+    def touch_results(self, kind, keys):
+        """Stamps stored results of kind as used now, so prune_results keeps them."""
+        keys = list(keys)
+        if not keys:
+            return
+        conn = self._connect()
+        now = time.time()
+        for i in range(0, len(keys), RESULT_BATCH):
+            batch = keys[i:i + RESULT_BATCH]
+            marks = ','.join('?' * len(batch))
+            conn.execute(f'UPDATE results SET touched = ? WHERE kind = ? AND key IN ({marks})', [now, kind] + batch)
+        conn.commit()
+
+    def put_results(self, kind, values):
+        """Stores {fingerprint: JSON-serializable value} results of kind in one transaction."""
+        if not values:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                         [(kind, key, json.dumps(value), now) for key, value in values.items()])
+        conn.commit()
+        instrumentation.count(f'{kind}_computed', len(values))
+
+    def prune_results(self, kinds, before):
+        """
+        Deletes results of the given kinds not touched since before (a
+        time.time() stamp, e.g. the start of a full run); returns how many.
+        """
+        conn = self._connect()
+        marks = ','.join('?' * len(kinds))
+        n = conn.execute(f'DELETE FROM results WHERE kind IN ({marks}) AND touched < ?', list(kinds) + [before]).rowcount
+        conn.commit()
+        return n
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_default_cache = None
+_default_cache_pid = None
+
+
+def get_cache():
+    """Returns the process-wide cache at CACHE_PATH (one connection per worker process)."""
+    global _default_cache, _default_cache_pid
+    if _default_cache is None or _default_cache_pid != os.getpid():
+        # sqlite connections must not be shared across fork(); records
+        # memoized before a fork stay valid in the child
+        _default_cache = CorpusCache(memo=_default_cache._memo if _default_cache is not None else None)
+        _default_cache_pid = os.getpid()
+    return _default_cache
@@ -0,0 +1,561 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import argparse
+import functools
+import posixpath
+import http.client
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# Where the RLI corpus (briefs, metadata, deliverables) is read from.
+#
+# Stages build paths as os.path.join(root, task_id, ...) exactly as before;
+# only the root changes. It may be
+#
+#   data/rli_public_set              a plain directory (the default)
+#   corpus.zip, corpus.tar[.gz|.bz2|.xz]
+#                                    an archive, read member by member in
+#                                    place: nothing is extracted to disk
+#   http://host:port/rli_public_set  an HTTP mirror of a directory, listed by
+#                                    its manifest.json (see `serve` below)
+#
+# Every file access on a corpus path (stat, open, exists, walk) goes through
+# source_for(path), which maps the path to the archive or mirror it lives in
+# and falls back to the filesystem. The corpus cache keys members by their
+# path inside the archive and by (size, version): the mtime for directories,
+# tar members and mirrors, the CRC for zip members. Once the cache is warm,
+# later stages never open a member again.
+#
+# The root is set by --source (or RLI_SOURCE, which pipeline stages and pool
+# workers inherit).
+#
+# A mirror member that cannot be read in full (the request fails, stalls for
+# HTTP_TIMEOUT or the body ends short of its manifest size) raises
+# MirrorError. It is not an OSError, so the corpus cache does not mistake it
+# for an unreadable file: the stage fails instead of scoring a partial corpus.
+#
+#   python src/dataset_source.py pack data/rli_public_set corpus.zip
+#   python src/dataset_source.py serve data/rli_public_set --port 8000
+#   python src/cli.py master --source corpus.zip
+
+SOURCE_ENV = 'RLI_SOURCE'
+DEFAULT_ROOT = 'data/rli_public_set'
+MANIFEST_NAME = 'manifest.json'
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ARCHIVE_SUFFIXES = ZIP_SUFFIXES + TAR_SUFFIXES
+HTTP_TIMEOUT = 60   # Seconds per mirror request
+COPY_BLOCK = 1 << 20
+
+# version: what the cache compares to detect a changed file (st_mtime_ns for
+# files and tar/mirror members, the CRC-32 for zip members); mtime in ns
+Entry = namedtuple('Entry', ['size', 'version', 'mtime_ns'])
+
+
+def is_url(location):
+    return location.startswith(('http://', 'https://'))
+
+
+class DirectorySource:
+    """Plain files under a directory (also the fallback for every non-corpus path)."""
+    local = True
+
+    def __init__(self, root):
+        self.root = root
+
+    def canonical(self, path):
+        return os.path.abspath(path)
+
+    def stat(self, path):
+        st = os.stat(path)
+        return Entry(st.st_size, st.st_mtime_ns, st.st_mtime_ns)
+
+    def open(self, path):
+        return open(path, 'rb')
+
+    def read_text(self, path, errors='strict'):
+        with open(path, 'r', encoding='utf-8', errors=errors) as f:
+            return f.read()
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def walk_files(self, path):
+        all_files = []
+        for dirpath, dirs, files in os.walk(path):
+            for file in files:
+                all_files.append(os.path.join(dirpath, file))
+        return all_files
+
+
+class IndexedSource:
+    """
+    Base for sources whose file list is known up front (archives, mirrors).
+    Subclasses list their members as (relative path, Entry, handle) and open
+    a member from its handle.
+    """
+    local = False
+
+    def __init__(self, root):
+        self.root = root.rstrip('/')
+        self._files = {}
+        self._dirs = {'': ([], [])}
+        for rel, entry, handle in self._members():
+            self._add(rel, entry, handle)
+
+    def _members(self):
+        raise NotImplementedError
+
+    def _open_member(self, handle):
+        raise NotImplementedError
+
+    def _add(self, rel, entry, handle):
+        rel = posixpath.normpath(rel).lstrip('/')
+        if rel in ('', '.') or rel in self._files:
+            return
+        self._files[rel] = (entry, handle)
+        parent, name = posixpath.split(rel)
+        self._add_dir(parent)[0].append(name)
+
+    def _add_dir(self, rel):
+        if rel not in self._dirs:
+            self._dirs[rel] = ([], [])
+            parent, name = posixpath.split(rel)
+            self._add_dir(parent)[1].append(name)
+        return self._dirs[rel]
+
+    def _strip_top(self, members):
+        # An archive of the directory itself (rli_public_set.zip holding
+        # rli_public_set/...) is served from inside that directory
+        stem = os.path.basename(self.root)
+        for suffix in ARCHIVE_SUFFIXES:
+            if stem.lower().endswith(suffix):
+                stem = stem[:-len(suffix)]
+                break
+        top = {m[0].lstrip('/').split('/', 1)[0] for m in members}
+        if top == {stem} and all('/' in m[0].lstrip('/') for m in members):
+            return [(m[0].lstrip('/').split('/', 1)[1],) + tuple(m[1:]) for m in members]
+        return members
+
+    def _rel(self, path):
+        if path != self.root and not path.startswith(self.root + '/'):
+            raise FileNotFoundError(f"{path} is not under {self.root}")
+        rel = posixpath.normpath(path[len(self.root):].lstrip('/'))
+        return '' if rel == '.' else rel
+
+    def _file(self, path):
+        hit = self._files.get(self._rel(path))
+        if hit is None:
+            raise FileNotFoundError(path)
+        return hit
+
+    def canonical(self, path):
+        root = self.root if is_url(self.root) else os.path.abspath(self.root)
+        return root + '/' + self._rel(path)
+
+    def stat(self, path):
+        return self._file(path)[0]
+
+    def open(self, path):
+        return self._open_member(self._file(path)[1])
+
+    def read_text(self, path, errors='strict'):
+        # Same decoding and newline translation as text-mode open()
+        with self.open(path) as f:
+            return io.TextIOWrapper(f, encoding='utf-8', errors=errors).read()
+
+    def exists(self, path):
+        try:
+            rel = self._rel(path)
+        except FileNotFoundError:
+            return False
+        return rel in self._files or rel in self._dirs
+
+    def isdir(self, path):
+        try:
+            return self._rel(path) in self._dirs
+        except FileNotFoundError:
+            return False
+
+    def listdir(self, path):
+        rel = self._rel(path)
+        if rel not in self._dirs:
+            raise FileNotFoundError(path)
+        files, dirs = self._dirs[rel]
+        return dirs + files
+
+    def walk_files(self, path):
+        """Files under path in os.walk order (a directory's files, then its subdirectories in turn)."""
+        try:
+            rel = self._rel(path)
+        except FileNotFoundError:
+            return []
+        out = []
+        todo = [rel] if rel in self._dirs else []
+        while todo:
+            d = todo.pop()
+            files, dirs = self._dirs[d]
+            base = path.rstrip('/') + ('/' + d[len(rel):].lstrip('/') if d != rel else '')
+            out.extend(f"{base}/{name}" for name in files)
+            todo.extend(posixpath.join(d, name) for name in reversed(dirs))
+        return out
+
+    def fingerprint(self):
+        """Hash of the member listing (paths, sizes, versions)."""
+        h = hashlib.sha256()
+        for rel in sorted(self._files):
+            entry = self._files[rel][0]
+            h.update(f"{rel}\0{entry.size}\0{entry.version}\n".encode())
+        return h.hexdigest()
+
+
+class _PerProcessHandle:
+    # Archive handles are reopened after fork(): a shared file offset would
+    # interleave reads of pool workers
+    def __init__(self, opener):
+        self._opener = opener
+        self._handle = None
+        self._pid = None
+
+    def get(self):
+        if self._handle is None or self._pid != os.getpid():
+            self._handle = self._opener()
+            self._pid = os.getpid()
+        return self._handle
+
+
+class ZipSource(IndexedSource):
+    """Members of a zip archive, decompressed as they are read."""
+
+    def __init__(self, path):
+        self._zip = _PerProcessHandle(lambda: zipfile.ZipFile(path))
+        super().__init__(path)
+
+    def _members(self):
+        infos = [i for i in self._zip.get().infolist() if not i.is_dir()]
+        members = []
+        for i in infos:
+            mtime_ns = int(time.mktime(i.date_time + (0, 0, -1)) * 1e9)
+            members.append((i.filename, Entry(i.file_size, i.CRC, mtime_ns), i))
+        return self._strip_top(members)
+
+    def _open_member(self, info):
+        return self._zip.get().open(info)
+
+
+class TarSource(IndexedSource):
+    """
+    Members of a tar archive, optionally gzip/bz2/xz compressed. Listing a
+    compressed tar decompresses it once; members are then read in archive
+    order cheaply, while jumping back re-decompresses from the start, so
+    uncompressed tar or zip suits random access best.
+    """
+
+    def __init__(self, path):
+        self._tar = _PerProcessHandle(lambda: tarfile.open(path, 'r:*'))
+        super().__init__(path)
+
+    def _members(self):
+        infos = [m for m in self._tar.get().getmembers() if m.isfile()]
+        return self._strip_top([(m.name, Entry(m.size, int(m.mtime * 1e9), int(m.mtime * 1e9)), m) for m in infos])
+
+    def _open_member(self, info):
+        return self._tar.get().extractfile(info)
+
+
+class MirrorError(RuntimeError):
+    """A mirror member could not be read in full."""
+
+
+class _MirrorReader(io.RawIOBase):
+    # The body of one mirror member, checked against its manifest size
+    def __init__(self, response, url, size):
+        self._response = response
+        self._url = url
+        self._size = size
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        try:
+            n = self._response.readinto(b)
+        except (OSError, http.client.HTTPException) as e:
+            raise MirrorError(f"Reading {self._url} failed: {e}") from e
+        self._read += n
+        if self._read > self._size or (n == 0 and len(b) and self._read < self._size):
+            raise MirrorError(f"{self._url} returned {self._read} bytes where the manifest lists {self._size}")
+        return n
+
+    def close(self):
+        self._response.close()
+        super().close()
+
+
+class HttpSource(IndexedSource):
+    """A directory served over HTTP, listed by the manifest.json at its root."""
+
+    def _url(self, rel):
+        return self.root + '/' + urllib.parse.quote(rel)
+
+    def _request(self, url):
+        try:
+            return urllib.request.urlopen(url, timeout=HTTP_TIMEOUT)
+        except (OSError, http.client.HTTPException) as e:
+            raise MirrorError(f"Opening {url} failed: {e}") from e
+
+    def _members(self):
+        with self._request(self._url(MANIFEST_NAME)) as r:
+            manifest = json.load(r)
+        return [(rel, Entry(size, mtime_ns, mtime_ns), rel) for rel, size, mtime_ns in manifest['files']]
+
+    def _open_member(self, rel):
+        url = self._url(rel)
+        return io.BufferedReader(_MirrorReader(self._request(url), url, self._files[rel][0].size))
+
+
+_FILESYSTEM = DirectorySource('')
+_sources = {}
+
+
+def open_source(location):
+    """The source at location (directory, archive or URL), opened once per process."""
+    location = location.rstrip('/') or location
+    source = _sources.get(location)
+    if source is None:
+        lowered = location.lower()
+        if is_url(location):
+            source = HttpSource(location)
+        elif lowered.endswith(ZIP_SUFFIXES):
+            source = ZipSource(location)
+        elif lowered.endswith(TAR_SUFFIXES):
+            source = TarSource(location)
+        else:
+            source = DirectorySource(location)
+        _sources[location] = source
+    return source
+
+
+def get_root():
+    """The configured corpus root (--source / RLI_SOURCE, else data/rli_public_set)."""
+    return os.environ.get(SOURCE_ENV) or DEFAULT_ROOT
+
+
+def set_root(location):
+    """Makes location the corpus root of this process and the processes it starts."""
+    open_source(location)  # Fail early on a missing archive or unreachable mirror
+    os.environ[SOURCE_ENV] = location
+
+
+def _under(path, root):
+    return path == root or path.startswith(root + '/')
+
+
+def _is_archive(location):
+    return location.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def source_for(path):
+    """The source a path belongs to; paths outside any archive or mirror belong to the filesystem."""
+    for root, source in _sources.items():
+        if not source.local and _under(path, root):
+            return source
+    # A process that has not opened the configured root yet (e.g. a spawned worker)
+    root = get_root().rstrip('/')
+    if (is_url(root) or _is_archive(root)) and _under(path, root):
+        return open_source(root)
+    if is_url(path):
+        raise FileNotFoundError(f"No HTTP source for {path}")
+    lowered = path.lower()
+    if any(s in lowered for s in ('.zip/', '.tar', '.tgz/', '.tbz2/', '.txz/')):
+        # Inside some other archive; an archive file itself (a deliverable) is just a file
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            prefix = '/'.join(parts[:i])
+            if _is_archive(prefix) and os.path.isfile(prefix):
+                return open_source(prefix)
+    return _FILESYSTEM
+
+
+def stat(path):
+    return source_for(path).stat(path)
+
+
+def open_binary(path):
+    return source_for(path).open(path)
+
+
+def read_text(path, errors='strict'):
+    return source_for(path).read_text(path, errors)
+
+
+def exists(path):
+    try:
+        return source_for(path).exists(path)
+    except OSError:
+        return False
+
+
+def isdir(path):
+    try:
+        return source_for(path).isdir(path)
+    except OSError:
+        return False
+
+
+def listdir(path):
+    return source_for(path).listdir(path)
+
+
+def walk_files(path):
+    try:
+        return source_for(path).walk_files(path)
+    except OSError:
+        return []
+
+
+def add_arguments(parser):
+    """Adds --source to a script's argument parser."""
+    parser.add_argument('--source', default=None,
+                        help=f"Corpus directory, zip/tar archive or HTTP mirror (default: ${SOURCE_ENV} or {DEFAULT_ROOT})")
+
+
+def configure(args):
+    """Applies the flag added by add_arguments."""
+    if args.source:
+        set_root(args.source)
+
+
+def pack(root, out):
+    """Writes every file under the source root to a zip or tar archive (by out's suffix). Returns the file count."""
+    lowered = out.lower()
+    if not lowered.endswith(ARCHIVE_SUFFIXES):
+        raise ValueError(f"Archive must end in one of {', '.join(ARCHIVE_SUFFIXES)}: {out}")
+    source = open_source(root)
+    root = root.rstrip('/') or root
+    paths = source.walk_files(root)
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    if lowered.endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for p in paths:
+                entry = source.stat(p)
+                info = zipfile.ZipInfo(p[len(root) + 1:], _zip_time(entry.mtime_ns))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with source.open(p) as src, zf.open(info, 'w', force_zip64=entry.size > 0x7fffffff) as dst:
+                    shutil.copyfileobj(src, dst, COPY_BLOCK)
+    else:
+        compression = {'.gz': 'gz', 'tgz': 'gz', 'bz2': 'bz2', '.xz': 'xz', 'txz': 'xz'}.get(lowered[-3:])
+        with tarfile.open(out, f'w:{compression}' if compression else 'w') as tf:
+            for p in paths:
+                entry = source.stat(p)
+                info = tarfile.TarInfo(p[len(root) + 1:])
+                info.size = entry.size
+                info.mtime = entry.mtime_ns / 1e9
+                with source.open(p) as src:
+                    tf.addfile(info, src)
+    return len(paths)
+
+
+def _zip_time(mtime_ns):
+    # Zip timestamps start in 1980 and have two-second resolution
+    return time.localtime(max(mtime_ns / 1e9, 315532800))[:6]
+
+
+def write_manifest(root):
+    """Writes root/manifest.json listing every file for an HTTP mirror. Returns the file count."""
+    source = DirectorySource(root)
+    files = []
+    for p in source.walk_files(root):
+        rel = os.path.relpath(p, root).replace(os.sep, '/')
+        if rel == MANIFEST_NAME:
+            continue
+        entry = source.stat(p)
+        files.append([rel, entry.size, entry.mtime_ns])
+    tmp = os.path.join(root, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'files': files}, f)
+    os.replace(tmp, os.path.join(root, MANIFEST_NAME))
+    return len(files)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _MirrorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Readers hang up after the bytes they need (e.g. a binary file's sniffed head)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(root, host='127.0.0.1', port=0):
+    """
+    An HTTP mirror of the directory root (manifest written first). Returns
+    the server; call serve_forever(), e.g. on a thread in a test. port=0
+    picks a free port: the mirror URL is http://host:server.server_port.
+    """
+    write_manifest(root)
+    handler = functools.partial(_QuietHandler, directory=root)
+    return _MirrorServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack, list or serve an RLI corpus.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('pack', help="Write a corpus to one zip or tar archive")
+    p.add_argument('root', help="Corpus directory, archive or mirror")
+    p.add_argument('out', help="Archive path (.zip, .tar, .tar.gz, .tar.bz2, .tar.xz)")
+    p = sub.add_parser('ls', help="List the files of a corpus")
+    p.add_argument('root')
+    p = sub.add_parser('manifest', help="Write manifest.json for serving a directory")
+    p.add_argument('root')
+    p = sub.add_parser('serve', help="Serve a corpus directory as an HTTP mirror")
+    p.add_argument('root')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        n = pack(args.root, args.out)
+        print(f"{n} files packed into {args.out}")
+    elif args.command == 'ls':
+        source = open_source(args.root)
+        for p in source.walk_files(args.root.rstrip('/') or args.root):
+            print(f"{source.stat(p).size:>12}  {p}")
+    elif args.command == 'manifest':
+        n = write_manifest(args.root)
+        print(f"{n} files listed in {os.path.join(args.root, MANIFEST_NAME)}")
+    else:
+        server = serve(args.root, args.host, args.port)
+        print(f"Serving {args.root} at http://{args.host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,83 @@
 import os
-import pandas as pd
+import json
+import time
+import hashlib
+import argparse
 import numpy as np
-import zlib
 import re
-import statsmodels.formula.api as smf
-import matplotlib.pyplot as plt
-import seaborn as sns
+from collections import namedtuple, deque
+import instrumentation
+import dataset_source
+from corpus_cache import fingerprint, get_cache, walk_files
+from keyword_index import ProjectIndex
+from parallel import parallel_imap
+from mdl import DEFAULT_CODEC, mdl_size, solution_mdl, ncd_matrix
+from symbol_sets import has_extension, solution_symbol_stats
+from columnar import MASTER_PATH, SUBTASK_PATH, DatasetWriter, included_mask, read_dataset, summarize_changes
+from incidence import RelevanceWriter, build_incidence, relevance, relevant_paths, row_scores
 
-def get_mdl_size(text):
-    """Calculates the Minimum Description Length (MDL) using zlib compression."""
-    if not text: return 0
-    return len(zlib.compress(text.encode('utf-8')))
+# Characters of each logic file that enter a requirement's solution text
+SOLUTION_CHARS = 20000
+LOGIC_EXTS = ('.tex', '.py', '.js', '.html', '.css', '.md', '.txt', '.c', '.h', '.mat')
+# Characters of each deliverable searched for requirement keywords
+INDEX_CHARS = 5000
+# Bullets of this length or shorter are not requirements
+MIN_REQUIREMENT_CHARS = 10
+REQUIREMENT_STOP_WORDS = frozenset({'this', 'that', 'with', 'from', 'your', 'will', 'into', 'proper', 'format', 'using', 'needed'})
+# Progress of an interrupted run: output written up to the last completed project
+CHECKPOINT_PATH = 'data/cache/decompose_checkpoint.json'
+# Bump whenever requirement metrics change meaning so memoized results are recomputed
+METRICS_VERSION = 2
 
-def extract_requirements(brief_text):
-    """Decomposes a brief into semantically discrete requirements."""
+# Every analytical choice of the decomposition, carried with each work item
+DecomposeSettings = namedtuple(
+    'DecomposeSettings', ['codec', 'min_requirement_chars', 'stop_words', 'index_chars', 'solution_chars', 'logic_exts'],
+    defaults=[DEFAULT_CODEC, MIN_REQUIREMENT_CHARS, REQUIREMENT_STOP_WORDS, INDEX_CHARS, SOLUTION_CHARS, LOGIC_EXTS],
+)
+
+def get_mdl_size(text, codec=DEFAULT_CODEC):
+    """Calculates the Minimum Description Length (MDL) by compression (zlib by default)."""
+    return mdl_size(text, codec)
+
+def extract_requirements(brief_text, min_chars=MIN_REQUIREMENT_CHARS):
+    """Decomposes a brief into semantically discrete requirements (longer than min_chars)."""
     pattern = r'(?:^|\n)(?:\s*[-*]|\s*\d+\.)\s+(.*)'
     requirements = re.findall(pattern, brief_text)
-    return [r.strip() for r in requirements if len(r.strip()) > 10]
+    return [r.strip() for r in requirements if len(r.strip()) > min_chars]
+
+def requirement_keywords(req, stop_words=REQUIREMENT_STOP_WORDS):
+    """Technical keywords of a requirement used to locate its solution assets."""
+    keywords = set(re.findall(rf'\b([a-zA-Z]{{4,}})\b', req.lower()))
+    return keywords - stop_words
 
-def map_req_to_files(req, deliverable_dir):
+def build_project_index(deliverable_dir, cap=INDEX_CHARS):
+    """Indexes a project's deliverables once so every requirement lookup is an index query."""
+    return ProjectIndex(get_cache().get_many(walk_files(deliverable_dir)), cap)
+
+@instrumentation.traced()
+def map_req_to_files(req, deliverable_dir, index=None, stop_words=REQUIREMENT_STOP_WORDS):
     """Maps requirements to solution assets via technical keyword overlap."""
-    if not os.path.exists(deliverable_dir):
+    if not dataset_source.exists(deliverable_dir):
         return []
-    keywords = set(re.findall(rf'\b([a-zA-Z]{{4,}})\b', req.lower()))
-    stop_words = {'this', 'that', 'with', 'from', 'your', 'will', 'into', 'proper', 'format', 'using', 'needed'}
-    keywords = keywords - stop_words
-    
-    relevant_files = []
-    for root, dirs, files in os.walk(deliverable_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read(5000).lower()
-                    if any(k in content for k in keywords):
-                        relevant_files.append(file_path)
-            except: pass
-    return list(set(relevant_files))
-
-def calculate_hardened_metrics(req, files):
+    keywords = requirement_keywords(req, stop_words)
+    if index is None:
+        index = build_project_index(deliverable_dir)
+    # Sorted so the solution text (and its MDL) does not depend on set ordering
+    return sorted(index.files_with_any(keywords))
+
+def solution_records(files, logic_exts=LOGIC_EXTS):
+    """Cached records of the logic files among files, in the given order."""
+    cache = get_cache()
+    records = []
+    for f in files:
+        if has_extension(f, logic_exts):
+            record = cache.get(f)
+            if record is not None:
+                records.append(record)
+    return records
+
+@instrumentation.traced()
+def calculate_hardened_metrics(req, files, codec=DEFAULT_CODEC, solution_chars=SOLUTION_CHARS, logic_exts=LOGIC_EXTS):
     """
     Calculates E and Kappa using unit-less Information Theory measures.
     E (Inference Density) = MDL(Solution) / MDL(Instruction)
@@ -46,75 +85,336 @@ def calculate_hardened_metrics(req, files):
     """
     if not files:
         return 0, 0
-    
+    return metrics_from_records(req, solution_records(files, logic_exts), codec, solution_chars)
+
+def metrics_from_records(req, records, codec=DEFAULT_CODEC, solution_chars=SOLUTION_CHARS):
+    """E and Kappa of calculate_hardened_metrics from the records of the requirement's logic files."""
     # 1. Inference Density (E)
-    mdl_instruction = get_mdl_size(req)
+    mdl_instruction = get_mdl_size(req, codec)
     
-    solution_text = ""
-    logic_exts = ('.tex', '.py', '.js', '.html', '.css', '.md', '.txt', '.c', '.h', '.mat')
-    for f in files:
-        if f.lower().endswith(logic_exts):
-            try:
-                with open(f, 'r', encoding='utf-8', errors='ignore') as fo:
-                    solution_text += fo.read(20000) + " "
-            except: pass
-            
-    mdl_solution = get_mdl_size(solution_text)
+    # Streamed per file and memoized by file-set fingerprint
+    mdl_solution = solution_mdl(records, solution_chars, codec)
     
     # E is the 'Expansion Ratio' of Information
     e_hardened = mdl_solution / mdl_instruction if mdl_instruction > 0 else 0
     
     # 2. Coordination Complexity (Kappa)
     # Using Unique Symbol Density as a proxy for state-dependency (NMI proxy)
-    symbols = re.findall(r'\b[a-zA-Z_][a-zA-Z0-9_]{5,}\b', solution_text)
-    unique_symbols = len(set(symbols))
+    # Per-file symbol sets are cached; a requirement unions their interned ids
+    unique_symbols, solution_length = solution_symbol_stats(records, solution_chars)
     
     # Normalize by the log-volume of the solution to get a density metric
-    kappa_hardened = (unique_symbols / np.log(len(solution_text) + 1)) if len(solution_text) > 0 else 0
+    kappa_hardened = (unique_symbols / np.log(solution_length + 1)) if solution_length > 0 else 0
     
     return round(e_hardened, 4), round(kappa_hardened, 4)
 
-def decompose_projects():
-    """Builds the expanded dataset using the hardened methodology."""
-    rli_base = 'data/rli_public_set'
-    subtask_data = []
-    
-    if not os.path.exists('data/master_dataset.csv'):
-        print("Master dataset missing.")
-        return pd.DataFrame()
+def requirement_metrics(requirements, records, settings=DecomposeSettings(), index=None):
+    """
+    (e_hardened, k_hardened) of every requirement against an in-memory set of
+    deliverable records (e.g. inline files), with the same keyword mapping as
+    decompose_chunk. index: a ProjectIndex of records at settings.index_chars.
+    """
+    if index is None:
+        index = ProjectIndex(records, settings.index_chars)
+    by_path = {r.path: r for r in records}
+    keywords = [requirement_keywords(r, settings.stop_words) for r in requirements]
+    index.prime(set().union(*keywords))
+    metrics = []
+    for req, words in zip(requirements, keywords):
+        files = sorted(index.files_with_any(words))
+        if not files:
+            metrics.append((0, 0))
+            continue
+        logic = [by_path[f] for f in files if has_extension(f, settings.logic_exts)]
+        metrics.append(metrics_from_records(req, logic, settings.codec, settings.solution_chars))
+    return metrics
+
+def requirement_file_ncd(requirements, deliverable_dir, codec=DEFAULT_CODEC):
+    """
+    Normalized compression distance between every requirement and every logic
+    file of a project. Returns (paths, requirements x files array).
+    """
+    records = solution_records(sorted(walk_files(deliverable_dir)))
+    return [r.path for r in records], ncd_matrix(requirements, records, SOLUTION_CHARS, codec)
+
+def _chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)] or [[]]
+
+_index_memo = {}
+
+def _cached_project_index(deliverable_dir, cap=INDEX_CHARS):
+    # Requirement chunks of the same project that land in the same worker reuse its index
+    key = (deliverable_dir, cap)
+    if key not in _index_memo:
+        _index_memo.clear()
+        _index_memo[key] = build_project_index(deliverable_dir, cap)
+    return _index_memo[key]
+
+def _settings_key(settings):
+    # Sorted so keys do not depend on set iteration order (string hashing is per process)
+    return list(settings._replace(stop_words=sorted(settings.stop_words)))
 
-    orig_df = pd.read_csv('data/master_dataset.csv')
+def _relative(path, root):
+    # Fingerprints use paths relative to the deliverable folder, so they hold for any --source
+    return path[len(root):].lstrip('/\\') if path.startswith(root) else path
+
+def deliverable_digests(deliverable_dir):
+    """{path: content digest} of every readable deliverable (served from the corpus cache)."""
+    return {r.path: r.digest for r in get_cache().get_many(walk_files(deliverable_dir))}
+
+def memoized_metrics(requirements, relevant, deliverable_dir, digests, settings):
+    """
+    calculate_hardened_metrics of each requirement against its relevant files,
+    recomputed only when no stored result has the same fingerprint (metric
+    settings, requirement text, and path and content digest of each file).
+    Returns (metrics, fingerprints).
+    """
+    cache = get_cache()
+    metric_settings = [settings.codec, settings.solution_chars, list(settings.logic_exts)]
+    keys = [fingerprint(METRICS_VERSION, metric_settings, req,
+                        [(_relative(f, deliverable_dir), digests.get(f)) for f in files])
+            for req, files in zip(requirements, relevant)]
+    known = cache.get_results('requirement_metrics', keys)
+    computed = {}
+    metrics = []
+    for req, files, key in zip(requirements, relevant, keys):
+        if key in known:
+            metrics.append(tuple(known[key]))
+            continue
+        e, k = calculate_hardened_metrics(req, files, settings.codec, settings.solution_chars, settings.logic_exts)
+        computed[key] = (e, k)
+        metrics.append((e, k))
+    cache.put_results('requirement_metrics', computed)
+    return metrics, keys
+
+def decompose_chunk(item):
+    """
+    Computes the subtask rows for one chunk of a project's requirements.
+    A chunk whose requirement texts and deliverable contents are unchanged
+    since a previous run is served from the corpus cache without indexing the
+    project; otherwise only requirements whose text or relevant files changed
+    are recomputed (see memoized_metrics).
+    """
+    task_id, deliverable_dir, requirements, project, settings = item
+    cache = get_cache()
+    digests = deliverable_digests(deliverable_dir)
+    chunk_key = fingerprint(METRICS_VERSION, _settings_key(settings), requirements,
+                            sorted((_relative(p, deliverable_dir), d) for p, d in digests.items()))
+    known = cache.get_results('chunk_metrics', [chunk_key]).get(chunk_key)
+    if known is not None:
+        metrics = known['metrics']
+        # Keeps the per-requirement results this chunk was built from
+        cache.touch_results('requirement_metrics', known['keys'])
+    else:
+        index = _cached_project_index(deliverable_dir, settings.index_chars)
+        index.prime(set().union(*(requirement_keywords(r, settings.stop_words) for r in requirements)))
+        relevant = [map_req_to_files(req, deliverable_dir, index=index, stop_words=settings.stop_words)
+                    for req in requirements]
+        metrics, keys = memoized_metrics(requirements, relevant, deliverable_dir, digests, settings)
+        cache.put_results('chunk_metrics', {chunk_key: {'metrics': metrics, 'keys': keys}})
+    return [_subtask_row(task_id, req, e, k, project) for req, (e, k) in zip(requirements, metrics)]
+
+def decompose_chunk_batch(item):
+    """
+    Batch variant of decompose_chunk: requirement->file relevance for the whole
+    chunk comes from one sparse incidence product. Returns (rows, paths,
+    relevance, row scores).
+    """
+    task_id, deliverable_dir, requirements, project, settings = item
+    index = _cached_project_index(deliverable_dir, settings.index_chars)
+    inc = build_incidence([requirement_keywords(r, settings.stop_words) for r in requirements], index)
+    rel = relevance(inc)
     
-    for _, row in orig_df.iterrows():
-        task_id = row['Task ID']
+    metrics, _ = memoized_metrics(requirements, relevant_paths(rel, inc.paths), deliverable_dir,
+                                  deliverable_digests(deliverable_dir), settings)
+    rows = [_subtask_row(task_id, req, e, k, project) for req, (e, k) in zip(requirements, metrics)]
+    return rows, inc.paths, rel, row_scores(inc, rel)
+
+def project_columns(project):
+    """Subtask columns inherited from the project's master-dataset row."""
+    return {
+        'success': project['success_label'],
+        'ln_wage_eq': np.log(project['equilibrium_wage']) if project['equilibrium_wage'] > 0 else 0,
+        'automation_exposure': project['ai_applicability_score']
+    }
+
+def _subtask_row(task_id, req, e, k, project):
+    return {
+        'project_id': task_id,
+        'requirement': req[:100],
+        'e_hardened': e,
+        'k_hardened': k,
+        **project_columns(project),
+    }
+
+def subtask_columns(master):
+    """Typed columns of subtask_dataset_v2.csv; success keeps the master dataset's dtype."""
+    return [
+        ('project_id', object),
+        ('requirement', object),
+        ('e_hardened', np.float64),
+        ('k_hardened', np.float64),
+        ('success', master['success_label'].dtype if master['success_label'].dtype.kind in 'biuf' else object),
+        ('ln_wage_eq', np.float64),
+        ('automation_exposure', np.float64),
+    ]
+
+def iter_project_items(orig_df, settings, chunk_size=64, rli_base=None, start=0):
+    """
+    Lazily yields (position, task_id, work items) for each master row from
+    position start on; work items are chunks of the project's requirements
+    (briefs read from rli_base, default --source). Rows without a brief are skipped.
+    """
+    rli_base = rli_base or dataset_source.get_root()
+    columns = [orig_df[c].to_numpy() for c in ('Task ID', 'success_label', 'equilibrium_wage', 'ai_applicability_score')]
+    for position, (task_id, success, wage, exposure) in enumerate(zip(*columns)):
+        if position < start:
+            continue
         folder_path = os.path.join(rli_base, task_id)
         brief_path = os.path.join(folder_path, 'project', 'brief.md')
         deliverable_dir = os.path.join(folder_path, 'human_deliverable')
-        
-        if not os.path.exists(brief_path): continue
-        
-        with open(brief_path, 'r', encoding='utf-8') as f:
-            brief_text = f.read()
-            
-        requirements = extract_requirements(brief_text)
-        for req in requirements:
-            relevant_files = map_req_to_files(req, deliverable_dir)
-            e, k = calculate_hardened_metrics(req, relevant_files)
-            
-            subtask_data.append({
-                'project_id': task_id,
-                'requirement': req[:100],
-                'e_hardened': e,
-                'k_hardened': k,
-                'success': row['success_label'],
-                'ln_wage_eq': np.log(row['equilibrium_wage']) if row['equilibrium_wage'] > 0 else 0,
-                'automation_exposure': row['ai_applicability_score']
-            })
-            
-    df = pd.DataFrame(subtask_data)
-    df.to_csv('data/subtask_dataset_v2.csv', index=False)
-    print(f"Decomposition complete. N={len(df)} requirements processed.")
-    return df
+
+        if not dataset_source.exists(brief_path): continue
+
+        brief_text = dataset_source.read_text(brief_path)
+
+        requirements = extract_requirements(brief_text, settings.min_requirement_chars)
+        project = {'success_label': success, 'equilibrium_wage': wage, 'ai_applicability_score': exposure}
+        # Large briefs are split into requirement chunks so one task cannot stall the pool
+        yield position, task_id, [(task_id, deliverable_dir, chunk, project, settings)
+                                  for chunk in _chunked(requirements, chunk_size)]
+
+def build_work_items(orig_df, settings, chunk_size=64, rli_base=None):
+    """One work item per chunk of each project's requirements (briefs read from rli_base, default --source)."""
+    return [item for _, _, items in iter_project_items(orig_df, settings, chunk_size, rli_base) for item in items]
+
+def _rows_to_batch(rows, columns):
+    return {name: [r[name] for r in rows] for name, _ in columns}
+
+def checkpoint_key(settings, batch):
+    """Identifies a run's inputs and settings; a checkpoint is only resumed by a run with the same key."""
+    st = os.stat(MASTER_PATH)
+    ident = repr((_settings_key(settings), batch, dataset_source.get_root(), st.st_size, st.st_mtime_ns))
+    return hashlib.sha256(ident.encode('utf-8')).hexdigest()
+
+def load_checkpoint(key, path=CHECKPOINT_PATH):
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('key') == key else None
+
+def save_checkpoint(state, path=CHECKPOINT_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def decompose_projects(workers=1, chunk_size=64, codec=DEFAULT_CODEC, batch=False, resume=True):
+    """
+    Builds the expanded dataset using the hardened methodology.
+    batch=True maps requirements to files through sparse incidence matrices and
+    also exports the corpus requirement x file relevance matrix, whose rows
+    follow the rows of subtask_dataset_v2.csv, with each row's fan-out
+    (relevant files) and linkage score in relevance_rows.csv.
+
+    Rows are streamed to the output as each chunk finishes, and a checkpoint
+    is saved after every project; with resume=True a run interrupted midway
+    continues after the last completed project. Requirements whose text and
+    relevant files are unchanged are not recomputed (see decompose_chunk),
+    memoized results the completed run did not use are pruned, and the rows
+    that differ from the previous output are listed in
+    subtask_dataset_v2.changes.csv. Returns the number of rows.
+    """
+    if not os.path.exists(MASTER_PATH):
+        print("Master dataset missing.")
+        return 0
+
+    orig_df = read_dataset(MASTER_PATH, ['Task ID', 'success_label', 'equilibrium_wage', 'ai_applicability_score'])
+    settings = DecomposeSettings(codec=codec)
+    columns = subtask_columns(orig_df)
+    key = checkpoint_key(settings, batch)
+    state = load_checkpoint(key) if resume else None
+
+    def open_writers(state):
+        # The inclusion mask is precomputed in the columnar table for every reader
+        writer = DatasetWriter(SUBTASK_PATH, columns, extra={'included': included_mask},
+                               resume=state and state['subtasks'], key=['project_id', 'requirement'])
+        rel_writer = RelevanceWriter(resume=state and state['relevance']) if batch else None
+        return writer, rel_writer
+
+    try:
+        writer, rel_writer = open_writers(state)
+    except (OSError, ValueError, KeyError):
+        # Partial outputs no longer match the checkpoint
+        state = None
+        writer, rel_writer = open_writers(state)
+    if state:
+        print(f"Resuming after {state['last_task']} ({state['subtasks']['rows']} requirements already written).")
+    # Memoized results used since this (possibly resumed) run began are kept
+    started = state.get('started', 0) if state else time.time()
+
+    # (position, task_id, last chunk of the project?) of each item handed to the pool, in order
+    pending = deque()
+
+    def work_items():
+        for position, task_id, items in iter_project_items(orig_df, settings, chunk_size,
+                                                            start=state['next_row'] if state else 0):
+            for i, item in enumerate(items):
+                pending.append((position, task_id, i == len(items) - 1))
+                yield item
+
+    func = decompose_chunk_batch if batch else decompose_chunk
+    for result in parallel_imap(func, work_items(), workers=workers):
+        position, task_id, last = pending.popleft()
+        if batch:
+            rows, paths, rel, scores = result
+            rel_writer.write_rows(rel, scores)
+        else:
+            rows = result
+        writer.write(_rows_to_batch(rows, columns))
+        if not last:
+            continue
+        if batch:
+            rel_writer.end_block(paths)
+        save_checkpoint({
+            'key': key, 'started': started, 'next_row': int(position) + 1, 'last_task': str(task_id),
+            'subtasks': writer.position(),
+            'relevance': rel_writer.position() if batch else None,
+        })
+
+    # Also writes the change report against the previous version
+    n_rows = writer.commit()
+    if batch:
+        paths, rel = rel_writer.finish(n_rows)
+        print(f"Relevance matrix: {rel.shape[0]} requirements x {rel.shape[1]} files, nnz={rel.nnz}")
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    # Batch mode looks up requirement results only, so chunk results are kept for the default mode
+    pruned = get_cache().prune_results(['requirement_metrics'] if batch else ['chunk_metrics', 'requirement_metrics'],
+                                       started)
+    print(f"Decomposition complete. N={n_rows} requirements processed.")
+    if pruned:
+        print(f"Pruned {pruned} memoized results no longer used.")
+    print(summarize_changes(writer.changes, SUBTASK_PATH))
+    return n_rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decompose RLI briefs into requirement-level subtasks.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (0 = all cores)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Requirements per work item for large briefs")
+    parser.add_argument('--batch', action='store_true', help="Sparse incidence-matrix mode; also exports the relevance matrix and per-requirement fan-out/linkage scores")
+    parser.add_argument('--codec', default=DEFAULT_CODEC, help="MDL codec: zlib[:level], bz2[:level] or lzma[:preset]")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an interrupted run and start over")
+    dataset_source.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    dataset_source.configure(args)
+    instrumentation.configure(args)
+    decompose_projects(workers=args.workers, chunk_size=args.chunk_size, codec=args.codec, batch=args.batch,
+                       resume=not args.restart)
 
 if __name__ == "__main__":
-    decompose_projects()
+    main()
@@ -0,0 +1,203 @@
+import os
+import io
+import csv
+import mmap
+import codecs
+import hashlib
+from collections import namedtuple
+
+import instrumentation
+import dataset_source
+
+# Shared reader for deliverable files.
+#
+# RLI deliverables mix source, documents and large media assets. Every file is
+# classified from its first few KB (magic bytes, then extension, then NUL
+# bytes) before any body is read: binary assets are stubbed as empty text
+# without touching the rest of the file, and text files are read through an
+# mmap up to a fixed byte cap (archive and mirror members are streamed
+# instead). Decoding matches open(path, 'r', encoding='utf-8',
+# errors='ignore').read() on everything that is read.
+
+SNIFF_BYTES = 8192          # Bytes inspected to classify a file
+MAX_TEXT_BYTES = 32 << 20   # Text files are read up to this many bytes
+READ_BLOCK = 1 << 20        # Bytes decoded per chunk
+
+SKIP_REPORT_PATH = 'data/skipped_deliverables.csv'
+
+TEXT = 'text'
+BINARY = 'binary'
+
+# (offset, signature, label)
+_MAGIC = (
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'\xff\xd8\xff', 'jpeg'),
+    (0, b'GIF87a', 'gif'),
+    (0, b'GIF89a', 'gif'),
+    (0, b'II*\x00', 'tiff'),
+    (0, b'MM\x00*', 'tiff'),
+    (0, b'8BPS', 'psd'),
+    (0, b'%PDF', 'pdf'),
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'ole2'),
+    (0, b'\x1f\x8b', 'gzip'),
+    (0, b'7z\xbc\xaf\x27\x1c', '7z'),
+    (0, b'Rar!\x1a\x07', 'rar'),
+    (0, b'RIFF', 'riff'),
+    (0, b'OggS', 'ogg'),
+    (0, b'fLaC', 'flac'),
+    (0, b'ID3', 'mp3'),
+    (0, b'\x1aE\xdf\xa3', 'matroska'),
+    (4, b'ftyp', 'mp4'),
+    (0, b'Kaydara FBX Binary', 'fbx'),
+    (0, b'glTF', 'glb'),
+    (0, b'\x7fELF', 'elf'),
+    (0, b'SQLite format 3\x00', 'sqlite'),
+)
+
+BINARY_EXTS = frozenset({
+    # images
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp', '.ico', '.psd', '.ai', '.heic',
+    # audio / video
+    '.mp3', '.wav', '.flac', '.ogg', '.m4a', '.aac', '.aif', '.aiff', '.mid', '.midi',
+    '.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v', '.wmv',
+    # 3D / CAD
+    '.fbx', '.blend', '.glb', '.stl', '.3ds', '.3dm', '.max', '.dwg', '.skp', '.c4d', '.usdz',
+    # documents / archives
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.odt', '.ods',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.tar',
+    # fonts / executables / data
+    '.ttf', '.otf', '.woff', '.woff2', '.exe', '.dll', '.so', '.dylib', '.bin', '.pyc', '.wasm', '.c3p',
+    '.npy', '.npz', '.pkl', '.parquet', '.sqlite', '.db',
+})
+
+Sniffed = namedtuple('Sniffed', ['kind', 'reason', 'size'])
+
+
+def classify(path, head):
+    """Returns (kind, reason) from a file's leading bytes and its extension."""
+    for offset, signature, label in _MAGIC:
+        if head[offset:offset + len(signature)] == signature:
+            return BINARY, f'magic:{label}'
+    ext = os.path.splitext(path)[1].lower()
+    if ext in BINARY_EXTS:
+        return BINARY, f'ext:{ext}'
+    if b'\x00' in head:
+        return BINARY, 'nul-bytes'
+    return TEXT, ''
+
+
+def sniff(path, max_bytes=MAX_TEXT_BYTES):
+    """Classifies path by reading at most SNIFF_BYTES. Raises OSError if unreadable."""
+    source = dataset_source.source_for(path)
+    size = source.stat(path).size
+    with source.open(path) as f:
+        head = f.read(SNIFF_BYTES)
+    instrumentation.count('files_opened')
+    instrumentation.count('bytes_read', len(head))
+    kind, reason = classify(path, head)
+    if kind == TEXT and size > max_bytes:
+        reason = 'truncated'
+    return Sniffed(kind, reason, size)
+
+
+def _mapped(f, size):
+    if size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _iter_member_bytes(source, path, max_bytes, block):
+    with source.open(path) as f:
+        instrumentation.count('files_opened')
+        remaining = max_bytes
+        while remaining > 0:
+            data = f.read(min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            instrumentation.count('bytes_read', len(data))
+            yield data
+
+
+def iter_text_bytes(path, max_bytes=MAX_TEXT_BYTES, block=READ_BLOCK):
+    """Yields the first max_bytes of path in blocks, from a read-only mmap."""
+    source = dataset_source.source_for(path)
+    if not source.local:
+        yield from _iter_member_bytes(source, path, max_bytes, block)
+        return
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        buf = _mapped(f, size)
+        instrumentation.count('files_opened')
+        try:
+            limit = min(size, max_bytes)
+            for start in range(0, limit, block):
+                data = buf[start:min(start + block, limit)]
+                instrumentation.count('bytes_read', len(data))
+                yield data
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+
+def iter_text_chunks(path, max_bytes=MAX_TEXT_BYTES, block=READ_BLOCK):
+    """
+    Decoded text chunks of the first max_bytes of path, with the same UTF-8
+    error handling and newline translation as text-mode open().
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder('utf-8')(errors='ignore'), translate=True
+    )
+    for data in iter_text_bytes(path, max_bytes, block):
+        chunk = decoder.decode(data)
+        if chunk:
+            yield chunk
+    chunk = decoder.decode(b'', final=True)
+    if chunk:
+        yield chunk
+
+
+def content_digest(path, sniffed, max_bytes=MAX_TEXT_BYTES):
+    """
+    Digest of exactly the content the reader would use: binary files are keyed
+    by their classification alone (their features are a fixed stub), text
+    files by a sha256 of the bytes up to the cap.
+    """
+    if sniffed.kind == BINARY:
+        return f'{BINARY}:{sniffed.reason}'
+    h = hashlib.sha256()
+    for data in iter_text_bytes(path, max_bytes):
+        h.update(data)
+    if sniffed.reason:
+        h.update(f'|{sniffed.reason}'.encode())
+    return h.hexdigest()
+
+
+def write_skip_report(records, path=SKIP_REPORT_PATH):
+    """
+    Writes one CSV row per binary or truncated file (path, size, kind, reason)
+    from records with path/size/kind/reason attributes. Returns the row count.
+    """
+    rows = [r for r in records if r.kind != TEXT or r.reason]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path', 'size', 'kind', 'reason'])
+        for r in rows:
+            writer.writerow([r.path, r.size, r.kind, r.reason])
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    from corpus_cache import get_cache, walk_files
+
+    parser = argparse.ArgumentParser(description="List deliverable files the reader stubs or truncates.")
+    parser.add_argument('root', nargs='?', default=None, help="Corpus directory, archive or mirror (default: --source)")
+    parser.add_argument('--out', default=SKIP_REPORT_PATH)
+    args = parser.parse_args()
+    root = args.root or dataset_source.get_root()
+    dataset_source.open_source(root)
+    n = write_skip_report(get_cache().get_many(walk_files(root)), args.out)
+    print(f"{n} skipped or truncated files written to {args.out}")
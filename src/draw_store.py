@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import glob
+import hashlib
+import numpy as np
+
+import instrumentation
+
+# On-disk store of bootstrap draws.
+#
+# Each store directory holds meta.json (seed, formula, method, data hash,
+# column names, chunk list) and one .npy file per appended chunk of draws.
+# Chunks are loaded memory-mapped. Every chunk has the store's fixed chunk
+# size and chunk i is always drawn from default_rng([seed, i]), so extending
+# a store gives the same draws as a single longer run.
+STORE_ROOT = 'output/v2/bootstrap_store'
+
+# Reported percentile confidence interval
+_QUANTILES = (0.025, 0.975)
+MAX_EMPTY_CHUNKS = 5  # Consecutive chunks without a valid draw before fill_store gives up
+
+
+def hash_arrays(*arrays):
+    """Content hash of the estimation data (design matrices, outcomes, clusters)."""
+    h = hashlib.sha256()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str(a.dtype).encode())
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+class DrawStore:
+    """Append-only, memory-mapped store of bootstrap coefficient draws."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+
+    @classmethod
+    def open(cls, spec, root=STORE_ROOT, chunk_size=200):
+        """
+        Opens (or creates) the store for spec, a dict with formula, method,
+        data_hash, columns and seed. Stores are keyed by everything except an
+        unspecified seed, so repeated runs extend the same draws.
+        """
+        key_fields = {k: v for k, v in spec.items() if not (k == 'seed' and v is None)}
+        key = hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode()).hexdigest()[:16]
+        # The method names the directory, reduced to a filename-safe slug
+        slug = re.sub(r'[^A-Za-z0-9_.]+', '-', str(spec.get('method', 'draws'))).strip('-.') or 'draws'
+        path = os.path.join(root, f"{slug}-{key}")
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return cls(path, meta)
+
+        os.makedirs(path, exist_ok=True)
+        meta = dict(spec)
+        if meta.get('seed') is None:
+            meta['seed'] = int(np.random.SeedSequence().entropy % (2 ** 63))
+        meta['chunk_size'] = int(chunk_size)
+        meta['chunks'] = []
+        store = cls(path, meta)
+        store._write_meta()
+        return store
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    @property
+    def columns(self):
+        return self.meta['columns']
+
+    @property
+    def n_draws(self):
+        return sum(c['rows'] for c in self.meta['chunks'])
+
+    def next_rng(self):
+        """Generator for the next chunk; deterministic given the seed and chunk index."""
+        return np.random.default_rng([self.meta['seed'], len(self.meta['chunks'])])
+
+    def append(self, draws):
+        """Writes one chunk of draws (rows x columns) and records it in the metadata."""
+        draws = np.asarray(draws, dtype=float)
+        name = f"chunk_{len(self.meta['chunks']):05d}.npy"
+        np.save(os.path.join(self.path, name), draws)
+        self.meta['chunks'].append({'file': name, 'rows': int(len(draws))})
+        self._write_meta()
+
+    def _chunks(self):
+        for c in self.meta['chunks']:
+            yield np.load(os.path.join(self.path, c['file']), mmap_mode='r')
+
+    def column(self, j):
+        """All draws of one coefficient, read column-wise from the memory-mapped chunks."""
+        parts = [chunk[:, j] for chunk in self._chunks()]
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def load(self):
+        parts = list(self._chunks())
+        return np.concatenate(parts) if parts else np.empty((0, len(self.columns)))
+
+    def clear(self):
+        for f in glob.glob(os.path.join(self.path, 'chunk_*.npy')):
+            os.remove(f)
+        self.meta['chunks'] = []
+        self._write_meta()
+
+
+def summarize_column(x):
+    """
+    Bootstrap summary of one coefficient plus Monte Carlo standard errors of
+    the reported p-value and CI endpoints. All NaN when there are no draws.
+    """
+    B = len(x)
+    if B == 0:
+        return dict.fromkeys(['mean', 'std', 'ci_lower', 'ci_upper', 'p', 'mcse_p', 'mcse_ci_lower',
+                              'mcse_ci_upper'], np.nan)
+    mean_val = x.mean()
+    std_err = x.std(ddof=1) if B > 1 else np.nan
+    ci_lower, ci_upper = np.quantile(x, _QUANTILES)
+    tail = (x < 0).mean() if mean_val > 0 else (x > 0).mean()
+    p_val = min(1.0, tail * 2)
+    # Floor the tail at 1/B so p = 0 is never reported as exact
+    t = min(max(tail, 1.0 / B), 0.5)
+    mcse_p = 2 * np.sqrt(t * (1 - t) / B)
+    # Order-statistic MCSE of a quantile: half the spread of the q +/- se(q) quantiles
+    mcse_ci = []
+    for q in _QUANTILES:
+        se_q = np.sqrt(q * (1 - q) / B)
+        lo, hi = np.quantile(x, [max(q - se_q, 0.0), min(q + se_q, 1.0)])
+        mcse_ci.append((hi - lo) / 2)
+    return {
+        'mean': mean_val, 'std': std_err, 'ci_lower': ci_lower, 'ci_upper': ci_upper, 'p': p_val,
+        'mcse_p': mcse_p, 'mcse_ci_lower': mcse_ci[0], 'mcse_ci_upper': mcse_ci[1],
+    }
+
+
+def summarize_store(store):
+    """Per-coefficient summaries computed column by column from the store."""
+    return {col: summarize_column(store.column(j)) for j, col in enumerate(store.columns)}
+
+
+def is_converged(summary, tol, ci_tol):
+    """
+    True once every p-value MCSE is below tol and every CI-endpoint MCSE is
+    below ci_tol times that coefficient's bootstrap standard error.
+    """
+    for s in summary.values():
+        if not s['mcse_p'] < tol:
+            return False
+        scale = s['std'] if s['std'] > 0 else 1.0
+        if not max(s['mcse_ci_lower'], s['mcse_ci_upper']) < ci_tol * scale:
+            return False
+    return True
+
+
+@instrumentation.traced('bootstrap')
+def fill_store(store, draw_chunk, min_draws, tol=None, ci_tol=0.05, max_draws=100000):
+    """
+    Appends chunks from draw_chunk(n, rng) until the store holds at least
+    min_draws draws and, when tol is given, until the Monte Carlo errors of
+    every p-value and CI endpoint are small enough (or max_draws is reached).
+    Returns the final per-coefficient summary (NaN when no valid draw was
+    obtained, e.g. when every replicate fails).
+    """
+    chunk_size = store.meta['chunk_size']
+    added = 0
+    empty = 0
+    while True:
+        n = store.n_draws
+        if n >= min_draws:
+            if tol is None or n >= max_draws:
+                break
+            if is_converged(summarize_store(store), tol, ci_tol):
+                break
+        draws = draw_chunk(chunk_size, store.next_rng())
+        store.append(draws)
+        added += 1
+        empty = empty + 1 if len(draws) == 0 else 0
+        if empty >= MAX_EMPTY_CHUNKS or added > 10 * max_draws // chunk_size + 10:
+            # Guard against chunks that keep coming back empty
+            break
+    if store.n_draws == 0:
+        print(f"No valid bootstrap draws after {added} chunks of {chunk_size} replicates; "
+              f"the bootstrap summary is undefined (NaN).")
+    return summarize_store(store)
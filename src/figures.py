@@ -0,0 +1,125 @@
+import os
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+import instrumentation
+from columnar import SUBTASK_PATH, read_dataset
+from parallel import parallel_map
+
+# Renders every figure from one shared, precomputed copy of the data.
+#
+# The subtask table is read once (memory-mapped columns when the columnar
+# table is current), the estimation sample, its logs and the selection bins
+# are derived once, and each figure is then drawn in its own worker process
+# on the non-interactive Agg backend. A job carries only the columns its
+# figure needs; the expensive per-figure work (the binned KDE, the kink
+# bootstrap) runs inside the workers, so figures finish concurrently.
+#
+#   python src/figures.py --workers 0        # every figure, one process each
+#   python src/figures.py frontier           # just the frontier heatmap
+
+OUTPUT_DIRS = ['output/v2', 'paper']
+KINK_BOOT = 200  # Cluster-bootstrap replicates for the breakpoint CI
+
+Figure = namedtuple('Figure', ['filename', 'message'])
+
+FIGURES = {
+    'frontier': Figure('subtask_complexity_heatmap.png', "Hardened Frontier Map generated."),
+    'structural_break': Figure('complexity_kink_expanded.png', "Hardened Structural Break Plot generated."),
+    'selection_cliff': Figure('selection_cliff.png', "New 'Selection Cliff' visual generated."),
+}
+
+FigureData = namedtuple('FigureData', ['sample', 'selection'])
+
+
+def load_figure_data(path=SUBTASK_PATH):
+    """The estimation sample with log E / log kappa, and the selection-cliff bins, from one read of path."""
+    import pandas as pd
+    from generate_selection_visual import selection_bins
+
+    df = read_dataset(path, ['project_id', 'e_hardened', 'k_hardened', 'ln_wage_eq', 'automation_exposure',
+                             'included'])
+    # Use the same filtering as the model
+    mask = np.asarray(df['included']) == 1
+    sample = pd.DataFrame({
+        'project_id': np.asarray(df['project_id'])[mask],
+        'ln_wage_eq': np.asarray(df['ln_wage_eq'], dtype=float)[mask],
+        # Information Theory logs
+        'log_e': np.log(np.asarray(df['e_hardened'], dtype=float)[mask]),
+        'log_k': np.log(np.asarray(df['k_hardened'], dtype=float)[mask]),
+    })
+    return FigureData(sample, selection_bins(df))
+
+
+def figure_paths(name):
+    return [os.path.join(d, FIGURES[name].filename) for d in OUTPUT_DIRS]
+
+
+def figure_jobs(data, names, kink_boot=KINK_BOOT):
+    """(name, payload, paths, kink_boot) per figure; payloads hold only the columns that figure draws."""
+    payloads = {
+        'frontier': data.sample[['log_e', 'log_k']],
+        'structural_break': data.sample[['project_id', 'log_e', 'ln_wage_eq']],
+        'selection_cliff': data.selection,
+    }
+    return [(name, payloads[name], figure_paths(name), kink_boot) for name in names]
+
+
+def render_figure(job):
+    """Draws one figure job on the Agg backend; returns its name."""
+    import matplotlib
+    matplotlib.use('Agg')
+    name, payload, paths, kink_boot = job
+    with instrumentation.span(f'figure:{name}'):
+        if name == 'frontier':
+            from generate_hardened_visuals import plot_frontier
+            plot_frontier(payload, paths)
+        elif name == 'structural_break':
+            from kink_search import estimate_kink
+            from generate_hardened_visuals import plot_structural_break
+            kink = estimate_kink(payload['log_e'], payload['ln_wage_eq'], n_boot=kink_boot,
+                                 groups=payload['project_id'], seed=0)
+            plot_structural_break(payload, kink, paths)
+        else:
+            from generate_selection_visual import plot_selection_cliff
+            plot_selection_cliff(payload, paths)
+    return name
+
+
+@instrumentation.traced()
+def render_figures(names=None, workers=1, path=SUBTASK_PATH, kink_boot=KINK_BOOT):
+    """Renders the named figures (default: all), concurrently when workers > 1."""
+    names = list(FIGURES) if not names else list(names)
+    unknown = [n for n in names if n not in FIGURES]
+    if unknown:
+        raise ValueError(f"Unknown figure(s): {', '.join(unknown)}")
+    if not os.path.exists(path):
+        print("Hardened dataset missing.")
+        return []
+
+    data = load_figure_data(path)
+    for d in OUTPUT_DIRS:
+        os.makedirs(d, exist_ok=True)
+    done = parallel_map(render_figure, figure_jobs(data, names, kink_boot), workers=workers)
+    for name in done:
+        print(FIGURES[name].message)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the paper figures from the subtask dataset.")
+    parser.add_argument('figures', nargs='*', help=f"Figures to render: {', '.join(FIGURES)} (default: all)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes, one figure each (0 = all cores)")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    unknown = [n for n in args.figures if n not in FIGURES]
+    if unknown:
+        parser.error(f"unknown figure(s): {', '.join(unknown)}")
+    instrumentation.configure(args)
+    render_figures(args.figures, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
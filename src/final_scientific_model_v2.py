@@ -1,89 +1,225 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-from sklearn.utils import resample
-from scipy.stats import norm
 import os
+import argparse
+import instrumentation
+from bootstrap_engine import ClusterDesign, HeckmanDesign, cluster_bootstrap, two_step_bootstrap
+from draw_store import DrawStore, hash_arrays, fill_store, summarize_column
+from logit_engine import fit_logit_batch, logit_cluster_bootstrap, logit_permutation_test
+from columnar import SUBTASK_PATH, read_dataset
+
+TRANSLOG_FORMULA = 'ln_wage_eq ~ c_log_e + c_log_k + I(0.5*c_log_e**2) + I(0.5*c_log_k**2) + I(c_log_e*c_log_k) + IMR'
+LOGIT_FORMULA = 'success ~ e_hardened + k_hardened'
+
+def selection_imr(df, df_clean, disp=True):
+    """Heckman first stage: Probit of inclusion on automation exposure, and the IMR of the included rows."""
+    import statsmodels.api as sm
+    from scipy.stats import norm
+
+    first_stage = sm.Probit(df['included'], sm.add_constant(df['automation_exposure'])).fit(disp=disp)
+    # λ(x) = φ(xβ) / Φ(xβ)
+    xb = first_stage.predict(sm.add_constant(df_clean['automation_exposure']), transform=False)
+    return first_stage, norm.pdf(xb) / norm.cdf(xb)
+
+def add_translog_terms(df_clean):
+    """Mean-centered log E and log kappa used by TRANSLOG_FORMULA."""
+    df_clean['c_log_e'] = np.log(df_clean['e_hardened']) - np.log(df_clean['e_hardened']).mean()
+    df_clean['c_log_k'] = np.log(df_clean['k_hardened']) - np.log(df_clean['k_hardened']).mean()
+    return df_clean
+
+def success_model_inference(df_clean, mode='both', n_draws=2000, seed=None, firth=False):
+    """
+    Batched logit of LOGIT_FORMULA with project-cluster bootstrap and/or
+    permutation inference (mode 'bootstrap', 'permutation' or 'both').
+    """
+    import statsmodels.formula.api as smf
+
+    model = smf.logit(LOGIT_FORMULA, data=df_clean)
+    X, y = model.exog, model.endog
+    groups = df_clean.loc[model.data.row_labels, 'project_id'].to_numpy()
+    columns = list(model.exog_names)
+    fit = fit_logit_batch(X, y, firth=firth)
+    result = {'columns': columns, 'beta': fit.beta[0], 'converged': bool(fit.converged[0]),
+              'separated': bool(fit.separated[0]), 'firth': firth, 'n_draws': n_draws}
+    if not result['converged']:
+        # Without an MLE there is nothing to resample around; Firth always has one
+        return result
+
+    rng = np.random.default_rng(seed)
+    if mode in ('bootstrap', 'both'):
+        draws, valid = logit_cluster_bootstrap(X, y, groups, n_draws, rng=rng, firth=firth, beta0=fit.beta[0])
+        result['bootstrap_valid'] = int(valid.sum())
+        if valid.sum() > 1:
+            result['bootstrap'] = {col: summarize_column(draws[valid, j]) for j, col in enumerate(columns)}
+    if mode in ('permutation', 'both'):
+        p, _, valid = logit_permutation_test(X, y, groups, n_draws, rng=rng, firth=firth, beta_obs=fit.beta[0])
+        result['permutation_valid'] = int(valid.sum())
+        # The intercept has no permutation null (its p is NaN), so it is left out
+        result['permutation_p'] = {col: pj for col, pj in zip(columns, p) if not np.isnan(pj)}
+    return result
+
+def format_logit_inference(result):
+    """Plain-text table of a success_model_inference result."""
+    label = 'Firth-penalized' if result['firth'] else 'ML'
+    lines = [f"Batched {label} logit: {LOGIT_FORMULA}"]
+    if not result['converged']:
+        lines.append("Point estimate did not converge (separation); rerun with --firth.")
+        return '\n'.join(lines)
+    if result['separated']:
+        lines.append("Warning: the data are (quasi-)separated; estimates are Firth-penalized.")
+    if 'bootstrap_valid' in result:
+        lines.append(f"Cluster bootstrap: {result['bootstrap_valid']}/{result['n_draws']} replicates converged")
+    if 'permutation_valid' in result:
+        lines.append(f"Permutation test: {result['permutation_valid']}/{result['n_draws']} permutations converged")
+    boot = result.get('bootstrap', {})
+    perm = result.get('permutation_p', {})
+    for j, col in enumerate(result['columns']):
+        line = f"{col}: {result['beta'][j]:.4f}"
+        if col in boot:
+            b = boot[col]
+            line += f" (SE {b['std']:.4f}) [{b['ci_lower']:.4f}, {b['ci_upper']:.4f}] boot p={b['p']:.4f}"
+        if col in perm:
+            line += f" perm p={perm[col]:.4f}"
+        elif 'permutation_p' in result:
+            line += " perm p=n/a"
+        lines.append(line)
+    return '\n'.join(lines)
+
+def run_hardened_analysis(n_iterations=200, method='pairs', weights='rademacher', seed=None, two_step=False,
+                          tol=None, ci_tol=0.05, max_draws=100000, chunk_size=200, fresh=False,
+                          logit_inference='none', logit_draws=2000, firth=False):
+    # Loaded here so importing the module (e.g. for --help) stays fast
+    import statsmodels.formula.api as smf
 
-def run_hardened_analysis():
     # Load the new V2 dataset
-    df = pd.read_csv('data/subtask_dataset_v2.csv')
+    # Only the model columns are loaded; 'included' is the precomputed inclusion mask
+    df = read_dataset(SUBTASK_PATH, ['project_id', 'e_hardened', 'k_hardened', 'success', 'ln_wage_eq',
+                                     'automation_exposure', 'included'])
     
     # Filter for valid observations
-    df_clean = df[(df['e_hardened'] > 0) & (df['k_hardened'] > 0) & (df['ln_wage_eq'] > 0)].copy()
+    df_clean = df[df['included'] == 1].copy()
     
     print(f"Dataset Hardening: Filtered {len(df)} requirements down to N={len(df_clean)} valid subtasks.")
     
     # 1. HECKMAN FIRST STAGE: Selection into inclusion
-    df['included'] = df.apply(lambda x: 1 if (x['e_hardened'] > 0 and x['k_hardened'] > 0 and x['ln_wage_eq'] > 0) else 0, axis=1)
-    
     print("\n--- HECKMAN FIRST STAGE (PROBIT) ---")
-    first_stage = sm.Probit(df['included'], sm.add_constant(df['automation_exposure'])).fit()
+    # Probit fit and Inverse Mills Ratio (IMR) of the included rows
+    first_stage, imr = selection_imr(df, df_clean)
     print(first_stage.summary())
-    
-    # Calculate Inverse Mills Ratio (IMR)
-    # λ(x) = φ(xβ) / Φ(xβ)
-    xb = first_stage.predict(sm.add_constant(df_clean['automation_exposure']), transform=False)
-    imr = norm.pdf(xb) / norm.cdf(xb)
     df_clean['IMR'] = imr
     
     # 2. INFERENCE PERFORMANCE MODEL (LOGIT)
     print("\n--- INFERENCE PERFORMANCE MODEL (LOGIT) ---")
-    logit_formula = 'success ~ e_hardened + k_hardened'
     try:
-        model_logit = smf.logit(logit_formula, data=df_clean).fit()
+        model_logit = smf.logit(LOGIT_FORMULA, data=df_clean).fit()
         print(model_logit.summary())
-    except:
-        print("Logit Model failed to converge (Perfect Separation likely).")
+    except Exception as e:
+        print(f"Logit Model failed ({type(e).__name__}: {e}); see the batched fit (--logit-inference, --firth).")
         model_logit = None
     
+    # Resampling inference for the success equation: all replicates in one batched Newton solve
+    logit_result = None
+    if logit_inference != 'none':
+        logit_result = success_model_inference(df_clean, logit_inference, logit_draws, seed, firth)
+        print(format_logit_inference(logit_result))
+    
     # 3. MARKET VALUATION MODEL (MEAN-CENTERED TRANSLOG)
-    df_clean['c_log_e'] = np.log(df_clean['e_hardened']) - np.log(df_clean['e_hardened']).mean()
-    df_clean['c_log_k'] = np.log(df_clean['k_hardened']) - np.log(df_clean['k_hardened']).mean()
+    add_translog_terms(df_clean)
     
     print("\n--- MARKET VALUATION MODEL (BOOTSTRAP) ---")
-    translog_formula = 'ln_wage_eq ~ c_log_e + c_log_k + I(0.5*c_log_e**2) + I(0.5*c_log_k**2) + I(c_log_e*c_log_k) + IMR'
-    
-    n_iterations = 200
-    bootstrap_results = []
-    projects = df_clean['project_id'].unique()
     
-    for i in range(n_iterations):
-        sample_projects = resample(projects)
-        sample_df = pd.concat([df_clean[df_clean['project_id'] == p] for p in sample_projects])
-        try:
-            m = smf.ols(translog_formula, data=sample_df).fit()
-            bootstrap_results.append(m.params)
-        except: continue
-        
-    boot_df = pd.DataFrame(bootstrap_results)
+    # Design matrix (incl. IMR) is built once; replicates are batched NumPy solves
+    if two_step:
+        # Full-pipeline bootstrap: Probit and IMR are re-estimated in every replicate
+        design = HeckmanDesign(TRANSLOG_FORMULA, df_clean, df, 'included', ['automation_exposure'],
+                               'project_id', gamma0=first_stage.params.values)
+
+        def draw_chunk(n, rng):
+            draws, valid = two_step_bootstrap(design, n, rng=rng)
+            return draws[valid]
+        label, slug = 'two-step pairs', 'two-step-pairs'
+    else:
+        design = ClusterDesign(TRANSLOG_FORMULA, df_clean, 'project_id')
+
+        def draw_chunk(n, rng):
+            return cluster_bootstrap(design, n, method=method, weights=weights, rng=rng)
+        label = method if method == 'pairs' else f'wild ({weights})'
+        slug = method if method == 'pairs' else f'wild-{weights}'
+
+    # Draws accumulate in an on-disk store keyed by formula, method and data hash,
+    # so later runs extend earlier ones instead of starting over
+    spec = {
+        'formula': TRANSLOG_FORMULA, 'method': slug, 'seed': seed,
+        'columns': design.columns, 'data_hash': hash_arrays(*design.data_arrays()),
+    }
+    store = DrawStore.open(spec, chunk_size=chunk_size)
+    if fresh:
+        store.clear()
+    before = store.n_draws
+    summary = fill_store(store, draw_chunk, n_iterations, tol=tol, ci_tol=ci_tol, max_draws=max_draws)
+    print(f"{label} cluster bootstrap over G={design.n_clusters} projects: "
+          f"{store.n_draws} draws in store ({store.n_draws - before} new) at {store.path}")
     
     # Print results without special characters
     print("\nFull Model Table (for LaTeX):")
-    for col in boot_df.columns:
-        mean_val = boot_df[col].mean()
-        std_err = boot_df[col].std()
-        ci_lower = boot_df[col].quantile(0.025)
-        ci_upper = boot_df[col].quantile(0.975)
-        p_val = (boot_df[col] < 0).mean() * 2 if mean_val > 0 else (boot_df[col] > 0).mean() * 2
-        print(f"{col}: {mean_val:.4f} ({std_err:.4f}) [{ci_lower:.4f}, {ci_upper:.4f}] p={min(1.0, p_val):.4f}")
-
-    # Save outputs
-    os.makedirs('output/v2', exist_ok=True)
-    with open('output/v2/hardened_results.txt', 'w') as f:
+    for col, r in summary.items():
+        print(f"{col}: {r['mean']:.4f} ({r['std']:.4f}) [{r['ci_lower']:.4f}, {r['ci_upper']:.4f}] p={r['p']:.4f}"
+              f"  (MCSE p={r['mcse_p']:.4f}, CI={r['mcse_ci_lower']:.4f}/{r['mcse_ci_upper']:.4f})")
+
+    # Save outputs (bootstrap sections are generated from the draw store)
+    write_results(store, summary, label, model_logit, logit_result)
+
+def write_results(store, summary, label, model_logit=None, logit_result=None, path='output/v2/hardened_results.txt'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
         f.write("HARDENED SCIENTIFIC RESULTS (V2)\n")
         f.write("================================\n\n")
         if model_logit:
             f.write("LOGIT SUCCESS MODEL:\n")
             f.write(model_logit.summary().as_text())
-        f.write("\n\nTRANSLOG WAGE MODEL (BOOTSTRAP):\n")
-        f.write(boot_df.mean().to_string())
+        if logit_result:
+            f.write("\n\nLOGIT SUCCESS MODEL (RESAMPLING INFERENCE):\n")
+            f.write(format_logit_inference(logit_result) + "\n")
+        f.write(f"\n\nTRANSLOG WAGE MODEL (BOOTSTRAP: {label}, B={store.n_draws}):\n")
+        f.write(pd.Series({col: r['mean'] for col, r in summary.items()}).to_string())
         f.write("\n\nSIGNIFICANCE:\n")
-        for col in boot_df.columns:
-            mean_val = boot_df[col].mean()
-            p_val = (boot_df[col] < 0).mean() * 2 if mean_val > 0 else (boot_df[col] > 0).mean() * 2
-            f.write(f"{col}: p ~= {min(1.0, p_val):.4f}\n")
+        for col, r in summary.items():
+            f.write(f"{col}: p ~= {r['p']:.4f} (MCSE {r['mcse_p']:.4f})\n")
+        f.write("\n95% PERCENTILE CI (MCSE of endpoints):\n")
+        for col, r in summary.items():
+            f.write(f"{col}: [{r['ci_lower']:.4f}, {r['ci_upper']:.4f}] "
+                    f"({r['mcse_ci_lower']:.4f}, {r['mcse_ci_upper']:.4f})\n")
+        f.write(f"\nDraw store: {store.path} (seed {store.meta['seed']})\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Heckman-corrected translog model with cluster bootstrap.")
+    parser.add_argument('--draws', type=int, default=200, help="Minimum bootstrap replicates in the draw store")
+    parser.add_argument('--method', choices=['pairs', 'wild'], default='pairs', help="Pairs-cluster resample or wild cluster bootstrap")
+    parser.add_argument('--weights', choices=['rademacher', 'webb'], default='rademacher', help="Wild bootstrap weight distribution")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--two-step', action='store_true', help="Re-estimate the Probit first stage and IMR in every replicate")
+    parser.add_argument('--tol', type=float, default=None, help="Keep drawing until every p-value MCSE is below this")
+    parser.add_argument('--ci-tol', type=float, default=0.05, help="CI endpoint MCSE target, as a fraction of the bootstrap SE")
+    parser.add_argument('--max-draws', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=200, help="Draws per stored chunk (fixed when a store is created)")
+    parser.add_argument('--fresh', action='store_true', help="Discard existing draws in the matching store")
+    parser.add_argument('--logit-inference', choices=['none', 'bootstrap', 'permutation', 'both'], default='none',
+                        help="Cluster-bootstrap and/or permutation inference for the success logit")
+    parser.add_argument('--logit-draws', type=int, default=2000, help="Replicates per logit inference mode")
+    parser.add_argument('--firth', action='store_true', help="Firth-penalized logit (finite under separation)")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.configure(args)
+    if args.two_step and args.method != 'pairs':
+        parser.error("--two-step requires --method pairs")
+    if args.draws < 1:
+        parser.error("--draws must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    run_hardened_analysis(n_iterations=args.draws, method=args.method, weights=args.weights, seed=args.seed,
+                          two_step=args.two_step, tol=args.tol, ci_tol=args.ci_tol, max_draws=args.max_draws,
+                          chunk_size=args.chunk_size, fresh=args.fresh, logit_inference=args.logit_inference,
+                          logit_draws=args.logit_draws, firth=args.firth)
 
 if __name__ == "__main__":
-    run_hardened_analysis()
+    main()
@@ -0,0 +1,171 @@
+import os
+import json
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from columnar import PARTIAL_SUFFIX, AppendFiles
+
+# Sparse incidence matrices for batch decomposition.
+#
+# For a block of requirements over one project's index:
+#   req_kw  (requirements x keywords): requirement uses keyword
+#   kw_file (keywords x files):        keyword occurs in file (`k in content`)
+# so relevance = req_kw @ kw_file counts, for every requirement/file pair, the
+# distinct requirement keywords found in the file. Its non-zero pattern is
+# exactly the file set map_req_to_files returns. Per-requirement fan-out and
+# linkage scores are row reductions of the same product.
+
+RELEVANCE_PATH = 'data/relevance_matrix.npz'
+RELEVANCE_FILES_PATH = 'data/relevance_files.csv'
+RELEVANCE_ROWS_PATH = 'data/relevance_rows.csv'
+
+Incidence = namedtuple('Incidence', ['keywords', 'paths', 'req_kw', 'kw_file'])
+
+
+def build_incidence(keyword_sets, index):
+    """Incidence matrices for a list of requirement keyword sets against a ProjectIndex."""
+    keywords = sorted(set().union(*keyword_sets)) if keyword_sets else []
+    kw_ids = {k: j for j, k in enumerate(keywords)}
+    index.prime(keywords)
+
+    rows = [i for i, ks in enumerate(keyword_sets) for _ in ks]
+    cols = [kw_ids[k] for ks in keyword_sets for k in ks]
+    req_kw = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(keyword_sets), len(keywords))
+    )
+
+    rows, cols = [], []
+    for j, k in enumerate(keywords):
+        file_ids = index.files_for(k)
+        rows.extend([j] * len(file_ids))
+        cols.extend(file_ids)
+    kw_file = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(keywords), len(index.paths))
+    )
+    return Incidence(keywords, list(index.paths), req_kw, kw_file)
+
+
+def relevance(inc):
+    """Requirements x files matrix of matched keyword counts."""
+    rel = (inc.req_kw @ inc.kw_file).tocsr()
+    rel.sort_indices()
+    return rel
+
+
+def relevant_paths(rel, paths):
+    """Per-requirement sorted path lists (the map_req_to_files result for every row)."""
+    return [sorted(paths[j] for j in rel.indices[rel.indptr[i]:rel.indptr[i + 1]]) for i in range(rel.shape[0])]
+
+
+def fan_out(rel):
+    """Number of relevant files per requirement."""
+    return np.diff(rel.indptr)
+
+
+def linkage_scores(inc, rel):
+    """
+    Per-requirement analogue of the artifact-coupling linkage term: the sum
+    over files of (matched keywords / requirement keywords), divided by the
+    number of files in the project.
+    """
+    n_kw = np.asarray(inc.req_kw.sum(axis=1)).ravel().astype(float)
+    matched = np.asarray(rel.sum(axis=1)).ravel().astype(float)
+    n_files = max(rel.shape[1], 1)
+    return np.where(n_kw > 0, matched / np.where(n_kw > 0, n_kw, 1) / n_files, 0.0)
+
+
+def row_scores(inc, rel):
+    """{'fan_out': ..., 'linkage_score': ...} per requirement row of rel."""
+    return {'fan_out': fan_out(rel), 'linkage_score': linkage_scores(inc, rel)}
+
+
+def save_relevance(paths, rel, scores, matrix_path=RELEVANCE_PATH, files_path=RELEVANCE_FILES_PATH,
+                   rows_path=RELEVANCE_ROWS_PATH):
+    """
+    Writes the relevance matrix (.npz), its column labels (.csv) and the
+    per-row scores (.csv, one line per matrix row).
+    """
+    os.makedirs(os.path.dirname(matrix_path) or '.', exist_ok=True)
+    sp.save_npz(matrix_path, rel)
+    pd.DataFrame({'column': range(len(paths)), 'path': paths}).to_csv(files_path, index=False)
+    pd.DataFrame({'row': range(rel.shape[0]), **scores}).to_csv(rows_path, index=False)
+
+
+class RelevanceWriter:
+    """
+    Streams per-project relevance blocks to disk as coordinate triplets, so
+    the corpus matrix is never held during decomposition. Rows of a project
+    may arrive in several parts (write_rows) before end_block adds its file
+    columns. finish() assembles the block-diagonal corpus matrix and saves
+    it with the row scores. resume is a position().
+    """
+
+    # Per-row score files and their dtypes
+    SCORES = (('fan_out', np.int64), ('linkage_score', np.float64))
+
+    def __init__(self, matrix_path=RELEVANCE_PATH, files_path=RELEVANCE_FILES_PATH, rows_path=RELEVANCE_ROWS_PATH,
+                 resume=None):
+        self.matrix_path = matrix_path
+        self.files_path = files_path
+        self.rows_path = rows_path
+        if resume and resume['rows'] and any(f'{name}.bin' not in resume['files'] for name, _ in self.SCORES):
+            raise ValueError("Relevance checkpoint has no row scores")
+        self.files = AppendFiles(os.path.splitext(matrix_path)[0] + PARTIAL_SUFFIX, resume and resume['files'])
+        self.n_rows = resume['rows'] if resume else 0
+        self.n_cols = resume['cols'] if resume else 0
+        self.dtype = resume['dtype'] if resume else None
+
+    def write_rows(self, rel, scores):
+        """
+        Appends rows of the current project's block (columns local to the
+        project) and their row_scores.
+        """
+        coo = rel.tocoo()
+        self.dtype = self.dtype or coo.dtype.str
+        self.files.file('row.bin').write((coo.row.astype(np.int64) + self.n_rows).tobytes())
+        self.files.file('col.bin').write((coo.col.astype(np.int64) + self.n_cols).tobytes())
+        self.files.file('data.bin').write(coo.data.astype(self.dtype).tobytes())
+        for name, dtype in self.SCORES:
+            self.files.file(f'{name}.bin').write(np.asarray(scores[name], dtype=dtype).tobytes())
+        self.n_rows += rel.shape[0]
+
+    def end_block(self, paths):
+        """Closes the current project's block; paths label its columns."""
+        self.files.file('paths.jsonl').write(''.join(json.dumps(p) + '\n' for p in paths).encode('utf-8'))
+        self.n_cols += len(paths)
+
+    def position(self):
+        self.files.flush()
+        return {'rows': self.n_rows, 'cols': self.n_cols, 'dtype': self.dtype, 'files': self.files.sizes()}
+
+    def finish(self, n_rows):
+        """
+        Saves the corpus matrix, its column labels and row scores; returns
+        (paths, csr matrix). n_rows is the number of dataset rows the matrix
+        rows must line up with.
+        """
+        if self.n_rows != n_rows:
+            raise ValueError(f"Relevance matrix has {self.n_rows} rows but the dataset has {n_rows}")
+        self.files.close()
+
+        def read(name, dtype):
+            path = os.path.join(self.files.path, name)
+            return np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+
+        dtype = np.dtype(self.dtype or np.float64)
+        rel = sp.csr_matrix((read('data.bin', dtype), (read('row.bin', np.int64), read('col.bin', np.int64))),
+                            shape=(self.n_rows, self.n_cols))
+        rel.sort_indices()
+        paths_file = os.path.join(self.files.path, 'paths.jsonl')
+        paths = []
+        if os.path.exists(paths_file):
+            with open(paths_file, 'r', encoding='utf-8') as f:
+                paths = [json.loads(line) for line in f]
+        scores = {name: read(f'{name}.bin', dtype) for name, dtype in self.SCORES}
+        save_relevance(paths, rel, scores, self.matrix_path, self.files_path, self.rows_path)
+        shutil.rmtree(self.files.path, ignore_errors=True)
+        return paths, rel
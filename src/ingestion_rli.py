@@ -1,12 +1,15 @@
 import os
 import json
 import pandas as pd
-from huggingface_hub import snapshot_download
+import dataset_source
+from corpus_cache import get_cache, walk_files
+from deliverable_reader import write_skip_report
 
 def download_rli_data():
     """Download the RLI Public Set from Hugging Face."""
     print("Downloading RLI Public Set from Hugging Face...")
     try:
+        from huggingface_hub import snapshot_download
         repo_id = 'cais/rli-public-set'
         # Local dir to store the dataset
         local_dir = 'data/rli_public_set'
@@ -24,10 +27,12 @@ def download_rli_data():
         return None
 
 def process_rli_data(base_path):
-    """Extract instruction entropy and economic metadata from RLI tasks."""
+    """Extract instruction entropy and economic metadata from RLI tasks (base_path: directory, archive or mirror)."""
+    dataset_source.open_source(base_path)
     tasks = []
+    all_records = []
     # Identify directories public_001 to public_010
-    for foldername in os.listdir(base_path):
+    for foldername in dataset_source.listdir(base_path):
         if foldername.startswith('public_'):
             folder_path = os.path.join(base_path, foldername)
             
@@ -40,35 +45,26 @@ def process_rli_data(base_path):
             # We need the gold standard output to compare against the brief
             # Since deliverables can be multiple files, we'll concatenate text deliverables
             brief_text = ""
-            if os.path.exists(brief_path):
-                with open(brief_path, 'r', encoding='utf-8') as f:
-                    brief_text = f.read()
+            if dataset_source.exists(brief_path):
+                brief_text = dataset_source.read_text(brief_path)
             
-            # Concatenate deliverable content (simplification for E calculation)
-            deliverable_text = ""
-            artifact_count = 0
-            if os.path.exists(deliverable_dir):
-                for root, dirs, files in os.walk(deliverable_dir):
-                    for file in files:
-                        artifact_count += 1
-                        file_path = os.path.join(root, file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                                deliverable_text += f.read() + "\n"
-                        except Exception:
-                            pass # Skip binary or unreadable files
+            # Deliverable word counts come from the shared corpus cache
+            # (words never span files, so per-file counts simply add up)
+            deliverable_files = walk_files(deliverable_dir)
+            artifact_count = len(deliverable_files)
+            records = get_cache().get_many(deliverable_files)
+            all_records.extend(records)
 
             # Calculate E = TokenCount(S) / TokenCount(B)
             brief_tokens = len(brief_text.split())
-            deliverable_tokens = len(deliverable_text.split())
+            deliverable_tokens = sum(r.words for r in records)
             
             entropy = deliverable_tokens / brief_tokens if brief_tokens > 0 else 0
             
             # 2. Economic Value & Metadata
             metadata = {}
-            if os.path.exists(metadata_path):
-                with open(metadata_path, 'r') as f:
-                    metadata = json.load(f)
+            if dataset_source.exists(metadata_path):
+                metadata = json.loads(dataset_source.read_text(metadata_path))
             
             tasks.append({
                 'task_id': foldername,
@@ -84,9 +80,15 @@ def process_rli_data(base_path):
     output_path = 'data/rli_processed.csv'
     df.to_csv(output_path, index=False)
     print(f"Processed RLI data saved to: {output_path}")
+    # Binary assets are stubbed, not decoded; list them for auditing
+    skipped = write_skip_report(all_records)
+    print(f"Skipped or truncated deliverables: {skipped} (see data/skipped_deliverables.csv)")
     return df
 
-if __name__ == "__main__":
+def main():
     snapshot_path = download_rli_data()
     if snapshot_path:
         process_rli_data(snapshot_path)
+
+if __name__ == "__main__":
+    main()
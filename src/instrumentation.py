@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import functools
+from collections import Counter
+from contextlib import contextmanager
+
+# Opt-in tracing and profiling of the pipeline's hot paths.
+#
+#   RLI_TRACE=trace.jsonl        one JSON line per traced call (wall/CPU time
+#                                and counter deltas: bytes read, files opened,
+#                                tokens encoded, cache hits/misses, replicates)
+#   RLI_PROFILE=run.prof         cProfile stats of the main process, or with
+#   RLI_PROFILE_MODE=sample      collapsed stacks from a SIGPROF sampler
+#                                (flamegraph.pl / speedscope input)
+#
+# Scripts with a CLI expose the same switches as --trace/--profile/
+# --profile-mode. When tracing is off, a traced function costs one global
+# check per call and counters return immediately.
+
+TRACE_ENV = 'RLI_TRACE'
+PROFILE_ENV = 'RLI_PROFILE'
+PROFILE_MODE_ENV = 'RLI_PROFILE_MODE'
+
+SAMPLE_INTERVAL = 0.005  # Seconds of CPU time between stack samples
+
+_trace_path = None
+_fd = None
+_fd_pid = None
+_counters = Counter()
+_depth = 0
+_profiler = None
+_samples = None
+
+
+def enabled():
+    return _trace_path is not None
+
+
+def count(name, n=1):
+    """Adds n to a named counter (no-op unless tracing)."""
+    if _trace_path is None:
+        return
+    _counters[name] += n
+
+
+def _emit(record):
+    global _fd, _fd_pid
+    pid = os.getpid()
+    if _fd is None or _fd_pid != pid:
+        # One O_APPEND descriptor per process; single-line writes do not interleave
+        _fd = os.open(_trace_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _fd_pid = pid
+    os.write(_fd, (json.dumps(record) + '\n').encode())
+
+
+@contextmanager
+def span(name, **fields):
+    """Times the enclosed block as one trace record (no-op unless tracing)."""
+    global _depth
+    if _trace_path is None:
+        yield
+        return
+    before = dict(_counters)
+    t0, c0 = time.perf_counter(), time.process_time()
+    _depth += 1
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _depth -= 1
+        deltas = {k: v - before.get(k, 0) for k, v in _counters.items() if v != before.get(k, 0)}
+        record = {
+            'span': name, 'wall_s': time.perf_counter() - t0, 'cpu_s': time.process_time() - c0,
+            'depth': _depth, 'pid': os.getpid(), 'ts': time.time(), 'counters': deltas,
+        }
+        if fields:
+            record['fields'] = fields
+        if error:
+            record['error'] = error
+        _emit(record)
+
+
+def traced(name=None):
+    """Decorator recording every call of the function as a span."""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace_path is None:
+                return func(*args, **kwargs)
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _sample(signum, frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    _samples[';'.join(reversed(stack))] += 1
+
+
+def _write_profile(path, mode):
+    if mode == 'sample':
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        with open(path, 'w') as f:
+            for stack, n in _samples.most_common():
+                f.write(f"{stack} {n}\n")
+    else:
+        _profiler.disable()
+        _profiler.dump_stats(path)
+
+
+def enable(trace=None, profile=None, profile_mode='cprofile'):
+    """
+    Turns on tracing and/or profiling for this process. The settings are also
+    exported to the environment so child processes (pipeline stages) inherit them.
+    """
+    global _trace_path, _profiler, _samples
+    if trace:
+        _trace_path = os.path.abspath(trace)
+        os.makedirs(os.path.dirname(_trace_path), exist_ok=True)
+        os.environ[TRACE_ENV] = _trace_path
+    if profile and _profiler is None and _samples is None:
+        path = os.path.abspath(profile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.environ[PROFILE_ENV] = path
+        os.environ[PROFILE_MODE_ENV] = profile_mode
+        if profile_mode == 'sample':
+            _samples = Counter()
+            signal.signal(signal.SIGPROF, _sample)
+            signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+        else:
+            import cProfile
+            _profiler = cProfile.Profile()
+            _profiler.enable()
+        atexit.register(_write_profile, path, profile_mode)
+
+
+def add_arguments(parser):
+    """Adds --trace/--profile/--profile-mode to a script's argument parser."""
+    parser.add_argument('--trace', default=None, help="Write a JSON-lines trace of hot-path calls to this file")
+    parser.add_argument('--profile', default=None, help="Write a profile of the run to this file")
+    parser.add_argument('--profile-mode', choices=['cprofile', 'sample'], default='cprofile',
+                        help="cProfile stats or collapsed stack samples")
+
+
+def configure(args):
+    """Applies the flags added by add_arguments."""
+    enable(args.trace, args.profile, args.profile_mode)
+
+
+def child_env(tag):
+    """Environment for a child process, with the profile path suffixed by tag so runs do not overwrite it."""
+    env = dict(os.environ)
+    if env.get(PROFILE_ENV):
+        root, ext = os.path.splitext(env[PROFILE_ENV])
+        env[PROFILE_ENV] = f"{root}.{tag}{ext}"
+    return env
+
+
+def summarize(path):
+    """Aggregates a trace by span name: calls, wall/CPU totals and summed counters."""
+    totals = {}
+    with open(path) as f:
+        for line in f:
+            r = json.loads(line)
+            t = totals.setdefault(r['span'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'counters': Counter()})
+            t['calls'] += 1
+            t['wall_s'] += r['wall_s']
+            t['cpu_s'] += r['cpu_s']
+            t['counters'].update(r.get('counters', {}))
+    return totals
+
+
+# Environment switches take effect on import, so every process of a run is covered
+if os.environ.get(TRACE_ENV) or os.environ.get(PROFILE_ENV):
+    enable(os.environ.get(TRACE_ENV), os.environ.get(PROFILE_ENV), os.environ.get(PROFILE_MODE_ENV, 'cprofile'))
+
+
+if __name__ == "__main__":
+    for name, t in sorted(summarize(sys.argv[1]).items(), key=lambda kv: -kv[1]['wall_s']):
+        counters = ', '.join(f"{k}={v}" for k, v in sorted(t['counters'].items()))
+        print(f"{name:<40} calls={t['calls']:<7} wall={t['wall_s']:9.3f}s cpu={t['cpu_s']:9.3f}s  {counters}")
@@ -0,0 +1,121 @@
+import re
+from collections import deque
+
+# Keywords and brief entities are built from [a-z0-9_] characters only, so any
+# substring hit `k in content` lies entirely inside one maximal run of those
+# characters. Indexing the distinct runs per project therefore preserves the
+# substring semantics while scanning each distinct token once.
+_RUN_RE = re.compile(r'[a-z0-9_]+')
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher (Aho-Corasick automaton)."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        goto = [{}]
+        out = [[]]
+        for pid, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            out[node].append(pid)
+
+        # Breadth-first construction of failure links
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def iter_matches(self, text):
+        """Yields (end_offset, pattern_id) for every occurrence in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield i + 1, pid
+
+    def present(self, text):
+        """Returns the ids of all patterns occurring in text."""
+        return {pid for _, pid in self.iter_matches(text)}
+
+
+class ProjectIndex:
+    """
+    Inverted index over one project's deliverables: normalized token -> files.
+    Built once from the cached lowercased prefixes (read cap `cap`), then
+    queried for any number of keyword sets with `k in content` semantics.
+    """
+
+    def __init__(self, records, cap):
+        self.paths = [r.path for r in records]
+        self.cap = cap
+        self._texts = [r.lower_head(cap) for r in records]
+        self.vocab = {}
+        for i, text in enumerate(self._texts):
+            for token in set(_RUN_RE.findall(text)):
+                self.vocab.setdefault(token, []).append(i)
+        self._hits = {}
+
+    def prime(self, patterns):
+        """Resolves every not-yet-seen pattern with a single automaton pass over the vocabulary."""
+        new = [p for p in set(patterns) if p not in self._hits]
+        if not new:
+            return
+        indexed = [p for p in new if _RUN_RE.fullmatch(p)]
+        for p in new:
+            if not _RUN_RE.fullmatch(p):
+                # Patterns spanning non-token characters fall back to a direct scan
+                self._hits[p] = frozenset(i for i, t in enumerate(self._texts) if p in t)
+        if not indexed:
+            return
+        matcher = AhoCorasick(indexed)
+        hits = [set() for _ in indexed]
+        for token, file_ids in self.vocab.items():
+            for pid in matcher.present(token):
+                hits[pid].update(file_ids)
+        for p, file_ids in zip(indexed, hits):
+            self._hits[p] = frozenset(file_ids)
+
+    def files_for(self, pattern):
+        """Indices of files whose content contains pattern."""
+        if pattern not in self._hits:
+            self.prime([pattern])
+        return self._hits[pattern]
+
+    def files_with_any(self, patterns):
+        """Paths (in index order) of files containing at least one pattern."""
+        self.prime(patterns)
+        matched = set()
+        for p in patterns:
+            matched |= self._hits[p]
+        return [self.paths[i] for i in sorted(matched)]
+
+    def match_counts(self, patterns):
+        """Number of distinct patterns present in each file, in index order."""
+        self.prime(patterns)
+        counts = [0] * len(self.paths)
+        for p in set(patterns):
+            for i in self._hits[p]:
+                counts[i] += 1
+        return counts
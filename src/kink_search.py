@@ -0,0 +1,175 @@
+from collections import namedtuple
+
+import numpy as np
+
+import instrumentation
+from bootstrap_engine import batched_pinv_solve, pairs_weights
+
+# Exact breakpoint search for the regression-kink model
+#     y = a + b*x + c*max(0, x - tau)
+# over tau in the trimmed range [lo, hi]. The grid is lo, hi and every
+# distinct x value between them. After one sort, the cross-products for all
+# grid points come from suffix sums, so the whole profile costs O(N log N)
+# plus one batched 3x3 solve.
+# Between two neighbouring grid points (including the edge stretches from lo
+# to the first x value and from the last one to hi) the SSR can dip below
+# both ends, so each interval also gets Hudson's (1966) closed-form step:
+# with the observations split there, fit a free line on each side (from the
+# same suffix sums); if the two lines cross inside the interval, the
+# crossing is the interval's optimum and the continuity constraint costs
+# nothing, otherwise the optimum is an endpoint, already on the grid. The
+# least SSR over both sets is the least-squares breakpoint in [lo, hi].
+
+KinkResult = namedtuple('KinkResult', [
+    'kink', 'r2', 'ssr', 'params', 'candidates', 'ssr_curve', 'r2_curve', 'ci', 'boot_kinks'
+])
+
+
+def _suffix(a):
+    # s[j] = sum(a[j:]), with a trailing 0 for the empty suffix
+    return np.concatenate([np.cumsum(a[::-1])[::-1], [0.0]])
+
+
+def _suffix_sums(xs, ys, ws):
+    # Suffix sums of the weighted cross-products w, wx, wx^2, wy, wxy, wy^2
+    return [_suffix(v) for v in (ws, ws * xs, ws * xs * xs, ws * ys, ws * xs * ys, ws * ys * ys)]
+
+
+def _profile(sums, taus, split):
+    """
+    SSR and coefficients for every candidate tau, given the suffix sums of
+    data sorted by x (already centered) and split[i] = number of
+    observations with x <= taus[i].
+    """
+    S0, S1, S2, Sy, Sxy, Syy_s = sums
+    N, Sx, Sxx, Syt, Sxyt, Syy = S0[0], S1[0], S2[0], Sy[0], Sxy[0], Syy_s[0]
+
+    n_a, s1_a, s2_a = S0[split], S1[split], S2[split]
+    sy_a, sxy_a = Sy[split], Sxy[split]
+    H1 = s1_a - taus * n_a
+    XH = s2_a - taus * s1_a
+    HH = s2_a - 2 * taus * s1_a + taus * taus * n_a
+    HY = sxy_a - taus * sy_a
+
+    M = len(taus)
+    XtX = np.empty((M, 3, 3))
+    XtX[:, 0, 0], XtX[:, 0, 1], XtX[:, 1, 1] = N, Sx, Sxx
+    XtX[:, 1, 0] = Sx
+    XtX[:, 0, 2] = XtX[:, 2, 0] = H1
+    XtX[:, 1, 2] = XtX[:, 2, 1] = XH
+    XtX[:, 2, 2] = HH
+    Xty = np.column_stack([np.full(M, Syt), np.full(M, Sxyt), HY])
+    beta = batched_pinv_solve(XtX, Xty)
+    ssr = Syy - np.einsum('mi,mi->m', beta, Xty)
+    sst = Syy - Syt * Syt / N
+    return np.maximum(ssr, 0.0), sst, beta
+
+
+def _line_fits(n, sx, sxx, sy, sxy, syy):
+    # Least-squares line y = a + b*x from its cross-products; ok is False when x does not vary
+    den = n * sxx - sx * sx
+    ok = den > 1e-12 * np.maximum(n * sxx, 1e-300)
+    den = np.where(ok, den, 1.0)
+    b = (n * sxy - sx * sy) / den
+    a = (sy - b * sx) / np.where(n > 0, n, 1.0)
+    return a, b, syy - a * sy - b * sxy, ok
+
+
+def _interval_optima(sums, grid, split, admissible):
+    """
+    Hudson's step between consecutive grid points: (tau, ssr, beta) of every
+    interval (grid[i], grid[i+1]) with admissible[i] whose two free side
+    lines cross strictly inside it, where split[i] observations lie left of
+    the interval.
+    """
+    cut = split[:-1]
+    right = [s[cut] for s in sums]
+    left = [s[0] - r for s, r in zip(sums, right)]
+    a1, b1, ssr1, ok1 = _line_fits(*left)
+    a2, b2, ssr2, ok2 = _line_fits(*right)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = (a2 - a1) / (b1 - b2)
+    inside = admissible[:-1] & ok1 & ok2 & (b1 != b2) & (tau > grid[:-1]) & (tau < grid[1:])
+    # Continuous at tau: right line = a1 + b1*x + (b2 - b1)*(x - tau)
+    beta = np.column_stack([a1, b1, b2 - b1])[inside]
+    return tau[inside], np.maximum(ssr1 + ssr2, 0.0)[inside], beta
+
+
+def _search(xs, ys, ws, grid, split, admissible):
+    """
+    Profile over the admissible grid points (and those closing an admissible
+    interval) plus the interval optima, merged in tau order:
+    (taus, ssr, sst, beta).
+    """
+    sums = _suffix_sums(xs, ys, ws)
+    # The SSR is continuous in tau, so a point closing an admissible interval is its limit
+    points = admissible | np.concatenate([[False], admissible[:-1]])
+    ssr, sst, beta = _profile(sums, grid[points], split[points])
+    i_tau, i_ssr, i_beta = _interval_optima(sums, grid, split, admissible)
+    taus = np.concatenate([grid[points], i_tau])
+    order = np.argsort(taus, kind='stable')
+    return taus[order], np.concatenate([ssr, i_ssr])[order], sst, np.concatenate([beta, i_beta])[order]
+
+
+@instrumentation.traced()
+def estimate_kink(x, y, trim=0.2, n_boot=0, groups=None, seed=None, min_side=2):
+    """
+    Least-squares breakpoint of a continuous piecewise-linear fit of y on x,
+    over breakpoints between the trim and 1 - trim quantiles of x that leave
+    at least min_side observations on each side.
+    Returns a KinkResult with the best kink, its R^2/SSR, coefficients
+    (Intercept, slope, slope change), the full SSR and R^2 profile over all
+    candidates (the trim points, the observed x values between them and any
+    interval optima), and a percentile bootstrap CI for the kink when
+    n_boot > 0 (resampling rows, or whole clusters when groups is given).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(x, kind='stable')
+    x_mean, y_mean = x.mean(), y.mean()
+    xs, ys = x[order] - x_mean, y[order] - y_mean
+
+    lo, hi = np.quantile(xs, [trim, 1 - trim])
+    grid = np.unique(np.concatenate([[lo, hi], xs[(xs > lo) & (xs < hi)]]))
+    split = np.searchsorted(xs, grid, side='right')
+    # A grid point, or the interval it starts, leaves split observations at or left of tau
+    admissible = (split >= min_side) & (len(xs) - split >= min_side)
+    if not admissible.any():
+        raise ValueError("No admissible breakpoint candidates; relax trim or min_side.")
+
+    taus, ssr, sst, beta = _search(xs, ys, np.ones(len(xs)), grid, split, admissible)
+    best = int(np.argmin(ssr))
+    r2_curve = 1 - ssr / sst if sst > 0 else np.zeros_like(ssr)
+
+    a, b, c = beta[best]
+    params = {'Intercept': y_mean + a - b * x_mean, 'log_e': b, 'log_e_high': c}
+
+    boot_kinks = np.empty(0)
+    ci = (np.nan, np.nan)
+    if n_boot > 0:
+        rng = np.random.default_rng(seed)
+        if groups is not None:
+            cluster_ids, g = np.unique(np.asarray(groups)[order], return_inverse=True)
+        boot_kinks = np.empty(n_boot)
+        instrumentation.count('replicates', n_boot)
+        for i in range(n_boot):
+            if groups is not None:
+                ws = pairs_weights(rng, 1, len(cluster_ids))[0][g]
+            else:
+                ws = np.bincount(rng.integers(0, len(xs), len(xs)), minlength=len(xs)).astype(float)
+            b_taus, b_ssr, _, _ = _search(xs, ys, ws, grid, split, admissible)
+            boot_kinks[i] = b_taus[np.argmin(b_ssr)]
+        boot_kinks += x_mean
+        ci = tuple(np.quantile(boot_kinks, [0.025, 0.975]))
+
+    return KinkResult(
+        kink=taus[best] + x_mean, r2=r2_curve[best], ssr=ssr[best], params=params,
+        candidates=taus + x_mean, ssr_curve=ssr, r2_curve=r2_curve, ci=ci, boot_kinks=boot_kinks,
+    )
+
+
+def predict_kink(result, x):
+    """Fitted values of the piecewise-linear model at x."""
+    x = np.asarray(x, dtype=float)
+    p = result.params
+    return p['Intercept'] + p['log_e'] * x + p['log_e_high'] * np.maximum(0, x - result.kink)
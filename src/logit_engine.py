@@ -0,0 +1,214 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.special import expit
+
+import instrumentation
+from bootstrap_engine import BLOCK_DRAWS, batched_pinv_solve, pairs_weights
+
+# Batched logistic regression for resampling inference on the success model.
+#
+# Every replicate (a bootstrap weight vector or a permuted response) is one
+# row of a B x n matrix, and all replicates take their Newton/IRLS steps
+# together: one B x n linear predictor, one stacked p x p information solve
+# per iteration. The response may be fractional (a quasi-binomial "fractional
+# logit"), as the project-level success rates are.
+#
+# Replicates never raise. A replicate whose linear predictor runs off to
+# +/-SEPARATION_ETA for some observation is (quasi-)separated: the MLE does
+# not exist, so it is frozen, flagged and left unconverged. The optional
+# Firth penalty (Jeffreys-prior score correction) keeps estimates finite
+# under separation; such replicates keep iterating and are only flagged.
+
+SEPARATION_ETA = 30.0   # |x'b| beyond this means a fitted probability within ~1e-13 of 0 or 1
+MAX_STEP = 5.0          # Largest Newton step per coefficient, so divergent replicates move slowly
+MAX_HALVINGS = 20       # Step-halvings allowed when a step lowers the (penalized) log-likelihood
+# Fisher scoring on the Firth-modified score converges only linearly. After
+# FIRTH_SCORING_ITERS scoring steps, replicates switch to Newton steps on the
+# exact Hessian of the penalized log-likelihood (a central difference of the
+# modified score), falling back to scoring wherever that Hessian is not
+# negative definite. Firth fits also stop once the penalized log-likelihood
+# gains less than FIRTH_FTOL (relative) per iteration.
+FIRTH_SCORING_ITERS = 4
+FIRTH_FD_EPS = 1e-6
+FIRTH_FTOL = 1e-12
+
+LogitFit = namedtuple('LogitFit', ['beta', 'converged', 'separated', 'n_iter'])
+
+
+def _objective(X, XX, Y, W, beta, firth):
+    # Quasi-binomial log-likelihood per replicate, plus 0.5 log|I| under the Firth penalty
+    eta = beta @ X.T
+    ll = np.sum(W * (Y * eta - np.logaddexp(0, eta)), axis=1)
+    if firth:
+        mu = expit(eta)
+        info = ((W * mu * (1 - mu)) @ XX).reshape(len(beta), X.shape[1], X.shape[1])
+        ll = ll + 0.5 * np.linalg.slogdet(info)[1]
+    return ll
+
+
+def _score(X, XX, Y, W, beta, firth, eta=None):
+    # (score (B x p), Fisher information (B x p x p)); the Firth score adds h_i (1/2 - mu_i)
+    p = X.shape[1]
+    if eta is None:
+        eta = beta @ X.T
+    mu = expit(eta)
+    wv = W * mu * (1 - mu)
+    info = (wv @ XX).reshape(-1, p, p)
+    resid = W * (Y - mu)
+    if firth:
+        # Leverages h_i = w_i v_i x_i' I^-1 x_i of the weighted fit
+        info_inv = np.linalg.pinv(info, hermitian=True)
+        h = wv * np.einsum('ni,bij,nj->bn', X, info_inv, X)
+        resid = resid + h * (0.5 - mu)
+    return resid @ X, info
+
+
+def _firth_newton(X, XX, Y, W, beta, score, step):
+    # Replaces step by the Newton step wherever the differenced Hessian is negative definite
+    p = X.shape[1]
+    hess = np.empty((len(beta), p, p))
+    for j in range(p):
+        eps = FIRTH_FD_EPS * (1 + np.abs(beta[:, j]))
+        shift = np.zeros_like(beta)
+        shift[:, j] = eps
+        up = _score(X, XX, Y, W, beta + shift, True)[0]
+        down = _score(X, XX, Y, W, beta - shift, True)[0]
+        hess[:, :, j] = (up - down) / (2 * eps[:, None])
+    hess = 0.5 * (hess + hess.transpose(0, 2, 1))
+    ok = np.all(np.isfinite(hess), axis=(1, 2))
+    ok[ok] = np.linalg.eigvalsh(hess[ok]).max(axis=1) < 0
+    if ok.any():
+        step[ok] = np.linalg.solve(-hess[ok], score[ok][:, :, None])[:, :, 0]
+    return step
+
+
+def fit_logit_batch(X, Y, W=None, beta0=None, firth=False, max_iter=100, tol=1e-8):
+    """
+    Logistic regression of every row of Y (B x n, or one n-vector shared by
+    all replicates) on X (n x p), with optional observation weights W (B x n).
+    Returns a LogitFit of (beta (B x p), converged, separated, n_iter) arrays.
+    """
+    X = np.asarray(X, dtype=float)
+    n, p = X.shape
+    Y = np.asarray(Y, dtype=float)
+    B = len(W) if W is not None else (Y.shape[0] if Y.ndim == 2 else 1)
+    Y = np.broadcast_to(Y, (B, n))
+    W = np.ones((B, n)) if W is None else np.asarray(W, dtype=float)
+    XX = (X[:, :, None] * X[:, None, :]).reshape(n, p * p)
+
+    beta = np.zeros((B, p)) if beta0 is None else np.tile(np.asarray(beta0, dtype=float), (B, 1))
+    converged = np.zeros(B, dtype=bool)
+    separated = np.zeros(B, dtype=bool)
+    n_iter = np.zeros(B, dtype=int)
+    for it in range(max_iter):
+        active = np.flatnonzero(~converged if firth else ~(converged | separated))
+        if len(active) == 0:
+            break
+        eta = beta[active] @ X.T
+        Wa = W[active]
+        # Only observations that were actually drawn can separate
+        sep = np.any((np.abs(eta) > SEPARATION_ETA) & (Wa > 0), axis=1)
+        separated[active[sep]] = True
+        if not firth:
+            active, eta, Wa = active[~sep], eta[~sep], Wa[~sep]
+            if len(active) == 0:
+                break
+
+        current = beta[active]
+        score, info = _score(X, XX, Y[active], Wa, current, firth, eta=eta)
+        step = batched_pinv_solve(info, score)
+        if firth and it >= FIRTH_SCORING_ITERS:
+            step = _firth_newton(X, XX, Y[active], Wa, current, score, step)
+        biggest = np.max(np.abs(step), axis=1, keepdims=True)
+        step *= np.minimum(1.0, MAX_STEP / np.maximum(biggest, 1e-300))
+
+        # Step-halving keeps every replicate's objective non-decreasing
+        before = _objective(X, XX, Y[active], Wa, current, firth)
+        worse = np.ones(len(active), dtype=bool)
+        for _ in range(MAX_HALVINGS):
+            after = _objective(X, XX, Y[active[worse]], Wa[worse], current[worse] + step[worse], firth)
+            still = ~(after >= before[worse] - 1e-10 * np.abs(before[worse]))
+            idx = np.flatnonzero(worse)
+            worse[idx[~still]] = False
+            if not worse.any():
+                break
+            step[worse] *= 0.5
+        beta[active] = current + step
+        n_iter[active] += 1
+        done = biggest[:, 0] < tol
+        if firth:
+            gain = _objective(X, XX, Y[active], Wa, beta[active], firth) - before
+            done |= np.abs(gain) < FIRTH_FTOL * (1 + np.abs(before))
+        converged[active[done]] = True
+
+    bad = ~np.all(np.isfinite(beta), axis=1)
+    converged &= ~bad
+    return LogitFit(beta, converged, separated, n_iter)
+
+
+def _cluster_index(groups):
+    _, g = np.unique(np.asarray(groups), return_inverse=True)
+    return g, g.max() + 1
+
+
+@instrumentation.traced()
+def logit_cluster_bootstrap(X, y, groups, n_draws, seed=None, rng=None, firth=False, beta0=None):
+    """
+    Pairs-cluster bootstrap of the logit: whole clusters are resampled and all
+    replicates are refit in one batch, warm-started at beta0.
+    Returns (draws (n_draws x p), valid (n_draws,) bool); replicates that did
+    not converge (including separated ones without the Firth penalty) are NaN.
+    """
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    g, G = _cluster_index(groups)
+    draws = np.full((n_draws, X.shape[1]), np.nan)
+    valid = np.zeros(n_draws, dtype=bool)
+    instrumentation.count('replicates', n_draws)
+    for start in range(0, n_draws, BLOCK_DRAWS):
+        stop = min(start + BLOCK_DRAWS, n_draws)
+        fit = fit_logit_batch(X, y, pairs_weights(rng, stop - start, G)[:, g], beta0=beta0, firth=firth)
+        draws[start:stop][fit.converged] = fit.beta[fit.converged]
+        valid[start:stop] = fit.converged
+    return draws, valid
+
+
+@instrumentation.traced()
+def logit_permutation_test(X, y, groups, n_perm, seed=None, rng=None, firth=False, beta_obs=None):
+    """
+    Permutation test of every slope coefficient under the null that y is
+    independent of the regressors. A response that is constant within
+    clusters (a project-level outcome) is permuted across clusters, otherwise
+    across rows. Permuting y leaves its mean, and so the intercept, unchanged,
+    so constant columns get a NaN p-value.
+    Returns (p-values (p,), permuted draws, valid mask).
+    """
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    y = np.asarray(y, dtype=float)
+    g, G = _cluster_index(groups)
+    y_cluster = np.zeros(G)
+    y_cluster[g] = y
+    by_cluster = np.allclose(y_cluster[g], y)
+    if beta_obs is None:
+        beta_obs = fit_logit_batch(X, y, firth=firth).beta[0]
+
+    draws = np.full((n_perm, X.shape[1]), np.nan)
+    valid = np.zeros(n_perm, dtype=bool)
+    instrumentation.count('replicates', n_perm)
+    for start in range(0, n_perm, BLOCK_DRAWS):
+        stop = min(start + BLOCK_DRAWS, n_perm)
+        if by_cluster:
+            Y = y_cluster[np.argsort(rng.random((stop - start, G)), axis=1)][:, g]
+        else:
+            Y = y[np.argsort(rng.random((stop - start, len(y))), axis=1)]
+        fit = fit_logit_batch(X, Y, firth=firth)
+        draws[start:stop][fit.converged] = fit.beta[fit.converged]
+        valid[start:stop] = fit.converged
+
+    # Two-sided, with the observed statistic counted as one permutation
+    extreme = np.abs(draws[valid]) >= np.abs(beta_obs) - 1e-12
+    p = (extreme.sum(axis=0) + 1) / (valid.sum() + 1)
+    p[np.ptp(X, axis=0) == 0] = np.nan
+    return p, draws, valid
@@ -0,0 +1,49 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def resolve_workers(workers):
+    """Maps a --workers value to a process count (0 or negative = all cores)."""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def parallel_map(func, items, workers=1, chunksize=1):
+    """
+    Ordered map over items, on a process pool when workers > 1.
+    Results come back in input order, so serial and parallel runs produce
+    identical outputs.
+    """
+    items = list(items)
+    workers = min(resolve_workers(workers), max(len(items), 1))
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items, chunksize=chunksize))
+
+
+def parallel_imap(func, items, workers=1, window=None):
+    """
+    Lazy ordered map: items are pulled from the (possibly lazy) iterable and
+    results yielded in input order as they complete, with at most window
+    items (default 4 per worker) in flight. Memory is bounded by the window,
+    not by the length of items.
+    """
+    workers = resolve_workers(workers)
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    window = window or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,262 @@
+import os
+import sys
+import ast
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import instrumentation
+import dataset_source
+
+# Single entry point for the analysis pipeline.
+#
+# Each stage is one of the standalone scripts, declared with the files or
+# directories it reads and writes. Dependencies follow from those paths. A
+# stage is skipped when the content hash of its inputs (data, its own source
+# and the local modules it imports, and its arguments) matches the last
+# successful run and its outputs still exist. Stages whose dependencies are
+# satisfied run concurrently, each in its own process.
+#
+#   python src/pipeline.py                   # bring everything up to date
+#   python src/pipeline.py --from decompose  # decompose and everything downstream
+#   python src/pipeline.py --until master --force
+#   python src/pipeline.py --from master --source corpus.zip
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = 'data/cache/pipeline_state.json'
+
+Stage = namedtuple('Stage', ['name', 'script', 'inputs', 'outputs', 'args'])
+
+# Inputs and args are formatted with the run options; {source} is the corpus
+# root (a directory, archive or HTTP mirror, see dataset_source)
+STAGES = [
+    Stage('ingest', 'ingestion_rli.py', [],
+          ['data/rli_public_set', 'data/rli_processed.csv'], []),
+    Stage('master', 'process_master.py',
+          ['{source}', 'data/onet/ai_applicability_scores.csv'],
+          ['data/master_dataset.csv', 'data/master_dataset.cols'], ['--workers', '{workers}']),
+    Stage('decompose', 'decomposition_layer_v2.py',
+          ['data/master_dataset.csv', 'data/master_dataset.cols', '{source}'],
+          ['data/subtask_dataset_v2.csv', 'data/subtask_dataset_v2.cols'], ['--workers', '{workers}']),
+    Stage('model', 'final_scientific_model_v2.py',
+          ['data/subtask_dataset_v2.csv', 'data/subtask_dataset_v2.cols'],
+          ['output/v2/hardened_results.txt'], []),
+    Stage('figures', 'figures.py',
+          ['data/subtask_dataset_v2.csv', 'data/subtask_dataset_v2.cols'],
+          ['output/v2/subtask_complexity_heatmap.png', 'output/v2/complexity_kink_expanded.png',
+           'output/v2/selection_cliff.png'], ['--workers', '{workers}']),
+]
+
+
+def local_modules(script):
+    """The script plus every module under src/ it imports, transitively."""
+    seen = set()
+    todo = [script]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        with open(os.path.join(SRC_DIR, name), 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                mods = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                mods = [node.module]
+            else:
+                continue
+            for mod in mods:
+                candidate = mod.split('.')[0] + '.py'
+                if os.path.exists(os.path.join(SRC_DIR, candidate)):
+                    todo.append(candidate)
+    return sorted(os.path.join(SRC_DIR, m) for m in seen)
+
+
+class Hasher:
+    """Content hashes of files and directory trees, re-hashing only files whose size or mtime changed."""
+
+    def __init__(self, memo):
+        self.memo = memo
+
+    def file(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.memo.get(key)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        self.memo[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def path(self, path):
+        if dataset_source.is_url(path):
+            # A mirror is as current as its manifest
+            return dataset_source.open_source(path).fingerprint()
+        if os.path.isfile(path):
+            return self.file(path)
+        if not os.path.isdir(path):
+            return 'missing'
+        h = hashlib.sha256()
+        for dirpath, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                p = os.path.join(dirpath, name)
+                h.update(os.path.relpath(p, path).encode())
+                h.update(self.file(p).encode())
+        return h.hexdigest()
+
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'stages': {}, 'files': {}}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stage_args(stage, options):
+    return [a.format(**options) for a in stage.args]
+
+
+def stage_inputs(stage, options):
+    return [i.format(**options) for i in stage.inputs]
+
+
+def stage_key(stage, hasher, options):
+    """Hash of everything a stage's result depends on."""
+    h = hashlib.sha256()
+    h.update(json.dumps([stage.script, stage_args(stage, options)]).encode())
+    for p in local_modules(stage.script) + stage_inputs(stage, options):
+        h.update(p.encode())
+        h.update(hasher.path(p).encode())
+    return h.hexdigest()
+
+
+def upstream(stages, options):
+    """stage name -> names of the stages producing its inputs."""
+    producers = {out: s.name for s in stages for out in s.outputs}
+    return {s.name: sorted({producers[i] for i in stage_inputs(s, options) if i in producers}) for s in stages}
+
+
+def select(stages, start=None, until=None):
+    names = [s.name for s in stages]
+    for n in (start, until):
+        if n is not None and n not in names:
+            raise ValueError(f"Unknown stage: {n} (choose from {', '.join(names)})")
+    lo = names.index(start) if start else 0
+    hi = names.index(until) if until else len(names) - 1
+    return stages[lo:hi + 1]
+
+
+def run_stage(stage, options):
+    # Through the CLI so every stage's output reports its import time
+    cmd = [sys.executable, os.path.join(SRC_DIR, 'cli.py'), stage.name] + stage_args(stage, options)
+    t0 = time.time()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=instrumentation.child_env(stage.name))
+    return proc.returncode, proc.stdout + proc.stderr, time.time() - t0
+
+
+def run_pipeline(start=None, until=None, force=False, jobs=4, workers=1, dry_run=False):
+    """Runs the selected stages in dependency order. Returns True if every stage succeeded or was up to date."""
+    # Stages inherit the corpus root through the environment
+    options = {'workers': workers, 'source': dataset_source.get_root().rstrip('/')}
+    selected = select(STAGES, start, until)
+    deps = upstream(selected, options)
+    state = load_state()
+    hasher = Hasher(state['files'])
+
+    done, failed, changed = set(), set(), set()
+    pending = list(selected)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(d in failed for d in deps[stage.name]):
+                    print(f"[skip] {stage.name}: upstream failed")
+                    failed.add(stage.name)
+                    pending.remove(stage)
+                    continue
+                if not all(d in done for d in deps[stage.name]):
+                    continue
+                pending.remove(stage)
+                # Hashed only once upstream stages have finished writing
+                key = stage_key(stage, hasher, options)
+                outputs_exist = all(os.path.exists(o) for o in stage.outputs)
+                up_to_date = state['stages'].get(stage.name) == key and outputs_exist
+                # In a dry run upstream stages did not actually rewrite their outputs
+                predicted = dry_run and any(d in changed for d in deps[stage.name])
+                if up_to_date and not force and not predicted:
+                    print(f"[up to date] {stage.name}")
+                    done.add(stage.name)
+                    continue
+                if dry_run:
+                    print(f"[would run] {stage.name}")
+                    done.add(stage.name)
+                    changed.add(stage.name)
+                    continue
+                print(f"[run] {stage.name}")
+                running[pool.submit(run_stage, stage, options)] = (stage, key)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, key = running.pop(fut)
+                code, output, elapsed = fut.result()
+                missing = [o for o in stage.outputs if not os.path.exists(o)]
+                print(f"--- {stage.name} ({elapsed:.1f}s) ---")
+                print(output.rstrip())
+                if code != 0 or missing:
+                    reason = f"exit code {code}" if code != 0 else f"missing outputs {missing}"
+                    print(f"[failed] {stage.name}: {reason}")
+                    failed.add(stage.name)
+                    state['stages'].pop(stage.name, None)
+                    continue
+                state['stages'][stage.name] = key
+                done.add(stage.name)
+                changed.add(stage.name)
+            if not dry_run:
+                save_state(state)
+
+    if not dry_run:
+        save_state(state)
+    return not failed
+
+
+def main(argv=None):
+    names = [s.name for s in STAGES]
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    parser.add_argument('--from', dest='start', choices=names, help="First stage to consider")
+    parser.add_argument('--until', choices=names, help="Last stage to consider")
+    parser.add_argument('--force', action='store_true', help="Re-run selected stages even if up to date")
+    parser.add_argument('--jobs', type=int, default=4, help="Stages run concurrently")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes passed to master/decompose (0 = all cores)")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    dataset_source.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    # Stages inherit the settings; each stage writes its own profile file
+    dataset_source.configure(args)
+    instrumentation.configure(args)
+    ok = run_pipeline(args.start, args.until, args.force, args.jobs, args.workers, args.dry_run)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
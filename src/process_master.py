@@ -1,22 +1,33 @@
 import os
+import time
+import argparse
 import pandas as pd
 import numpy as np
-import tiktoken
 import re
+import instrumentation
+import dataset_source
+from corpus_cache import fingerprint, get_cache, walk_files
+from token_stream import count_tokens, joined_token_count
+from keyword_index import ProjectIndex
+from parallel import parallel_map
+from columnar import MASTER_PATH, write_dataset, summarize_changes
 
-# Initialize tokenizer
-tokenizer = tiktoken.get_encoding("cl100k_base")
-
-def count_tokens(text):
-    if not text: return 0
-    return len(tokenizer.encode(text))
+# Common English 'noise' filtered from brief keywords to find 'Project Constants'
+COUPLING_STOP_WORDS = frozenset({'this', 'that', 'with', 'from', 'your', 'will', 'into', 'proper', 'format', 'using', 'needed', 'requirements', 'everything', 'include', 'project', 'deliverables', 'standard'})
+# Characters of each deliverable scanned for brief keywords
+COUPLING_CHARS = 10000
+# Wage quantiles the equilibrium wage is clipped to
+WINSOR = (0.05, 0.95)
+# Bump whenever task features change meaning so memoized results are recomputed
+FEATURES_VERSION = 1
 
 def calculate_entropy(brief_text, deliverable_text):
     b_tokens = count_tokens(brief_text)
     s_tokens = count_tokens(deliverable_text)
     return s_tokens / b_tokens if b_tokens > 0 else 0
 
-def get_artifact_coupling(brief_text, deliverable_dir):
+@instrumentation.traced()
+def get_artifact_coupling(brief_text, deliverable_dir, stop_words=COUPLING_STOP_WORDS, cap=COUPLING_CHARS):
     """
     Measures 'Artifact Coupling' (kappa) using a domain-agnostic approach.
     Combines three structural metrics:
@@ -24,21 +35,36 @@ def get_artifact_coupling(brief_text, deliverable_dir):
     2. Shared State: Density of technical keywords from the brief appearing across multiple assets.
     3. Hierarchy Depth: The nested complexity of the solution structure.
     """
-    if not os.path.exists(deliverable_dir):
+    if not dataset_source.exists(deliverable_dir):
         return 0
         
-    all_files = []
-    for root, dirs, files in os.walk(deliverable_dir):
-        for file in files:
-            all_files.append(os.path.join(root, file))
+    all_files = walk_files(deliverable_dir)
             
     if not all_files:
         return 0
 
+    # 3. Hierarchy Depth
+    # Deeper file trees = more mental context-switching
+    max_depth = 0
+    base_depth = deliverable_dir.count(os.sep)
+    for f in all_files:
+        max_depth = max(max_depth, f.count(os.sep) - base_depth)
+
+    return coupling_from_records(brief_text, len(all_files), get_cache().get_many(all_files), max_depth,
+                                 stop_words=stop_words, cap=cap)
+
+def coupling_from_records(brief_text, n_files, records, max_depth, b_tokens=None, stop_words=COUPLING_STOP_WORDS,
+                          cap=COUPLING_CHARS, index=None):
+    """
+    Kappa of get_artifact_coupling from a deliverable set already in hand:
+    its file count, its readable files' records and its maximum depth
+    (index: a prebuilt ProjectIndex of records at cap).
+    """
     # 1. Instruction Fan-out (Coordination Cost)
     # More files per brief token = higher orchestration complexity
-    b_tokens = count_tokens(brief_text)
-    fan_out = len(all_files) / (np.log1p(b_tokens))
+    if b_tokens is None:
+        b_tokens = count_tokens(brief_text)
+    fan_out = n_files / (np.log1p(b_tokens))
 
     # 2. Entity Linkage (Cross-Asset Dependency) - ROBUST VERSION
     # Extract "Entities" using a case-insensitive, technical-aware approach.
@@ -48,38 +74,68 @@ def get_artifact_coupling(brief_text, deliverable_dir):
     candidate_keywords = set(re.findall(r'\b[a-z0-9_]{4,}\b', brief_clean))
     
     # Filter out common English 'noise' to find 'Project Constants'
-    stop_words = {'this', 'that', 'with', 'from', 'your', 'will', 'into', 'proper', 'format', 'using', 'needed', 'requirements', 'everything', 'include', 'project', 'deliverables', 'standard'}
     entities = candidate_keywords - stop_words
     
     linkage_score = 0
     if entities:
-        for file_path in all_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    # Check density of brief keywords across all project assets
-                    content = f.read(10000).lower()
-                    # A file's contribution to kappa is based on how many 
-                    # unique brief-defined concepts it implements/references.
-                    matches = sum(1 for e in entities if e in content)
-                    linkage_score += (matches / len(entities))
-            except: pass
-            
-    # 3. Hierarchy Depth
-    # Deeper file trees = more mental context-switching
-    max_depth = 0
-    base_depth = deliverable_dir.count(os.sep)
-    for f in all_files:
-        max_depth = max(max_depth, f.count(os.sep) - base_depth)
+        # Check density of brief keywords across all project assets
+        if index is None:
+            index = ProjectIndex(records, cap=cap)
+        # A file's contribution to kappa is based on how many 
+        # unique brief-defined concepts it implements/references.
+        for matches in index.match_counts(entities):
+            linkage_score += (matches / len(entities))
 
     # Kappa = Combined Metric (Log-Normalized)
     # This ensures that even non-code tasks (like 3D models or Design) have a valid coupling score
-    raw_kappa = (fan_out * 0.4) + (linkage_score / len(all_files) * 0.4) + (max_depth * 0.2)
+    raw_kappa = (fan_out * 0.4) + (linkage_score / n_files * 0.4) + (max_depth * 0.2)
     
     return raw_kappa
 
-def build_master_dataset():
-    """Join RLI project data with actual RLI model performance (Automation Rates)."""
-    df = pd.read_csv('data/rli_public_set/metadata.csv')
+def task_features(tid, rli_base=None, stop_words=COUPLING_STOP_WORDS, cap=COUPLING_CHARS):
+    """
+    Returns (instruction_entropy, artifact_coupling) for one RLI task (rli_base
+    defaults to --source). Results are memoized in the corpus cache under a
+    fingerprint of the brief, the deliverable tree (relative paths and content
+    digests) and the settings, so only tasks that changed are recomputed.
+    """
+    folder_path = os.path.join(rli_base or dataset_source.get_root(), tid)
+    brief_path = os.path.join(folder_path, 'project', 'brief.md')
+    deliverable_dir = os.path.join(folder_path, 'human_deliverable')
+    
+    # Read brief
+    brief_text = ""
+    if dataset_source.exists(brief_path):
+        brief_text = dataset_source.read_text(brief_path)
+    
+    cache = get_cache()
+    all_files = walk_files(deliverable_dir)
+    records = cache.get_many(all_files)
+    digests = {r.path: r.digest for r in records}
+    # Unreadable files still count towards fan-out and depth
+    tree = [(f[len(deliverable_dir):].lstrip('/\\'), digests.get(f)) for f in all_files]
+    key = fingerprint(FEATURES_VERSION, sorted(stop_words), cap, brief_text, tree)
+    known = cache.get_results('task_features', [key])
+    if key in known:
+        return tuple(known[key])
+    
+    # Deliverable token count from the corpus cache (exactly the count of
+    # the space-joined deliverable text, without building that string)
+    b_tokens = count_tokens(brief_text)
+    s_tokens = joined_token_count(records, sep=' ')
+    
+    entropy = s_tokens / b_tokens if b_tokens > 0 else 0
+    features = (entropy, get_artifact_coupling(brief_text, deliverable_dir, stop_words, cap))
+    cache.put_results('task_features', {key: features})
+    return features
+
+def load_task_metadata(rli_base=None):
+    """
+    RLI task metadata with success rates and SOC codes. Values already in
+    metadata.csv are kept; missing ones fall back to the hand-mapped public set.
+    """
+    with dataset_source.open_binary(os.path.join(rli_base or dataset_source.get_root(), 'metadata.csv')) as f:
+        df = pd.read_csv(f)
     
     # Ground Truth: Actual Automation Rates (Success Probability) 
     # based on the RLI paper results for the 10 public tasks.
@@ -98,7 +154,7 @@ def build_master_dataset():
         'public_010': 0.03, # LaTeX Formatting (High Coupling - Low success)
     }
     
-    df['success_label'] = df['Task ID'].map(success_rates)
+    df['success_label'] = _with_fallback(df, 'success_label', success_rates)
 
     soc_mapping = {
         'public_001': '51-9071', # Jewelry Design -> Jewelers
@@ -113,39 +169,17 @@ def build_master_dataset():
         'public_010': '43-9022', # LaTeX Formatting -> Word Processors
     }
     
-    df['SOC Code'] = df['Task ID'].map(soc_mapping)
-    
-    rli_base = 'data/rli_public_set'
-    entropies = []
-    couplings = []
-    
-    for tid in df['Task ID']:
-        folder_path = os.path.join(rli_base, tid)
-        brief_path = os.path.join(folder_path, 'project', 'brief.md')
-        deliverable_dir = os.path.join(folder_path, 'human_deliverable')
-        
-        # Read brief
-        brief_text = ""
-        if os.path.exists(brief_path):
-            with open(brief_path, 'r', encoding='utf-8') as f:
-                brief_text = f.read()
-        
-        # Read deliverables for token count
-        deliverable_text = ""
-        if os.path.exists(deliverable_dir):
-            for root, dirs, files in os.walk(deliverable_dir):
-                for file in files:
-                    try:
-                        with open(os.path.join(root, file), 'r', encoding='utf-8', errors='ignore') as f:
-                            deliverable_text += f.read() + " "
-                    except: pass
-        
-        entropies.append(calculate_entropy(brief_text, deliverable_text))
-        couplings.append(get_artifact_coupling(brief_text, deliverable_dir))
-    
-    df['instruction_entropy'] = entropies
-    df['artifact_coupling'] = couplings
-    
+    df['SOC Code'] = _with_fallback(df, 'SOC Code', soc_mapping)
+    return df
+
+def _with_fallback(df, column, mapping):
+    mapped = df['Task ID'].map(mapping)
+    if column not in df.columns:
+        return mapped
+    return df[column].where(df[column].notna(), mapped)
+
+def finalize_master(df, winsor=WINSOR):
+    """Joins task rows (with features) to O*NET exposure and derives the winsorized equilibrium wage."""
     # 3. Join with ONET Automation Exposure
     onet_path = 'data/onet/ai_applicability_scores.csv'
     onet_df = pd.read_csv(onet_path)
@@ -173,16 +207,46 @@ def build_master_dataset():
     # MICE Imputation / Robustness Check for Missing Wages
     master_df['wage_imputed'] = master_df['derived_wage'].fillna(master_df['baseline_wage'])
     
-    # 5% Winsorization to remove 'Idle Browser' noise
-    p05 = master_df['wage_imputed'].quantile(0.05)
-    p95 = master_df['wage_imputed'].quantile(0.95)
-    master_df['equilibrium_wage'] = master_df['wage_imputed'].clip(lower=p05, upper=p95)
+    # Winsorization (5/95 by default) to remove 'Idle Browser' noise
+    lower = master_df['wage_imputed'].quantile(winsor[0])
+    upper = master_df['wage_imputed'].quantile(winsor[1])
+    master_df['equilibrium_wage'] = master_df['wage_imputed'].clip(lower=lower, upper=upper)
+    return master_df
+
+def build_master_dataset(workers=1):
+    """Join RLI project data with actual RLI model performance (Automation Rates)."""
+    df = load_task_metadata()
+    started = time.time()
+    
+    # Per-task feature extraction (CPU-bound: tokenization, coupling index)
+    features = parallel_map(task_features, df['Task ID'], workers=workers)
+    # Every task was looked up, so memoized features not used now are stale
+    get_cache().prune_results(['task_features'], started)
+    entropies = [f[0] for f in features]
+    couplings = [f[1] for f in features]
+    
+    df['instruction_entropy'] = entropies
+    df['artifact_coupling'] = couplings
+    
+    master_df = finalize_master(df)
     
     # 5. Save Master Dataset
-    master_df.to_csv('data/master_dataset.csv', index=False)
+    # CSV export plus the memory-mappable columnar table read downstream
+    changes = write_dataset(master_df, MASTER_PATH, key=['Task ID'])
     print("Master dataset REFINED with Domain-Agnostic Coupling.")
+    print(summarize_changes(changes, MASTER_PATH))
     print(master_df[['Task ID', 'instruction_entropy', 'artifact_coupling', 'ai_applicability_score', 'derived_wage']])
     return master_df
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the RLI master dataset.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for per-task features (0 = all cores)")
+    dataset_source.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    dataset_source.configure(args)
+    instrumentation.configure(args)
+    build_master_dataset(workers=args.workers)
+
 if __name__ == "__main__":
-    build_master_dataset()
+    main()
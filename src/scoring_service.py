@@ -0,0 +1,481 @@
+import os
+import sys
+import json
+import math
+import time
+import queue
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+import instrumentation
+import dataset_source
+from corpus_cache import get_cache, walk_files
+from token_stream import count_tokens_batch, joined_token_count
+from keyword_index import ProjectIndex
+from process_master import COUPLING_CHARS, coupling_from_records
+from decomposition_layer_v2 import DecomposeSettings, extract_requirements, requirement_metrics
+from columnar import SUBTASK_PATH
+
+# Long-running scorer for new brief/deliverable pairs.
+#
+# The tokenizer, the corpus cache, per-deliverable-set keyword indexes and the
+# fitted models stay loaded between requests. A request is one JSON object:
+#
+#   {"id": "job-1",
+#    "brief": "...markdown..."          or  "brief_path": "path/to/brief.md",
+#    "deliverables": ["dir/or/file", ...],       directories are walked
+#    "files": {"src/main.py": "inline text"},    inline deliverables
+#    "automation_exposure": 0.4}                 optional, for the selection term
+#
+# and gets back instruction_entropy, artifact_coupling, per-requirement
+# e_hardened/k_hardened, and the translog wage and logit success predictions
+# of the model fitted to the current subtask dataset (per requirement, and
+# for the brief: geometric-mean wage and mean success over its included
+# requirements). Features match process_master/decomposition_layer_v2 for
+# the same files.
+#
+# Requests from all connections go through one micro-batcher: everything
+# queued while a batch is scored forms the next batch, whose briefs are
+# tokenized in one multi-threaded call and whose predictions are one matrix
+# product. Paths are read with the service's own permissions, so it binds to
+# localhost by default.
+#
+#   python src/cli.py score                    # JSON lines on stdin/stdout
+#   python src/cli.py score --http --port 8765 # POST /score, GET /health
+
+MAX_BATCH = 256        # Requests scored together at most
+MAX_WAIT = 0.0         # Seconds to wait for more requests once one arrives (0: take what is queued)
+INDEX_MEMO_SIZE = 256  # Deliverable sets whose keyword indexes are kept
+
+ScoringModel = namedtuple('ScoringModel', [
+    'gamma', 'exposure_mean', 'translog_design', 'translog_beta', 'log_e_mean', 'log_k_mean',
+    'logit_design', 'logit_beta', 'n_obs',
+])
+
+Deliverables = namedtuple('Deliverables', ['records', 'n_files', 'max_depth'])
+
+
+def _design_info(model):
+    # patsy DesignInfo of a formula model (statsmodels >= 0.15 names it model_spec)
+    return getattr(model.data, 'design_info', None) or model.data.model_spec
+
+
+def design_matrix(design_info, data):
+    """Design matrix of a fitted formula's terms evaluated on a dict of arrays."""
+    from patsy import build_design_matrices
+    return np.asarray(build_design_matrices([design_info], data)[0])
+
+
+def fit_scoring_model(path=SUBTASK_PATH, firth=False):
+    """
+    Fits the model's first stage (Probit IMR), translog wage equation and
+    success logit to the subtask dataset, as run_hardened_analysis does.
+    """
+    import statsmodels.formula.api as smf
+    from columnar import read_dataset
+    from logit_engine import fit_logit_batch
+    from final_scientific_model_v2 import TRANSLOG_FORMULA, LOGIT_FORMULA, selection_imr, add_translog_terms
+
+    df = read_dataset(path, ['project_id', 'e_hardened', 'k_hardened', 'success', 'ln_wage_eq',
+                             'automation_exposure', 'included'])
+    df_clean = df[df['included'] == 1].copy()
+    first_stage, imr = selection_imr(df, df_clean, disp=0)
+    df_clean['IMR'] = imr
+    add_translog_terms(df_clean)
+    translog = smf.ols(TRANSLOG_FORMULA, data=df_clean)
+    logit = smf.logit(LOGIT_FORMULA, data=df_clean)
+    logit_fit = fit_logit_batch(logit.exog, logit.endog, firth=firth)
+    return ScoringModel(
+        gamma=np.asarray(first_stage.params, dtype=float),
+        exposure_mean=float(df['automation_exposure'].mean()),
+        translog_design=_design_info(translog),
+        translog_beta=np.asarray(translog.fit().params, dtype=float),
+        log_e_mean=float(np.log(df_clean['e_hardened']).mean()),
+        log_k_mean=float(np.log(df_clean['k_hardened']).mean()),
+        logit_design=_design_info(logit),
+        logit_beta=logit_fit.beta[0] if logit_fit.converged[0] else None,
+        n_obs=len(df_clean),
+    )
+
+
+def predict(model, e, k, exposure):
+    """(ln wage, success probability) arrays for requirements with positive e and k."""
+    from scipy.special import expit, ndtr
+    from bootstrap_engine import inverse_mills_ratio
+
+    e, k, exposure = (np.asarray(a, dtype=float) for a in (e, k, exposure))
+    data = {
+        'e_hardened': e, 'k_hardened': k,
+        'c_log_e': np.log(e) - model.log_e_mean, 'c_log_k': np.log(k) - model.log_k_mean,
+        # The IMR column as selection_imr builds it: the ratio at the first stage's predicted probability
+        'IMR': inverse_mills_ratio(ndtr(model.gamma[0] + model.gamma[1] * exposure)),
+    }
+    ln_wage = design_matrix(model.translog_design, data) @ model.translog_beta
+    if model.logit_beta is None:
+        return ln_wage, np.full_like(ln_wage, np.nan)
+    return ln_wage, expit(design_matrix(model.logit_design, data) @ model.logit_beta)
+
+
+def _clean(x):
+    # JSON-safe: numpy scalars to Python, NaN/inf to null
+    if isinstance(x, dict):
+        return {k: _clean(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_clean(v) for v in x]
+    if isinstance(x, (np.integer, np.bool_)):
+        return x.item()
+    if isinstance(x, (float, np.floating)):
+        return float(x) if math.isfinite(x) else None
+    return x
+
+
+def _inline_files(request):
+    # Inline deliverables as a {name: text} object or a list of {"name", "text"} objects
+    inline = request.get('files', {})
+    if isinstance(inline, list):
+        return [(f['name'], f['text']) for f in inline]
+    return list(inline.items())
+
+
+def validate_request(request):
+    """Raises TypeError/ValueError unless request has the shape described at the top of this module."""
+    if not isinstance(request, dict):
+        raise TypeError("Request must be a JSON object")
+    if 'brief' in request and not isinstance(request['brief'], str):
+        raise TypeError("'brief' must be a string")
+    if 'brief_path' in request and not isinstance(request['brief_path'], str):
+        raise TypeError("'brief_path' must be a string")
+    deliverables = request.get('deliverables', [])
+    if not isinstance(deliverables, list) or not all(isinstance(d, str) for d in deliverables):
+        raise TypeError("'deliverables' must be a list of paths")
+    inline = request.get('files', {})
+    if isinstance(inline, list):
+        if not all(isinstance(f, dict) and 'name' in f and 'text' in f for f in inline):
+            raise TypeError("'files' list entries must be objects with 'name' and 'text'")
+    elif not isinstance(inline, dict):
+        raise TypeError("'files' must be an object or a list")
+    for name, text in _inline_files(request):
+        if not isinstance(name, str) or not isinstance(text, str):
+            raise TypeError(f"Inline file {name!r} must have a string name and text")
+    exposure = request.get('automation_exposure')
+    if exposure is not None and (isinstance(exposure, bool) or not isinstance(exposure, (int, float))):
+        raise TypeError("'automation_exposure' must be a number")
+
+
+def _error_response(request, e):
+    return {'id': request.get('id') if isinstance(request, dict) else None, 'error': f"{type(e).__name__}: {e}"}
+
+
+class Scorer:
+    """Scores batches of requests with warm caches and an optional fitted model."""
+
+    def __init__(self, model=None, settings=DecomposeSettings()):
+        self.model = model
+        self.settings = settings
+        self._indexes = {}
+        self.requests = 0
+        self.batches = 0
+        # Load the tokenizer and open the cache now rather than on the first request
+        count_tokens_batch(['warm up'])
+        get_cache()
+
+    def _index(self, records, cap):
+        key = (cap, tuple((r.path, r.digest) for r in records))
+        index = self._indexes.get(key)
+        if index is None:
+            if len(self._indexes) >= INDEX_MEMO_SIZE:
+                self._indexes.clear()
+            index = self._indexes[key] = ProjectIndex(records, cap)
+        return index
+
+    def _deliverables(self, request):
+        cache = get_cache()
+        records, n_files, max_depth = [], 0, 0
+        for root in request.get('deliverables', []):
+            root = root.rstrip('/') or root
+            if dataset_source.isdir(root):
+                files = walk_files(root)
+                base_depth = root.count(os.sep)
+                for f in files:
+                    max_depth = max(max_depth, f.count(os.sep) - base_depth)
+            elif dataset_source.exists(root):
+                files = [root]
+                max_depth = max(max_depth, 1)
+            else:
+                raise FileNotFoundError(f"Deliverable not found: {root}")
+            n_files += len(files)
+            records.extend(cache.get_many(files))
+        for name, text in _inline_files(request):
+            records.append(cache.get_text(name, text))
+            n_files += 1
+            max_depth = max(max_depth, name.strip('/').count('/') + 1)
+        return Deliverables(records, n_files, max_depth)
+
+    def _brief(self, request):
+        if 'brief' in request:
+            return request['brief']
+        if 'brief_path' in request:
+            return dataset_source.read_text(request['brief_path'])
+        raise ValueError("Request needs 'brief' or 'brief_path'")
+
+    def _features(self, request, brief, b_tokens, deliv):
+        """The response of one request (without predictions) and its (requirement, e, k, exposure) rows."""
+        s = self.settings
+        s_tokens = joined_token_count(deliv.records, sep=' ')
+        coupling = 0
+        if deliv.n_files:
+            coupling = coupling_from_records(brief, deliv.n_files, deliv.records, deliv.max_depth, b_tokens=b_tokens,
+                                             index=self._index(deliv.records, COUPLING_CHARS))
+        requirements = extract_requirements(brief, s.min_requirement_chars)
+        metrics = requirement_metrics(requirements, deliv.records, s, self._index(deliv.records, s.index_chars))
+        exposure = request.get('automation_exposure')
+        response = {
+            'id': request.get('id'),
+            'instruction_entropy': s_tokens / b_tokens if b_tokens > 0 else 0,
+            'artifact_coupling': coupling,
+            'n_files': deliv.n_files,
+            'n_requirements': len(requirements),
+            'requirements': [],
+        }
+        return response, [(req, e, k, exposure) for req, (e, k) in zip(requirements, metrics)]
+
+    @instrumentation.traced('score_batch')
+    def score_batch(self, requests):
+        """One response dict per request; a failing request gets an 'error' and does not affect the others."""
+        self.batches += 1
+        self.requests += len(requests)
+        responses = [None] * len(requests)
+        parsed = []
+        for i, request in enumerate(requests):
+            try:
+                validate_request(request)
+                parsed.append((i, request, self._brief(request), self._deliverables(request)))
+            except Exception as e:
+                responses[i] = _error_response(request, e)
+
+        # Briefs are validated strings, so one failure cannot spoil the shared batch
+        brief_tokens = count_tokens_batch([p[2] for p in parsed])
+        rows = []  # (response index, requirement, e, k, exposure)
+        for (i, request, brief, deliv), b_tokens in zip(parsed, brief_tokens):
+            try:
+                responses[i], request_rows = self._features(request, brief, b_tokens, deliv)
+            except Exception as e:
+                responses[i] = _error_response(request, e)
+                continue
+            rows.extend((i,) + row for row in request_rows)
+        self._add_predictions(responses, rows)
+        return [_clean(r) for r in responses]
+
+    def _add_predictions(self, responses, rows):
+        included = [r for r in rows if r[2] > 0 and r[3] > 0]
+        predicted = {}
+        if self.model is not None and included:
+            exposure = [self.model.exposure_mean if r[4] is None else r[4] for r in included]
+            ln_wage, success = predict(self.model, [r[2] for r in included], [r[3] for r in included], exposure)
+            predicted = {id(r): (w, p) for r, w, p in zip(included, ln_wage, success)}
+
+        per_brief = {}
+        for row in rows:
+            i, req, e, k, _ = row
+            entry = {'requirement': req[:100], 'e_hardened': e, 'k_hardened': k, 'included': e > 0 and k > 0,
+                     'predicted_ln_wage': None, 'predicted_wage': None, 'predicted_success': None}
+            if id(row) in predicted:
+                w, p = predicted[id(row)]
+                entry.update(predicted_ln_wage=w, predicted_wage=np.exp(w), predicted_success=p)
+                per_brief.setdefault(i, []).append((w, p))
+            responses[i]['requirements'].append(entry)
+        for i, response in enumerate(responses):
+            if 'error' in response:
+                continue
+            preds = per_brief.get(i)
+            response['predicted_wage'] = float(np.exp(np.mean([w for w, _ in preds]))) if preds else None
+            response['predicted_success'] = float(np.mean([p for _, p in preds])) if preds else None
+
+
+class MicroBatcher:
+    """
+    Collects requests submitted from any thread into batches for one scoring
+    thread. Requests that arrive while a batch is being scored form the next
+    batch, so batches grow with load and a lone request is not delayed.
+    """
+
+    def __init__(self, score_batch, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self._score_batch = score_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """Returns a Future resolving to the request's response."""
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                timeout = deadline - time.monotonic()
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                results = self._score_batch([request for request, _ in batch])
+            except Exception as e:
+                results = [{'error': f"{type(e).__name__}: {e}"}] * len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _submit_all(batcher, payload):
+    # A payload is one request object or a list of them
+    if isinstance(payload, list):
+        futures = [batcher.submit(r) for r in payload]
+        return lambda: [f.result() for f in futures]
+    future = batcher.submit(payload)
+    return future.result
+
+
+def serve_jsonl(batcher, infile=sys.stdin, outfile=sys.stdout):
+    """One response line per request line, in input order; a line may hold a list of requests."""
+    pending = queue.Queue()
+
+    def write():
+        while True:
+            result = pending.get()
+            if result is None:
+                return
+            outfile.write(json.dumps(result()) + '\n')
+            outfile.flush()
+
+    writer = threading.Thread(target=write, name='jsonl-writer', daemon=True)
+    writer.start()
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError as e:
+            error = {'error': f"JSONDecodeError: {e}"}
+            pending.put(lambda error=error: error)
+            continue
+        pending.put(_submit_all(batcher, payload))
+    pending.put(None)
+    writer.join()
+
+
+class _ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so clients can pipeline requests on one connection
+    batcher = None
+    scorer = None
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+            return
+        scorer = self.scorer
+        self._reply(200, {'status': 'ok', 'model': scorer.model is not None,
+                          'requests': scorer.requests, 'batches': scorer.batches})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path != '/score':
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError as e:
+            self._reply(400, {'error': f"JSONDecodeError: {e}"})
+            return
+        self._reply(200, _submit_all(self.batcher, payload)())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_http_server(scorer, batcher, host='127.0.0.1', port=0):
+    """HTTP front end (POST /score, GET /health); port=0 picks a free port. Call serve_forever()."""
+    handler = type('ScoringHandler', (_ScoringHandler,), {'batcher': batcher, 'scorer': scorer})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm scoring service for new briefs and deliverables.")
+    parser.add_argument('--http', action='store_true', help="Serve HTTP instead of JSON lines on stdin/stdout")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="Requests scored together at most")
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT,
+                        help="Seconds a batch waits for more requests (0: only what is already queued)")
+    parser.add_argument('--no-model', action='store_true', help="Features only, no wage/success predictions")
+    parser.add_argument('--firth', action='store_true', help="Firth-penalized success logit")
+    dataset_source.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    dataset_source.configure(args)
+    instrumentation.configure(args)
+
+    model = None
+    if not args.no_model:
+        if os.path.exists(SUBTASK_PATH):
+            model = fit_scoring_model(firth=args.firth)
+            print(f"[score] model fitted on {model.n_obs} included requirements", file=sys.stderr)
+        else:
+            print(f"[score] {SUBTASK_PATH} missing; serving features without predictions", file=sys.stderr)
+    scorer = Scorer(model)
+    batcher = MicroBatcher(scorer.score_batch, args.max_batch, args.max_wait)
+
+    if args.http:
+        server = make_http_server(scorer, batcher, args.host, args.port)
+        print(f"[score] listening on http://{args.host}:{server.server_port}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        serve_jsonl(batcher)
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import json
+import argparse
+import itertools
+
+import pandas as pd
+
+import instrumentation
+import dataset_source
+from corpus_cache import PREFIX_CHARS, get_cache, walk_files
+from parallel import parallel_map
+from columnar import included_mask
+from process_master import (COUPLING_STOP_WORDS, COUPLING_CHARS, WINSOR, load_task_metadata, task_features,
+                            finalize_master)
+from decomposition_layer_v2 import (DecomposeSettings, REQUIREMENT_STOP_WORDS, MIN_REQUIREMENT_CHARS, INDEX_CHARS,
+                                    SOLUTION_CHARS, LOGIC_EXTS, build_work_items, decompose_chunk, project_columns)
+from bootstrap_engine import ClusterDesign, cluster_bootstrap
+from draw_store import summarize_column
+
+# Sensitivity analysis over the pipeline's analytical choices.
+#
+# A grid (JSON object of parameter -> list of values) is expanded to every
+# combination. Each stage is computed once per distinct value of the
+# parameters it actually depends on:
+#
+#   master features   coupling_stop_words, coupling_chars
+#   master wages      winsor
+#   decomposition     codec, min_requirement_chars, requirement_stop_words,
+#                     index_chars, solution_chars, logic_exts
+#   model             all of the above, n_boot
+#
+# Per-file features come from the persistent corpus cache (warmed in the
+# parent so forked workers inherit it), so no grid point re-reads a file.
+# Master features, decomposition chunks and model fits each run on the
+# process pool. Coefficients and bootstrap p-values of the translog model go
+# to one long-format table, one row per (grid point, term).
+#
+#   python src/sweep.py '{"min_requirement_chars": [5, 10, 20], "winsor": [[0.05, 0.95], [0.01, 0.99]]}'
+#   python src/sweep.py grid.json --workers 0
+
+SWEEP_PATH = 'output/sweeps/sweep_results.csv'
+
+DEFAULTS = {
+    'coupling_stop_words': 'default',
+    'coupling_chars': COUPLING_CHARS,
+    'winsor': list(WINSOR),
+    'codec': 'zlib',
+    'min_requirement_chars': MIN_REQUIREMENT_CHARS,
+    'requirement_stop_words': 'default',
+    'index_chars': INDEX_CHARS,
+    'solution_chars': SOLUTION_CHARS,
+    'logic_exts': 'default',
+    'n_boot': 200,
+}
+
+# Named values a grid may use instead of spelling out a word or extension list
+PRESETS = {
+    'coupling_stop_words': {'default': COUPLING_STOP_WORDS, 'none': frozenset()},
+    'requirement_stop_words': {'default': REQUIREMENT_STOP_WORDS, 'none': frozenset()},
+    'logic_exts': {'default': LOGIC_EXTS},
+}
+
+CAP_PARAMS = ('coupling_chars', 'index_chars', 'solution_chars')
+
+
+def expand_grid(grid):
+    """Every combination of the grid's values (missing parameters keep their defaults), as dicts."""
+    unknown = set(grid) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+    axes = [grid.get(k, [v]) for k, v in DEFAULTS.items()]
+    return [dict(zip(DEFAULTS, values)) for values in itertools.product(*axes)]
+
+
+def resolve(point):
+    """Concrete values of a grid point: presets expanded, lists made hashable, caps checked."""
+    values = dict(point)
+    for key, presets in PRESETS.items():
+        v = values[key]
+        if isinstance(v, str):
+            if v not in presets:
+                raise ValueError(f"Unknown {key} preset: {v} (choose from {', '.join(presets)})")
+            values[key] = presets[v]
+        else:
+            values[key] = frozenset(v) if key.endswith('stop_words') else tuple(v)
+    for key in CAP_PARAMS:
+        # Deliverables are cached up to PREFIX_CHARS; longer caps would need a re-read
+        if not 0 < values[key] <= PREFIX_CHARS:
+            raise ValueError(f"{key} must be in (0, {PREFIX_CHARS}], got {values[key]}")
+    lo, hi = values['winsor']
+    if not 0 <= lo < hi <= 1:
+        raise ValueError(f"winsor must be two quantiles 0 <= lo < hi <= 1, got {values['winsor']}")
+    values['winsor'] = (lo, hi)
+    return values
+
+
+def master_key(values):
+    return values['coupling_stop_words'], values['coupling_chars']
+
+
+def decompose_settings(values):
+    return DecomposeSettings(
+        codec=values['codec'], min_requirement_chars=values['min_requirement_chars'],
+        stop_words=values['requirement_stop_words'], index_chars=values['index_chars'],
+        solution_chars=values['solution_chars'], logic_exts=values['logic_exts'],
+    )
+
+
+def _task_features(item):
+    tid, stop_words, cap = item
+    return task_features(tid, None, stop_words, cap)
+
+
+def attach_project_columns(rows, master_df):
+    """Replaces the project-level subtask columns with those of master_df."""
+    by_task = master_df.set_index('Task ID')
+    per_task = {t: project_columns(by_task.loc[t]) for t in rows['project_id'].unique()}
+    out = rows.copy()
+    for col in ('success', 'ln_wage_eq', 'automation_exposure'):
+        out[col] = rows['project_id'].map({t: c[col] for t, c in per_task.items()})
+    return out
+
+
+def fit_point(item):
+    """Heckman-corrected translog with a pairs-cluster bootstrap for one grid point's subtask table."""
+    from final_scientific_model_v2 import TRANSLOG_FORMULA, selection_imr, add_translog_terms
+
+    df, n_boot, seed = item
+    df = df.copy()
+    df['included'] = included_mask(df)
+    df_clean = df[df['included'] == 1].copy()
+    info = {'n_requirements': len(df), 'n_included': len(df_clean), 'n_projects': df_clean['project_id'].nunique()}
+    try:
+        _, imr = selection_imr(df, df_clean, disp=0)
+        df_clean['IMR'] = imr
+        add_translog_terms(df_clean)
+        design = ClusterDesign(TRANSLOG_FORMULA, df_clean, 'project_id')
+        draws = cluster_bootstrap(design, n_boot, method='pairs', seed=seed)
+    except Exception as e:
+        # Degenerate points (no inclusion variation, too few rows) are reported, not fatal
+        return info, [], f"{type(e).__name__}: {e}"
+    terms = []
+    for j, col in enumerate(design.columns):
+        s = summarize_column(draws[:, j])
+        terms.append({'term': col, 'estimate': design.beta[j], 'boot_mean': s['mean'], 'std': s['std'],
+                      'ci_lower': s['ci_lower'], 'ci_upper': s['ci_upper'], 'p': s['p'], 'mcse_p': s['mcse_p']})
+    return info, terms, None
+
+
+def _label(value):
+    return value if isinstance(value, (str, int, float)) else json.dumps(value)
+
+
+def run_sweep(grid, workers=1, chunk_size=64, seed=0):
+    """Runs every grid point and returns the long-format results table."""
+    points = expand_grid(grid)
+    resolved = [resolve(p) for p in points]
+    rli_base = dataset_source.get_root()
+    meta = load_task_metadata(rli_base)
+    tasks = list(meta['Task ID'])
+    print(f"Sweep: {len(points)} grid points over {len(tasks)} tasks")
+
+    # Warm the per-file feature cache once; forked workers inherit the records
+    with instrumentation.span('sweep:warm_cache'):
+        for t in tasks:
+            get_cache().get_many(walk_files(os.path.join(rli_base, t, 'human_deliverable')))
+
+    # Master features, once per distinct (stop words, cap)
+    master_keys = list(dict.fromkeys(master_key(v) for v in resolved))
+    with instrumentation.span('sweep:master_features', n=len(master_keys)):
+        items = [(t, stop_words, cap) for stop_words, cap in master_keys for t in tasks]
+        features = parallel_map(_task_features, items, workers=workers)
+    masters = {}
+    for i, key in enumerate(master_keys):
+        block = features[i * len(tasks):(i + 1) * len(tasks)]
+        df = meta.copy()
+        df['instruction_entropy'] = [f[0] for f in block]
+        df['artifact_coupling'] = [f[1] for f in block]
+        for v in resolved:
+            if master_key(v) == key and (key, v['winsor']) not in masters:
+                masters[(key, v['winsor'])] = finalize_master(df.copy(), v['winsor'])
+
+    # Decomposition, once per distinct settings; chunks of every setting share one pool
+    settings_list = list(dict.fromkeys(decompose_settings(v) for v in resolved))
+    base_master = next(iter(masters.values()))
+    with instrumentation.span('sweep:decomposition', n=len(settings_list)):
+        items = [item for s in settings_list for item in build_work_items(base_master, s, chunk_size, rli_base)]
+        chunk_rows = parallel_map(decompose_chunk, items, workers=workers)
+    subtasks = {s: [] for s in settings_list}
+    for item, rows in zip(items, chunk_rows):
+        subtasks[item[4]].extend(rows)
+    subtasks = {s: pd.DataFrame(rows) for s, rows in subtasks.items()}
+
+    # Model fits, one per grid point, with the point's wages attached
+    with instrumentation.span('sweep:model', n=len(points)):
+        fit_items = []
+        for v in resolved:
+            rows = subtasks[decompose_settings(v)]
+            if len(rows):
+                rows = attach_project_columns(rows, masters[(master_key(v), v['winsor'])])
+            fit_items.append((rows, v['n_boot'], seed))
+        fits = parallel_map(fit_point, fit_items, workers=workers)
+
+    records = []
+    for i, (point, v, (info, terms, error)) in enumerate(zip(points, resolved, fits)):
+        master_df = masters[(master_key(v), v['winsor'])]
+        base = {'point': i, **{k: _label(point[k]) for k in DEFAULTS}, **info,
+                'mean_instruction_entropy': master_df['instruction_entropy'].mean(),
+                'mean_artifact_coupling': master_df['artifact_coupling'].mean()}
+        if error:
+            records.append({**base, 'error': error})
+        for term in terms:
+            records.append({**base, **term})
+    return pd.DataFrame(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run feature extraction and the model over a parameter grid.")
+    parser.add_argument('grid', help="Grid as a JSON object, or a path to a JSON file")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (0 = all cores)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Requirements per decomposition work item")
+    parser.add_argument('--seed', type=int, default=0, help="Bootstrap seed shared by every grid point")
+    parser.add_argument('--out', default=SWEEP_PATH)
+    dataset_source.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    dataset_source.configure(args)
+    instrumentation.configure(args)
+
+    if os.path.exists(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+    results = run_sweep(grid, workers=args.workers, chunk_size=args.chunk_size, seed=args.seed)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    results.to_csv(args.out, index=False)
+    print(f"Sweep results ({len(results)} rows) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# Per-file identifier statistics for the hardened kappa metric.
+#
+# A requirement's solution text is its files' leading text, each followed by
+# a space. Identifier matches never cross that space, so the unique-symbol set
+# of the solution is the union of the per-file sets and its length is the sum
+# of per-file lengths. Each file is therefore tokenized once; a requirement
+# only unions sorted arrays of interned symbol ids.
+
+SYMBOL_RE = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]{5,}\b')
+
+FileStats = namedtuple('FileStats', ['symbols', 'length'])
+
+_symbol_ids = {}
+_stats_memo = {}
+_ext_memo = {}
+_union_memo = {}
+
+# Union results kept before the table is reset
+MEMO_SIZE = 100000
+
+
+def intern_symbols(symbols):
+    """Sorted int32 array of process-wide ids for a set of symbol strings."""
+    ids = [_symbol_ids.setdefault(s, len(_symbol_ids)) for s in symbols]
+    return np.array(sorted(ids), dtype=np.int32)
+
+
+def file_stats(record, n):
+    """Symbol ids and solution length of one file's first n characters, memoized by content."""
+    key = (record.digest, n)
+    stats = _stats_memo.get(key)
+    if stats is None:
+        text = record.text_head(n)
+        # +1 for the separating space each file contributes
+        stats = FileStats(intern_symbols(set(SYMBOL_RE.findall(text))), len(text) + 1)
+        _stats_memo[key] = stats
+    return stats
+
+
+def has_extension(path, exts):
+    """Case-insensitive extension test, memoized per path."""
+    key = (path, exts)
+    hit = _ext_memo.get(key)
+    if hit is None:
+        hit = _ext_memo[key] = path.lower().endswith(exts)
+    return hit
+
+
+def solution_symbol_stats(records, n):
+    """
+    (unique symbol count, total length) of the solution text built from
+    records, memoized by the records' content fingerprint.
+    """
+    key = (n, tuple(r.digest for r in records))
+    hit = _union_memo.get(key)
+    if hit is None:
+        stats = [file_stats(r, n) for r in records]
+        if not stats:
+            hit = (0, 0)
+        elif len(stats) == 1:
+            hit = (len(stats[0].symbols), stats[0].length)
+        else:
+            hit = (len(np.unique(np.concatenate([s.symbols for s in stats]))), sum(s.length for s in stats))
+        if len(_union_memo) >= MEMO_SIZE:
+            _union_memo.clear()
+        _union_memo[key] = hit
+    return hit
@@ -0,0 +1,159 @@
+import re
+
+import instrumentation
+
+# Streaming, exact cl100k_base token counting.
+#
+# cl100k_base pre-tokenizes text with a regex and runs BPE inside each piece.
+# Some positions always start a new piece, and the pieces before them never
+# depend on text after them, so the text can be cut there and the per-segment
+# counts add up to the count of the whole string:
+#
+#   - a space preceded by a non-whitespace character;
+#   - a non-whitespace character preceded by a line break (no piece runs from
+#     a line break into non-whitespace);
+#   - the end of a run of ASCII letters or of ASCII digits followed by another
+#     ASCII character (letter pieces stop at the first non-letter and number
+#     pieces at the first non-digit), so data files, minified code and base64
+#     without spaces are cut too.
+#
+# Everything here cuts only at those "safe" positions.
+
+CHUNK_CHARS = 1 << 20      # Characters read per file chunk
+BATCH_SEGMENTS = 16        # Segments handed to encode_batch at once
+NUM_THREADS = 8            # Threads used by tiktoken's batch encoder
+
+_tokenizer = None
+
+_SAFE_CUT = re.compile(r"(?<=\S)(?= )|(?<=[\r\n])(?=\S)"
+                       r"|(?<=[A-Za-z])(?=[\x00-\x40\x5b-\x60\x7b-\x7f])|(?<=[0-9])(?=[\x00-\x2f\x3a-\x7f])")
+# The same positions in reversed text, to find the last cut with one forward search
+_SAFE_CUT_REVERSED = re.compile(r"(?<= )(?=\S)|(?<=\S)(?=[\r\n])"
+                                r"|(?<=[\x00-\x40\x5b-\x60\x7b-\x7f])(?=[A-Za-z])|(?<=[\x00-\x2f\x3a-\x7f])(?=[0-9])")
+
+
+def get_tokenizer():
+    """Returns the shared cl100k_base encoder, loading it on first use."""
+    global _tokenizer
+    if _tokenizer is None:
+        import tiktoken
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return _tokenizer
+
+
+@instrumentation.traced('count_tokens')
+def count_tokens(text):
+    if not text: return 0
+    n = len(get_tokenizer().encode(text))
+    instrumentation.count('tokens_encoded', n)
+    return n
+
+
+def count_tokens_batch(texts, num_threads=NUM_THREADS):
+    """count_tokens of every text, encoded in one multi-threaded batch."""
+    texts = list(texts)
+    nonempty = [t for t in texts if t]
+    if not nonempty:
+        return [0] * len(texts)
+    lengths = iter([len(tokens) for tokens in get_tokenizer().encode_batch(nonempty, num_threads=num_threads)])
+    counts = [next(lengths) if t else 0 for t in texts]
+    instrumentation.count('tokens_encoded', sum(counts))
+    return counts
+
+
+def _first_safe_cut(text, start=1):
+    m = _SAFE_CUT.search(text, max(start, 1))
+    return m.start() if m else -1
+
+
+def _last_safe_cut(text, start=1):
+    # The first cut of the reversed text is the last cut of text
+    m = _SAFE_CUT_REVERSED.search(text[::-1])
+    if not m:
+        return -1
+    p = len(text) - m.start()
+    return p if p >= max(start, 1) else -1
+
+
+class StreamTokenCounter:
+    """
+    Counts tokens of a text fed in arbitrary chunks without ever holding the
+    whole text. Keeps the text before the first safe cut (head) and after the
+    last safe cut (tail) so several streams can later be joined exactly.
+    Only the new chunk is searched for cuts, and text without a cut is kept
+    as a list of chunks joined once, so the work is linear in the text size.
+    """
+
+    def __init__(self, num_threads=NUM_THREADS, batch_segments=BATCH_SEGMENTS):
+        self.num_threads = num_threads
+        self.batch_segments = batch_segments
+        self.head = None
+        self.body_tokens = 0
+        self._carry = []   # Chunks since the last safe cut
+        self._last = ""    # Last character fed, to see a cut at the start of a chunk
+        self._batch = []
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        text = self._last + chunk
+        skip = len(self._last)
+        self._last = chunk[-1]
+        start = 0  # Start of the text in chunk not yet emitted or kept as head
+        if self.head is None:
+            first = _first_safe_cut(text)
+            if first == -1:
+                self._carry.append(chunk)
+                return
+            start = first - skip
+            self.head = ''.join(self._carry) + chunk[:start]
+            self._carry = []
+        last = _last_safe_cut(text, start + skip)
+        if last == -1:
+            # No new cut (e.g. one very long run); keep the chunk until there is one
+            self._carry.append(chunk[start:])
+            return
+        segment = ''.join(self._carry) + chunk[start:last - skip]
+        if segment:
+            self._batch.append(segment)
+        self._carry = [chunk[last - skip:]]
+        if len(self._batch) >= self.batch_segments:
+            self._encode_batch()
+
+    def _encode_batch(self):
+        if self._batch:
+            encoded = get_tokenizer().encode_batch(self._batch, num_threads=self.num_threads)
+            n = sum(len(tokens) for tokens in encoded)
+            instrumentation.count('tokens_encoded', n)
+            self.body_tokens += n
+            self._batch = []
+
+    def finish(self):
+        """Returns (head, body_tokens, tail); tail is None when no safe cut was seen."""
+        self._encode_batch()
+        self._carry = [''.join(self._carry)]
+        if self.head is None:
+            return self._carry[0], 0, None
+        return self.head, self.body_tokens, self._carry[0]
+
+    def total(self):
+        head, body_tokens, tail = self.finish()
+        return count_tokens(head) + body_tokens + count_tokens(tail)
+
+
+def joined_token_count(stats, sep=' '):
+    """
+    Exact token count of the concatenation of several texts, each followed by
+    sep, from their (head, body_tokens, tail) stats. Accepts tuples or any
+    objects with head/body_tokens/tail attributes (e.g. cached FileRecords).
+    """
+    total = 0
+    pending = []  # Texts since the last safe cut, joined once when the next one is reached
+    for s in stats:
+        head, body_tokens, tail = (s.head, s.body_tokens, s.tail) if hasattr(s, 'head') else s
+        if tail is None:
+            pending += [head, sep]
+            continue
+        total += count_tokens(''.join(pending) + head) + body_tokens
+        pending = [tail, sep]
+    return total + count_tokens(''.join(pending))
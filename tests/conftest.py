@@ -0,0 +1,75 @@
+import os
+import sys
+import shutil
+from contextlib import contextmanager
+
+import pytest
+
+# The pipeline scripts import each other as top-level modules from src/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+
+ONET_PATH = 'data/onet/ai_applicability_scores.csv'  # Read by the master stage
+CORPUS_ROOT = 'data/rli_public_set'
+N_TASKS = 10
+
+
+@contextmanager
+def working_dir(path):
+    """
+    Runs pipeline stages in path: every stage reads and writes data/ and
+    output/ relative to the working directory, and the per-process corpus
+    cache and index memo are reopened there.
+    """
+    import corpus_cache
+    import decomposition_layer_v2
+
+    def reset():
+        # Dropped rather than closed: the connection may belong to a scoring thread
+        corpus_cache._default_cache = None
+        decomposition_layer_v2._index_memo.clear()
+
+    previous = os.getcwd()
+    os.chdir(path)
+    reset()
+    try:
+        yield path
+    finally:
+        reset()
+        os.chdir(previous)
+
+
+def copy_workdir(src, dst):
+    """Copies a working directory, keeping mtimes so its columnar tables stay current."""
+    shutil.copytree(src, dst)
+    return dst
+
+
+def run_stages(workdir, workers=1):
+    """Master dataset and decomposition of the corpus in workdir."""
+    from process_master import build_master_dataset
+    from decomposition_layer_v2 import decompose_projects
+
+    with working_dir(workdir):
+        build_master_dataset(workers=workers)
+        decompose_projects(workers=workers, resume=False)
+    return workdir
+
+
+@pytest.fixture(scope='session')
+def corpus_dir(tmp_path_factory):
+    """A working directory holding a synthetic N_TASKS-task corpus and the O*NET scores."""
+    from synthetic_corpus import CorpusSpec, generate_corpus
+
+    workdir = tmp_path_factory.mktemp('corpus')
+    os.makedirs(workdir / os.path.dirname(ONET_PATH))
+    shutil.copy(os.path.join(REPO_DIR, ONET_PATH), workdir / ONET_PATH)
+    with working_dir(workdir):
+        generate_corpus(CORPUS_ROOT, CorpusSpec(n_tasks=N_TASKS, seed=0))
+    return workdir
+
+
+@pytest.fixture(scope='session')
+def serial_run(corpus_dir, tmp_path_factory):
+    """corpus_dir after a serial master and decomposition run (do not modify; copy it)."""
+    return run_stages(copy_workdir(corpus_dir, tmp_path_factory.mktemp('serial') / 'work'))
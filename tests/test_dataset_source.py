@@ -0,0 +1,144 @@
+import os
+import json
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import dataset_source
+from columnar import MASTER_PATH, SUBTASK_PATH
+from corpus_cache import CorpusCache
+from dataset_source import MirrorError, open_source, pack, serve
+
+from conftest import CORPUS_ROOT, ONET_PATH, REPO_DIR, run_stages
+
+ARCHIVES = ['corpus.zip', 'corpus.tar', 'corpus.tar.gz']
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+@pytest.fixture(scope='module')
+def sources(corpus_dir, tmp_path_factory):
+    """{kind: corpus location} for the directory, its archives and an HTTP mirror of it."""
+    out = tmp_path_factory.mktemp('sources')
+    root = str(corpus_dir / CORPUS_ROOT)
+    locations = {'directory': root}
+    for name in ARCHIVES:
+        pack(root, str(out / name))
+        locations[name] = str(out / name)
+    # serve() writes a manifest into the directory it serves, so it serves a copy
+    mirrored = shutil.copytree(root, out / 'mirror', copy_function=shutil.copy2)
+    server = serve(str(mirrored))
+    locations['mirror'] = _serve(server)
+    yield locations
+    server.shutdown()
+    server.server_close()
+
+
+def _listing(location):
+    source = open_source(location)
+    root = location.rstrip('/')
+    return [(p[len(root) + 1:], source.stat(p).size) for p in source.walk_files(root)]
+
+
+def _read(location, rel):
+    with open_source(location).open(location.rstrip('/') + '/' + rel) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('kind', ARCHIVES + ['mirror'])
+def test_sources_list_and_read_the_same_files(sources, kind):
+    expected = _listing(sources['directory'])
+    listing = _listing(sources[kind])
+    # Same files in the same os.walk order, with the same sizes and bytes
+    assert listing == expected
+    for rel, _ in listing:
+        assert _read(sources[kind], rel) == _read(sources['directory'], rel)
+
+
+@pytest.mark.parametrize('kind', ARCHIVES + ['mirror'])
+def test_pipeline_outputs_are_byte_identical(sources, serial_run, tmp_path, monkeypatch, kind):
+    # A working directory without the corpus: everything is read through the source
+    os.makedirs(tmp_path / os.path.dirname(ONET_PATH))
+    shutil.copy(os.path.join(REPO_DIR, ONET_PATH), tmp_path / ONET_PATH)
+    open_source(sources[kind])
+    monkeypatch.setenv(dataset_source.SOURCE_ENV, sources[kind])
+    run_stages(tmp_path)
+    for path in (MASTER_PATH, SUBTASK_PATH):
+        with open(tmp_path / path, 'rb') as got, open(serial_run / path, 'rb') as expected:
+            assert got.read() == expected.read(), path
+
+
+class _FaultyMirror(BaseHTTPRequestHandler):
+    # Lists three 10-byte files: 'short' ends after 3 bytes, 'stall' stops sending after 3, 'gone' is a 404
+    def do_GET(self):
+        if self.path == '/' + dataset_source.MANIFEST_NAME:
+            body = json.dumps({'files': [['short.txt', 10, 0], ['stall.txt', 10, 0], ['gone.txt', 10, 0]]})
+            self._send(body.encode())
+        elif self.path == '/gone.txt':
+            self.send_error(404)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Length', '10')
+            self.end_headers()
+            self.wfile.write(b'abc')
+            self.wfile.flush()
+            if self.path == '/stall.txt':
+                time.sleep(3)
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def faulty_mirror(monkeypatch):
+    monkeypatch.setattr(dataset_source, 'HTTP_TIMEOUT', 0.5)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FaultyMirror)
+    server.daemon_threads = True
+    url = _serve(server)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('name', ['short.txt', 'stall.txt', 'gone.txt'])
+def test_incomplete_mirror_reads_raise(faulty_mirror, name):
+    source = open_source(faulty_mirror)
+    with pytest.raises(MirrorError):
+        with source.open(f'{faulty_mirror}/{name}') as f:
+            f.read()
+
+
+def test_cache_does_not_skip_a_file_the_mirror_cut_short(faulty_mirror, tmp_path):
+    open_source(faulty_mirror)
+    cache = CorpusCache(str(tmp_path / 'cache.sqlite'))
+    with pytest.raises(MirrorError):
+        cache.get(f'{faulty_mirror}/short.txt')
+
+
+def test_mirror_file_changed_after_the_manifest_raises(corpus_dir, tmp_path):
+    root = shutil.copytree(corpus_dir / CORPUS_ROOT, tmp_path / 'mirror', copy_function=shutil.copy2)
+    server = serve(str(root))
+    url = _serve(server)
+    try:
+        rel = next(rel for rel, size in _listing(str(root)) if size > 1 and rel != dataset_source.MANIFEST_NAME)
+        source = open_source(url)
+        with open(root / rel, 'ab') as f:
+            f.write(b'appended after the manifest')
+        with pytest.raises(MirrorError):
+            with source.open(f'{url}/{rel}') as f:
+                f.read()
+    finally:
+        server.shutdown()
+        server.server_close()
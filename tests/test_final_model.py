@@ -0,0 +1,64 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+from columnar import SUBTASK_PATH, read_dataset
+from draw_store import STORE_ROOT, DrawStore
+from final_scientific_model_v2 import (format_logit_inference, run_hardened_analysis, selection_imr,
+                                       success_model_inference)
+from logit_engine import logit_permutation_test
+
+from conftest import copy_workdir, working_dir
+
+
+@pytest.fixture(scope='module')
+def clean(serial_run):
+    df = read_dataset(os.path.join(serial_run, SUBTASK_PATH),
+                      ['project_id', 'e_hardened', 'k_hardened', 'success', 'ln_wage_eq',
+                       'automation_exposure', 'included'])
+    df_clean = df[df['included'] == 1].copy()
+    df_clean['IMR'] = selection_imr(df, df_clean, disp=0)[1]
+    return df_clean
+
+
+def test_permutation_p_values_leave_out_the_intercept(clean):
+    result = success_model_inference(clean, 'permutation', n_draws=20, seed=0, firth=True)
+    assert result['permutation_valid'] > 0
+    assert 'Intercept' not in result['permutation_p']
+    assert set(result['permutation_p']) == set(result['columns']) - {'Intercept'}
+    assert all(0 < p <= 1 for p in result['permutation_p'].values())
+    lines = format_logit_inference(result).splitlines()
+    assert next(line for line in lines if line.startswith('Intercept:')).endswith('perm p=n/a')
+    assert all('perm p=n/a' not in line for line in lines if not line.startswith('Intercept:'))
+
+
+def test_permutation_test_has_no_p_value_for_constant_columns():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=200)
+    X = np.column_stack([np.ones(200), x])
+    y = (rng.random(200) < 1 / (1 + np.exp(-x))).astype(float)
+    p, _, valid = logit_permutation_test(X, y, np.arange(200), 50, seed=0)
+    assert valid.all()
+    assert np.isnan(p[0]) and 0 < p[1] <= 1
+
+
+def test_store_directory_is_a_slug_of_the_method(tmp_path):
+    store = DrawStore.open({'formula': 'y ~ x', 'method': 'wild (rademacher)', 'columns': ['x']},
+                           root=str(tmp_path))
+    assert re.fullmatch(r'wild-rademacher-[0-9a-f]{16}', os.path.basename(store.path))
+
+
+@pytest.mark.parametrize('method, weights, two_step, slug', [
+    ('pairs', 'rademacher', False, 'pairs'),
+    ('wild', 'rademacher', False, 'wild-rademacher'),
+    ('wild', 'webb', False, 'wild-webb'),
+    ('pairs', 'rademacher', True, 'two-step-pairs'),
+])
+def test_bootstrap_store_paths(serial_run, tmp_path, method, weights, two_step, slug):
+    with working_dir(copy_workdir(serial_run, tmp_path / 'work')):
+        run_hardened_analysis(n_iterations=10, method=method, weights=weights, two_step=two_step, seed=0,
+                              chunk_size=10)
+        stores = os.listdir(STORE_ROOT)
+    assert len(stores) == 1 and re.fullmatch(slug + r'-[0-9a-f]{16}', stores[0])
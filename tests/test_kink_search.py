@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from kink_search import estimate_kink, predict_kink
+
+SCAN_POINTS = 4001
+
+
+def scan_ssr(x, y, trim=0.2, min_side=2, n=SCAN_POINTS, taus=None):
+    """Least SSR of the kink model over a dense grid of admissible breakpoints (or over taus)."""
+    if taus is None:
+        lo, hi = np.quantile(x, [trim, 1 - trim])
+        taus = np.linspace(lo, hi, n)
+    left = (x[None, :] <= taus[:, None]).sum(axis=1)
+    taus = taus[(left >= min_side) & (len(x) - left >= min_side)]
+    X = np.stack([np.ones((len(taus), len(x))), np.broadcast_to(x, (len(taus), len(x))),
+                  np.maximum(0, x[None, :] - taus[:, None])], axis=2)
+    XtX = np.einsum('tni,tnj->tij', X, X)
+    Xty = np.einsum('tni,n->ti', X, y)
+    beta = np.einsum('tij,tj->ti', np.linalg.pinv(XtX), Xty)
+    resid = y[None, :] - np.einsum('tni,ti->tn', X, beta)
+    return (resid ** 2).sum(axis=1).min()
+
+
+def residual_ssr(result, x, y):
+    return ((y - predict_kink(result, x)) ** 2).sum()
+
+
+def test_never_worse_than_dense_scan():
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        n = int(rng.integers(8, 60))
+        x = np.round(rng.uniform(0, 10, n), int(rng.integers(0, 2)))
+        y = 1 + 0.5 * x + rng.normal(0, 1.5) * np.maximum(0, x - rng.uniform(1, 9)) + rng.normal(0, 0.3, n)
+        try:
+            result = estimate_kink(x, y)
+        except ValueError:
+            continue
+        lo, hi = np.quantile(x, [0.2, 0.8])
+        # The search runs on centered x, so the bounds hold up to round-off
+        assert lo - 1e-9 <= result.kink <= hi + 1e-9
+        assert result.ssr <= scan_ssr(x, y) + 1e-8 * max(1.0, result.ssr)
+        # The 13-point percentile grid find_optimal_kink used before the exact search
+        assert result.ssr <= scan_ssr(x, y, taus=np.percentile(x, np.arange(20, 81, 5))) + 1e-8 * max(1.0, result.ssr)
+        assert residual_ssr(result, x, y) == pytest.approx(result.ssr, rel=1e-7, abs=1e-9)
+
+
+def test_breakpoint_between_trim_point_and_nearest_x():
+    # lo = 8.2 lies in the gap between x = 1 and x = 10; the exact fit kinks at 9
+    x = np.array([0, 1, 10, 11, 12, 13, 14, 15, 16, 17], dtype=float)
+    y = x + 5 * np.maximum(0, x - 9)
+    result = estimate_kink(x, y)
+    assert result.kink == pytest.approx(9)
+    assert result.ssr == pytest.approx(0, abs=1e-9)
+
+
+def test_breakpoint_between_last_x_and_upper_trim_point():
+    x = -np.array([0, 1, 10, 11, 12, 13, 14, 15, 16, 17], dtype=float)
+    y = x + 5 * np.maximum(0, x + 9)
+    result = estimate_kink(x, y)
+    assert result.kink == pytest.approx(-9)
+    assert result.ssr == pytest.approx(0, abs=1e-9)
+
+
+def test_min_side_is_respected():
+    x = np.arange(20, dtype=float)
+    y = np.maximum(0, x - 1)
+    result = estimate_kink(x, y, trim=0.0, min_side=5)
+    assert (x <= result.kink).sum() >= 5
+    assert result.ssr <= scan_ssr(x, y, trim=0.0, min_side=5) + 1e-9
+
+
+def test_bootstrap_kinks_stay_in_trimmed_range():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=300)
+    y = np.maximum(0, x) + rng.normal(0, 0.2, 300)
+    result = estimate_kink(x, y, n_boot=30, groups=rng.integers(0, 30, 300), seed=0)
+    lo, hi = np.quantile(x, [0.2, 0.8])
+    assert np.all((result.boot_kinks >= lo - 1e-12) & (result.boot_kinks <= hi + 1e-12))
+    assert result.ci[0] <= result.kink <= result.ci[1]
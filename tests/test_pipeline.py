@@ -0,0 +1,198 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import decomposition_layer_v2
+from bootstrap_engine import (ClusterDesign, HeckmanDesign, cluster_bootstrap, fit_probit_batch, pairs_weights,
+                              wild_weights)
+from columnar import MASTER_PATH, SUBTASK_PATH, read_dataset, table_dir
+from decomposition_layer_v2 import CHECKPOINT_PATH, decompose_projects
+from final_scientific_model_v2 import LOGIT_FORMULA, TRANSLOG_FORMULA, add_translog_terms, selection_imr
+from logit_engine import fit_logit_batch
+
+from conftest import N_TASKS, ONET_PATH, REPO_DIR, copy_workdir, run_stages, working_dir
+
+OUTPUTS = (MASTER_PATH, SUBTASK_PATH)
+PARTIAL_DIR = table_dir(SUBTASK_PATH) + '.partial'
+
+
+def _read(workdir, path):
+    with open(os.path.join(workdir, path), 'rb') as f:
+        return f.read()
+
+
+def _assert_same_outputs(workdir, expected):
+    for path in OUTPUTS:
+        assert _read(workdir, path) == _read(expected, path), path
+
+
+def test_parallel_run_matches_serial(corpus_dir, serial_run, tmp_path):
+    parallel = run_stages(copy_workdir(corpus_dir, tmp_path / 'work'), workers=2)
+    _assert_same_outputs(parallel, serial_run)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _interrupt_after(monkeypatch, n_projects):
+    # Simulates a crash right after the n-th project's checkpoint is saved
+    real = decomposition_layer_v2.save_checkpoint
+    saved = []
+
+    def save_checkpoint(state, *args, **kwargs):
+        real(state, *args, **kwargs)
+        saved.append(state)
+        if len(saved) == n_projects:
+            raise Interrupted
+
+    monkeypatch.setattr(decomposition_layer_v2, 'save_checkpoint', save_checkpoint)
+    return saved
+
+
+@pytest.fixture
+def interrupted(serial_run, tmp_path, monkeypatch):
+    """A copy of serial_run whose decomposition (cold cache) stopped after 3 of N_TASKS projects."""
+    workdir = copy_workdir(serial_run, tmp_path / 'work')
+    os.remove(workdir / 'data' / 'cache' / 'corpus_cache.sqlite')
+    with working_dir(workdir):
+        saved = _interrupt_after(monkeypatch, 3)
+        with pytest.raises(Interrupted):
+            decompose_projects(resume=False)
+    monkeypatch.undo()
+    assert os.path.exists(workdir / CHECKPOINT_PATH)
+    return workdir, saved[-1]
+
+
+def test_resume_truncates_rows_written_after_the_checkpoint(interrupted, serial_run, capsys):
+    workdir, state = interrupted
+    # Rows of the interrupted project's successor that reached disk before the crash
+    for name in os.listdir(workdir / PARTIAL_DIR):
+        with open(workdir / PARTIAL_DIR / name, 'ab') as f:
+            f.write(b'\xff' * 37)
+    with working_dir(workdir):
+        n_rows = decompose_projects(resume=True)
+    out = capsys.readouterr().out
+    assert f"Resuming after {state['last_task']}" in out
+    assert not os.path.exists(workdir / CHECKPOINT_PATH)
+    assert n_rows == len(read_dataset(os.path.join(serial_run, SUBTASK_PATH), ['included']))
+    _assert_same_outputs(workdir, serial_run)
+
+
+def test_resume_restarts_when_outputs_are_shorter_than_the_checkpoint(interrupted, serial_run, capsys):
+    workdir, _ = interrupted
+    name = max(os.listdir(workdir / PARTIAL_DIR), key=lambda n: os.path.getsize(workdir / PARTIAL_DIR / n))
+    os.truncate(workdir / PARTIAL_DIR / name, os.path.getsize(workdir / PARTIAL_DIR / name) // 2)
+    with working_dir(workdir):
+        decompose_projects(resume=True)
+    assert "Resuming after" not in capsys.readouterr().out
+    _assert_same_outputs(workdir, serial_run)
+
+
+def test_model_stage_writes_results(serial_run, tmp_path):
+    with working_dir(copy_workdir(serial_run, tmp_path / 'work')):
+        from final_scientific_model_v2 import run_hardened_analysis
+        run_hardened_analysis(n_iterations=50, seed=0, fresh=True, chunk_size=25)
+        with open('output/v2/hardened_results.txt') as f:
+            results = f.read()
+    assert 'TRANSLOG WAGE MODEL (BOOTSTRAP: pairs, B=50)' in results
+    assert 'c_log_e' in results and 'IMR' in results
+
+
+def test_benchmark_runs_every_stage(tmp_path):
+    from benchmark import compare, run_benchmark
+    from synthetic_corpus import CorpusSpec
+
+    os.makedirs(tmp_path / os.path.dirname(ONET_PATH))
+    with open(os.path.join(REPO_DIR, ONET_PATH), 'rb') as src, open(tmp_path / ONET_PATH, 'wb') as dst:
+        dst.write(src.read())
+    with working_dir(tmp_path):
+        result = run_benchmark(CorpusSpec(n_tasks=N_TASKS, seed=1), n_draws=20, n_boot=2)
+    json.dumps(result)
+    assert [n for n, e in result['stages'].items() if 'error' in e] == []
+    assert {'generate', 'master', 'decomposition', 'analysis', 'figures'} <= set(result['stages'])
+    assert result['corpus']['tasks'] == N_TASKS and result['corpus']['requirements'] > 0
+    assert compare(result, result) == []
+
+
+# Batched engines against statsmodels on the serial run's subtask data
+
+@pytest.fixture(scope='module')
+def model_data(serial_run):
+    df = read_dataset(os.path.join(serial_run, SUBTASK_PATH),
+                      ['project_id', 'e_hardened', 'k_hardened', 'success', 'ln_wage_eq',
+                       'automation_exposure', 'included'])
+    clean = df[df['included'] == 1].copy()
+    clean['IMR'] = selection_imr(df, clean, disp=0)[1]
+    add_translog_terms(clean)
+    return df, clean
+
+
+def test_cluster_design_matches_ols(model_data):
+    import statsmodels.formula.api as smf
+    _, clean = model_data
+    design = ClusterDesign(TRANSLOG_FORMULA, clean, 'project_id')
+    expected = smf.ols(TRANSLOG_FORMULA, data=clean).fit().params
+    np.testing.assert_allclose(design.beta, expected[design.columns], rtol=1e-8, atol=1e-10)
+
+
+def test_bootstrap_draws_match_refits(model_data):
+    import statsmodels.api as sm
+    _, clean = model_data
+    design = ClusterDesign(TRANSLOG_FORMULA, clean, 'project_id')
+    X, y, groups = design.data_arrays()
+
+    pairs = cluster_bootstrap(design, 5, method='pairs', seed=0)
+    W = pairs_weights(np.random.default_rng(0), 5, design.n_clusters)
+    for b in range(5):
+        expected = sm.WLS(y, X, weights=W[b][groups]).fit().params
+        np.testing.assert_allclose(pairs[b], expected, rtol=1e-6, atol=1e-8)
+
+    wild = cluster_bootstrap(design, 5, method='wild', seed=0)
+    V = wild_weights(np.random.default_rng(0), 5, design.n_clusters)
+    for b in range(5):
+        y_star = X @ design.beta + V[b][groups] * design.resid
+        np.testing.assert_allclose(wild[b], sm.OLS(y_star, X).fit().params, rtol=1e-6, atol=1e-8)
+
+
+def test_probit_batch_matches_statsmodels(model_data):
+    import statsmodels.api as sm
+    df, _ = model_data
+    Z = np.column_stack([np.ones(len(df)), df['automation_exposure'].to_numpy(dtype=float)])
+    d = df['included'].to_numpy(dtype=float)
+    counts = np.random.default_rng(0).integers(0, 3, len(d)).astype(float)
+    gamma, converged = fit_probit_batch(Z, d, np.vstack([np.ones(len(d)), counts]), np.zeros(2))
+    assert converged.all()
+    np.testing.assert_allclose(gamma[0], sm.Probit(d, Z).fit(disp=0).params, rtol=1e-6, atol=1e-8)
+    # Integer observation weights are repeated rows
+    rows = np.repeat(np.arange(len(d)), counts.astype(int))
+    np.testing.assert_allclose(gamma[1], sm.Probit(d[rows], Z[rows]).fit(disp=0).params, rtol=1e-6, atol=1e-8)
+
+
+def test_logit_batch_matches_statsmodels(model_data):
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+    _, clean = model_data
+    model = smf.logit(LOGIT_FORMULA, data=clean)
+    X, y = model.exog, model.endog
+    counts = np.random.default_rng(0).integers(0, 3, len(y)).astype(float)
+    fit = fit_logit_batch(X, np.vstack([y, y]), W=np.vstack([np.ones(len(y)), counts]))
+    assert fit.converged.all()
+    np.testing.assert_allclose(fit.beta[0], model.fit(disp=0).params, rtol=1e-6, atol=1e-8)
+    rows = np.repeat(np.arange(len(y)), counts.astype(int))
+    np.testing.assert_allclose(fit.beta[1], sm.Logit(y[rows], X[rows]).fit(disp=0).params, rtol=1e-6, atol=1e-8)
+
+
+def test_heckman_design_matches_two_step_fit(model_data):
+    import statsmodels.api as sm
+    import statsmodels.formula.api as smf
+    df, clean = model_data
+    design = HeckmanDesign(TRANSLOG_FORMULA, clean, df, 'included', ['automation_exposure'], 'project_id')
+    probit = sm.Probit(design.d, design.Z).fit(disp=0)
+    np.testing.assert_allclose(design.gamma, probit.params, rtol=1e-6, atol=1e-8)
+
+    beta = design.second_stage(np.ones((1, len(design.y))), clean['IMR'].to_numpy()[None, :])[0]
+    expected = smf.ols(TRANSLOG_FORMULA, data=clean).fit().params
+    np.testing.assert_allclose(beta, expected[design.columns], rtol=1e-8, atol=1e-10)
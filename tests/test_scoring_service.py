@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import scoring_service
+from scoring_service import MicroBatcher, Scorer, make_http_server, serve_jsonl
+
+from conftest import CORPUS_ROOT, working_dir
+
+
+@pytest.fixture
+def scorer(tmp_path):
+    # The corpus cache lives under the test's own working directory
+    with working_dir(tmp_path):
+        yield Scorer()
+
+
+def _task(corpus_dir, n):
+    return os.path.join(corpus_dir, CORPUS_ROOT, f'public_{n:03d}')
+
+
+def _request(corpus_dir, n, **extra):
+    task = _task(corpus_dir, n)
+    return {'id': f'task-{n}', 'brief_path': os.path.join(task, 'project', 'brief.md'),
+            'deliverables': [os.path.join(task, 'human_deliverable')], **extra}
+
+
+def test_scores_a_task_from_the_corpus(scorer, corpus_dir):
+    response = scorer.score_batch([_request(corpus_dir, 1)])[0]
+    assert 'error' not in response
+    assert response['id'] == 'task-1'
+    assert response['n_files'] == sum(len(files) for _, _, files in os.walk(
+        os.path.join(_task(corpus_dir, 1), 'human_deliverable')))
+    assert response['n_requirements'] == len(response['requirements']) > 0
+    assert response['instruction_entropy'] > 0
+
+
+@pytest.mark.parametrize('request_body, error', [
+    ("not an object", "TypeError"),
+    ({'brief': 5}, "TypeError"),
+    ({'brief_path': ['a.md']}, "TypeError"),
+    ({'brief': 'Build it.', 'deliverables': 'src/'}, "TypeError"),
+    ({'brief': 'Build it.', 'deliverables': [3]}, "TypeError"),
+    ({'brief': 'Build it.', 'files': 'main.py'}, "TypeError"),
+    ({'brief': 'Build it.', 'files': [{'name': 'main.py'}]}, "TypeError"),
+    ({'brief': 'Build it.', 'files': {'main.py': None}}, "TypeError"),
+    ({'brief': 'Build it.', 'automation_exposure': True}, "TypeError"),
+    ({'brief': 'Build it.', 'automation_exposure': 'high'}, "TypeError"),
+    ({'deliverables': []}, "ValueError"),
+    ({'brief': 'Build it.', 'deliverables': ['/does/not/exist']}, "FileNotFoundError"),
+])
+def test_malformed_request_gets_an_error(scorer, request_body, error):
+    response = scorer.score_batch([request_body])[0]
+    assert response['error'].startswith(error + ':')
+
+
+def test_mixed_batch_isolates_malformed_requests(scorer, corpus_dir):
+    good = [_request(corpus_dir, 1), _request(corpus_dir, 2, automation_exposure=0.3)]
+    alone = [scorer.score_batch([r])[0] for r in good]
+    batch = [{'id': 'bad-1', 'brief': 5}, good[0], "junk", {'id': 'bad-2', 'files': {'a.py': 'x'}}, good[1]]
+    responses = scorer.score_batch(batch)
+    assert [r.get('id') for r in responses] == ['bad-1', 'task-1', None, 'bad-2', 'task-2']
+    assert ['error' in r for r in responses] == [True, False, True, True, False]
+    assert [responses[1], responses[4]] == alone
+
+
+def test_failing_feature_extraction_is_isolated(scorer, corpus_dir, monkeypatch):
+    real = scoring_service.requirement_metrics
+
+    def requirement_metrics(requirements, *args, **kwargs):
+        if any('explode' in r for r in requirements):
+            raise RuntimeError("feature extraction failed")
+        return real(requirements, *args, **kwargs)
+
+    monkeypatch.setattr(scoring_service, 'requirement_metrics', requirement_metrics)
+    brief = "## Deliverables\n\n1. Please explode the render pipeline into modules.\n"
+    responses = scorer.score_batch([
+        _request(corpus_dir, 1),
+        {'id': 'boom', 'brief': brief, 'files': {'main.py': 'render = 1'}},
+        _request(corpus_dir, 2),
+    ])
+    assert responses[1] == {'id': 'boom', 'error': "RuntimeError: feature extraction failed"}
+    assert 'error' not in responses[0] and 'error' not in responses[2]
+    assert responses[0]['requirements'] and responses[2]['requirements']
+
+
+def test_inline_files_match_files_on_disk(scorer, corpus_dir):
+    deliverable_dir = os.path.join(_task(corpus_dir, 3), 'human_deliverable')
+    files = {}
+    for root, _, names in os.walk(deliverable_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if b'\0' not in data[:1024]:
+                files[os.path.relpath(path, deliverable_dir)] = data.decode('utf-8')
+    brief = os.path.join(_task(corpus_dir, 3), 'project', 'brief.md')
+    listed = [{'name': name, 'text': text} for name, text in files.items()]
+    as_dict, as_list = scorer.score_batch([{'brief_path': brief, 'files': files},
+                                           {'brief_path': brief, 'files': listed}])
+    assert as_dict == as_list
+
+
+def test_jsonl_keeps_order_and_reports_bad_lines(scorer, corpus_dir):
+    batcher = MicroBatcher(scorer.score_batch)
+    lines = [json.dumps(_request(corpus_dir, 1)), '{not json', '',
+             json.dumps([_request(corpus_dir, 2), {'id': 'bad', 'brief': 1}])]
+    out = io.StringIO()
+    try:
+        serve_jsonl(batcher, io.StringIO('\n'.join(lines) + '\n'), out)
+    finally:
+        batcher.close()
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(results) == 3
+    assert results[0]['id'] == 'task-1' and 'error' not in results[0]
+    assert results[1]['error'].startswith('JSONDecodeError:')
+    assert [r['id'] for r in results[2]] == ['task-2', 'bad']
+    assert 'error' in results[2][1] and 'error' not in results[2][0]
+
+
+def test_batcher_answers_every_request_when_a_batch_fails():
+    def score_batch(requests):
+        raise RuntimeError("scorer crashed")
+
+    batcher = MicroBatcher(score_batch)
+    try:
+        futures = [batcher.submit({'id': i}) for i in range(3)]
+        assert [f.result(timeout=10) for f in futures] == [{'error': "RuntimeError: scorer crashed"}] * 3
+    finally:
+        batcher.close()
+
+
+def test_http_front_end(scorer, corpus_dir):
+    batcher = MicroBatcher(scorer.score_batch)
+    server = make_http_server(scorer, batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    def post(path, body):
+        request = urllib.request.Request(base + path, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as r:
+                return r.status, json.load(r)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    try:
+        status, body = post('/score', json.dumps(_request(corpus_dir, 1)).encode())
+        assert status == 200 and body['id'] == 'task-1' and 'error' not in body
+        status, body = post('/score', json.dumps([{'brief': 1}, {'id': 'x', 'brief': 'Build it.'}]).encode())
+        assert status == 200 and 'error' in body[0] and body[1]['id'] == 'x'
+        status, body = post('/score', b'{not json')
+        assert status == 400 and body['error'].startswith('JSONDecodeError:')
+        status, _ = post('/elsewhere', b'{}')
+        assert status == 404
+        with urllib.request.urlopen(base + '/health', timeout=30) as r:
+            health = json.load(r)
+        assert health['status'] == 'ok' and health['model'] is False and health['requests'] >= 3
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+
+def test_predictions_match_the_fitted_formulas(serial_run, tmp_path):
+    import statsmodels.formula.api as smf
+    from columnar import SUBTASK_PATH, read_dataset
+    from final_scientific_model_v2 import TRANSLOG_FORMULA, LOGIT_FORMULA, selection_imr, add_translog_terms
+
+    path = os.path.join(serial_run, SUBTASK_PATH)
+    model = scoring_service.fit_scoring_model(path)
+    df = read_dataset(path, ['e_hardened', 'k_hardened', 'success', 'ln_wage_eq', 'automation_exposure',
+                             'included'])
+    clean = df[df['included'] == 1].copy()
+    clean['IMR'] = selection_imr(df, clean, disp=0)[1]
+    add_translog_terms(clean)
+    expected = smf.ols(TRANSLOG_FORMULA, data=clean).fit().predict(clean)
+
+    ln_wage, success = scoring_service.predict(model, clean['e_hardened'], clean['k_hardened'],
+                                               clean['automation_exposure'])
+    np.testing.assert_allclose(ln_wage, expected, rtol=1e-8, atol=1e-10)
+    expected = smf.logit(LOGIT_FORMULA, data=clean).fit(disp=0).predict(clean)
+    np.testing.assert_allclose(success, expected, rtol=1e-6, atol=1e-9)
+
+    with working_dir(tmp_path):
+        response = Scorer(model).score_batch([_request(serial_run, 1)])[0]
+    included = [r for r in response['requirements'] if r['included']]
+    assert included and all(r['predicted_wage'] is not None for r in included)
+    assert response['predicted_wage'] == pytest.approx(np.exp(np.mean([r['predicted_ln_wage'] for r in included])))